@@ -0,0 +1,451 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import uuid
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pypdf import PdfReader
+
+from hierarchy import FLAT_PROMPT, PART_KEYS, flatten_document
+
+DEFAULT_DOCUMENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "documents")
+
+# Rough output token count, used for usageMetadata and the simulated generation speed
+CHARS_PER_TOKEN = 4
+# Same per-page input token cost the backend's rate limiter assumes
+TOKENS_PER_PDF_PAGE = 258
+# Leading characters of a clause's text used to find the page it starts on
+CLAUSE_KEY_CHARS = 25
+
+
+class Recording:
+    """A sample PDF and its recorded parse result from documents/results"""
+
+    def __init__(self, name: str, pdf_path: str, document: dict):
+        self.name = name
+        self.pdf_path = pdf_path
+        self.document = document
+        with open(pdf_path, "rb") as f:
+            content = f.read()
+        self.size = len(content)
+        self.sha256 = hashlib.sha256(content).hexdigest()
+        pages = PdfReader(io.BytesIO(content)).pages
+        self.page_count = len(pages)
+        # Content-stream digest -> 0-based page number
+        self.page_digests = {_page_digest(page): number for number, page in enumerate(pages)}
+        self._clause_pages: Optional[Dict[int, int]] = None
+
+    def clause_pages(self) -> Dict[int, int]:
+        """
+        id() of each clause -> 0-based page it starts on
+
+        Found by searching the page text, in reading order, for the start of each clause's
+        text; a clause that cannot be found is put on the page of the one before it.
+        Computed on first use, since text extraction takes a moment on long PDFs.
+        """
+        if self._clause_pages is None:
+            offsets = []
+            text = ""
+            for page in PdfReader(self.pdf_path).pages:
+                offsets.append(len(text))
+                text += _normalize_text(page.extract_text()) + " "
+
+            pages = {}
+            cursor = 0
+
+            def walk(items):
+                nonlocal cursor
+                for item in items or []:
+                    key = _normalize_text(item.get("text"))[:CLAUSE_KEY_CHARS]
+                    position = text.find(key, cursor) if key else -1
+                    if position >= 0:
+                        cursor = position
+                    pages[id(item)] = max(number for number, offset in enumerate(offsets) if offset <= cursor)
+                    walk(item.get("children"))
+
+            for part_key in PART_KEYS:
+                walk((self.document.get(part_key) or {}).get("partItems"))
+            self._clause_pages = pages
+        return self._clause_pages
+
+    def chunk_document(self, first_page: int, last_page: int, repeat_parents: bool = True) -> dict:
+        """
+        The recorded document as a model would return it for pages first_page-last_page
+
+        Keeps the clauses that start on those pages. A clause that started earlier but has
+        children on these pages is repeated as their parent, as CHUNK_PROMPT asks, or with
+        repeat_parents=False left out so its children arrive as orphans at the top level.
+        Section and name are only returned for the chunk holding the first page.
+        """
+        pages = self.clause_pages()
+
+        def keep(items):
+            kept = []
+            for item in items or []:
+                children = keep(item.get("children"))
+                if first_page <= pages[id(item)] <= last_page:
+                    kept.append({**item, "children": children if item.get("children") is not None else None})
+                elif children and pages[id(item)] < first_page:
+                    if repeat_parents:
+                        kept.append({**item, "children": children})
+                    else:
+                        kept.extend(children)
+            return kept
+
+        has_heading = first_page == 0
+        document = {
+            "section": self.document.get("section", "") if has_heading else "",
+            "name": self.document.get("name", "") if has_heading else "",
+        }
+        for part_key in PART_KEYS:
+            document[part_key] = {"partItems": keep((self.document.get(part_key) or {}).get("partItems"))}
+        return document
+
+
+def _normalize_text(text: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def _page_digest(page) -> str:
+    """SHA-256 of a page's content stream, which survives pypdf copying the page into a chunk"""
+    contents = page.get_contents()
+    return hashlib.sha256(contents.get_data() if contents is not None else b"").hexdigest()
+
+
+def load_recordings(documents_dir: str = DEFAULT_DOCUMENTS_DIR) -> List[Recording]:
+    """Pair each documents/results/<name>.json with documents/<name>.pdf"""
+    results_dir = os.path.join(documents_dir, "results")
+    recordings = []
+    for filename in sorted(os.listdir(results_dir)):
+        if not filename.endswith(".json"):
+            continue
+        name = filename[:-len(".json")]
+        pdf_path = os.path.join(documents_dir, f"{name}.pdf")
+        if not os.path.exists(pdf_path):
+            continue
+        with open(os.path.join(results_dir, filename), "r", encoding="utf-8") as f:
+            recordings.append(Recording(name, pdf_path, json.load(f)))
+    return recordings
+
+
+class MockConfig:
+    """Latency, failure injection and output pacing for the mock server"""
+
+    def __init__(
+        self,
+        documents_dir: str = DEFAULT_DOCUMENTS_DIR,
+        latency_seconds: float = 0.5,
+        latency_jitter: float = 0.0,
+        tokens_per_second: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_delay_seconds: float = 1.0,
+        stream_piece_chars: int = 400,
+        chunk_parents: bool = True,
+        seed: Optional[int] = None,
+    ):
+        self.documents_dir = documents_dir
+        self.latency_seconds = latency_seconds
+        self.latency_jitter = latency_jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_delay_seconds = retry_delay_seconds
+        self.stream_piece_chars = max(1, stream_piece_chars)
+        self.chunk_parents = chunk_parents
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls) -> "MockConfig":
+        """Create a config from MOCK_GEMINI_* environment variables"""
+        seed = os.getenv("MOCK_GEMINI_SEED")
+        return cls(
+            documents_dir=os.getenv("MOCK_GEMINI_DOCUMENTS_DIR", DEFAULT_DOCUMENTS_DIR),
+            latency_seconds=float(os.getenv("MOCK_GEMINI_LATENCY_SECONDS", "0.5")),
+            latency_jitter=float(os.getenv("MOCK_GEMINI_LATENCY_JITTER", "0")),
+            tokens_per_second=float(os.getenv("MOCK_GEMINI_TOKENS_PER_SECOND", "0")),
+            error_rate=float(os.getenv("MOCK_GEMINI_ERROR_RATE", "0")),
+            throttle_rate=float(os.getenv("MOCK_GEMINI_THROTTLE_RATE", "0")),
+            retry_delay_seconds=float(os.getenv("MOCK_GEMINI_RETRY_DELAY_SECONDS", "1")),
+            stream_piece_chars=int(os.getenv("MOCK_GEMINI_STREAM_PIECE_CHARS", "400")),
+            chunk_parents=os.getenv("MOCK_GEMINI_CHUNK_PARENTS", "1") == "1",
+            seed=int(seed) if seed else None,
+        )
+
+    def to_env(self) -> Dict[str, str]:
+        env = {
+            "MOCK_GEMINI_DOCUMENTS_DIR": self.documents_dir,
+            "MOCK_GEMINI_LATENCY_SECONDS": str(self.latency_seconds),
+            "MOCK_GEMINI_LATENCY_JITTER": str(self.latency_jitter),
+            "MOCK_GEMINI_TOKENS_PER_SECOND": str(self.tokens_per_second),
+            "MOCK_GEMINI_ERROR_RATE": str(self.error_rate),
+            "MOCK_GEMINI_THROTTLE_RATE": str(self.throttle_rate),
+            "MOCK_GEMINI_RETRY_DELAY_SECONDS": str(self.retry_delay_seconds),
+            "MOCK_GEMINI_STREAM_PIECE_CHARS": str(self.stream_piece_chars),
+            "MOCK_GEMINI_CHUNK_PARENTS": "1" if self.chunk_parents else "0",
+        }
+        if self.seed is not None:
+            env["MOCK_GEMINI_SEED"] = str(self.seed)
+        return env
+
+
+def _error(status: int, status_name: str, message: str, details: Optional[list] = None) -> JSONResponse:
+    error = {"code": status, "message": message, "status": status_name}
+    if details:
+        error["details"] = details
+    return JSONResponse(status_code=status, content={"error": error})
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    """
+    A stand-in for the generativelanguage API that replays recorded parse results
+
+    Serves generateContent, streamGenerateContent (alt=sse) and the Files API upload,
+    get and delete calls the backend makes. The PDF in a request is matched to a
+    recording by its SHA-256, or, for page ranges cut by chunked parsing, by the content
+    streams of its pages. Chunk requests get only the clauses that start on their pages,
+    under repeated parents (see Recording.chunk_document), so the backend has to stitch
+    articles split across chunks and drop the overlap. Prompts asking for the flat line
+    format get the recording rendered with flatten_document().
+
+    GET /_mock/stats reports request counts and bytes in both directions; POST
+    /_mock/reset clears them.
+    """
+    app = FastAPI(title="Mock Gemini API")
+    recordings = load_recordings(config.documents_dir)
+    by_sha256 = {recording.sha256: recording for recording in recordings}
+    rng = random.Random(config.seed)
+    files: Dict[str, bytes] = {}
+    uploads: Dict[str, dict] = {}
+
+    def new_stats() -> dict:
+        return {
+            "requests": {},
+            "responses": {},
+            "bytes_received": 0,
+            "bytes_sent": 0,
+            "unmatched": 0,
+        }
+
+    state = {"stats": new_stats()}
+
+    def count(method: str, status: int, received: int, sent: int):
+        stats = state["stats"]
+        stats["requests"][method] = stats["requests"].get(method, 0) + 1
+        stats["responses"][str(status)] = stats["responses"].get(str(status), 0) + 1
+        stats["bytes_received"] += received
+        stats["bytes_sent"] += sent
+
+    def find_recording(content: bytes):
+        """
+        (recording, (first page, last page) of a chunk or None for the whole PDF), or None
+        """
+        recording = by_sha256.get(hashlib.sha256(content).hexdigest())
+        if recording is not None:
+            return recording, None
+        try:
+            digests = [_page_digest(page) for page in PdfReader(io.BytesIO(content)).pages]
+        except Exception:
+            return None
+        for recording in recordings:
+            pages = [recording.page_digests[digest] for digest in digests if digest in recording.page_digests]
+            if digests and len(pages) == len(digests):
+                # Compute clause pages off the event loop the first time
+                recording.clause_pages()
+                return recording, (min(pages), max(pages))
+        return None
+
+    def model_text(recording: Recording, prompt: str, pages) -> str:
+        document = recording.document
+        if pages is not None:
+            document = recording.chunk_document(pages[0], pages[1], config.chunk_parents)
+        if prompt.startswith(FLAT_PROMPT[:80]):
+            return flatten_document(document)
+        # Models usually fence and indent their JSON
+        return "```json\n" + json.dumps(document, indent=2, ensure_ascii=False) + "\n```"
+
+    def usage(recording: Recording, prompt: str, text: str, pages) -> dict:
+        page_count = recording.page_count if pages is None else pages[1] - pages[0] + 1
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN + page_count * TOKENS_PER_PDF_PAGE
+        output_tokens = len(text) // CHARS_PER_TOKEN
+        return {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        }
+
+    def generation_seconds(text: str) -> float:
+        if config.tokens_per_second <= 0:
+            return 0.0
+        return len(text) / CHARS_PER_TOKEN / config.tokens_per_second
+
+    def injected_failure() -> Optional[JSONResponse]:
+        roll = rng.random()
+        if roll < config.throttle_rate:
+            return _error(
+                429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (mock)",
+                [{
+                    "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                    "retryDelay": f"{config.retry_delay_seconds:g}s",
+                }],
+            )
+        if roll < config.throttle_rate + config.error_rate:
+            return _error(500, "INTERNAL", "An internal error has occurred (mock)")
+        return None
+
+    async def first_byte_delay():
+        delay = config.latency_seconds + rng.uniform(0, config.latency_jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def read_request(body: dict):
+        """(prompt, PDF bytes or None) from a generateContent request body"""
+        prompt = ""
+        content = None
+        for part in body.get("contents", [{}])[0].get("parts", []):
+            if "text" in part:
+                prompt += part["text"]
+            elif "inlineData" in part:
+                content = base64.b64decode(part["inlineData"]["data"])
+            elif "fileData" in part:
+                content = files.get(part["fileData"]["fileUri"].rsplit("/", 1)[-1])
+        return prompt, content
+
+    @app.post("/v1beta/models/{target}")
+    async def generate(target: str, request: Request):
+        raw = await request.body()
+        model, _, method = target.partition(":")
+        streaming = method == "streamGenerateContent"
+
+        async def respond(response: Response) -> Response:
+            count(method, response.status_code, len(raw), len(response.body))
+            return response
+
+        if method not in ("generateContent", "streamGenerateContent"):
+            return await respond(_error(404, "NOT_FOUND", f"Unknown method {method}"))
+
+        await first_byte_delay()
+        failure = injected_failure()
+        if failure is not None:
+            return await respond(failure)
+
+        try:
+            prompt, content = read_request(json.loads(raw))
+        except (ValueError, KeyError, IndexError) as e:
+            return await respond(_error(400, "INVALID_ARGUMENT", f"Malformed request: {e}"))
+        match = await asyncio.to_thread(find_recording, content) if content else None
+        if match is None:
+            state["stats"]["unmatched"] += 1
+            return await respond(_error(400, "INVALID_ARGUMENT", "No recording matches this PDF (mock)"))
+        recording, pages = match
+
+        text = model_text(recording, prompt, pages)
+        usage_metadata = usage(recording, prompt, text, pages)
+
+        if not streaming:
+            await asyncio.sleep(generation_seconds(text))
+            return await respond(JSONResponse(content={
+                "candidates": [{
+                    "content": {"parts": [{"text": text}], "role": "model"},
+                    "finishReason": "STOP",
+                    "index": 0,
+                }],
+                "usageMetadata": usage_metadata,
+                "modelVersion": model,
+            }))
+
+        pieces = [text[i:i + config.stream_piece_chars] for i in range(0, len(text), config.stream_piece_chars)]
+
+        async def events():
+            sent = 0
+            try:
+                for position, piece in enumerate(pieces):
+                    await asyncio.sleep(generation_seconds(piece))
+                    candidate = {"content": {"parts": [{"text": piece}], "role": "model"}, "index": 0}
+                    event = {"candidates": [candidate], "modelVersion": model}
+                    if position == len(pieces) - 1:
+                        candidate["finishReason"] = "STOP"
+                        event["usageMetadata"] = usage_metadata
+                    data = f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode()
+                    sent += len(data)
+                    yield data
+            finally:
+                count(method, 200, len(raw), sent)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/upload/v1beta/files")
+    async def upload_file(request: Request):
+        raw = await request.body()
+        command = request.headers.get("x-goog-upload-command", "")
+        upload_id = request.query_params.get("upload_id")
+
+        if upload_id is None:
+            if command != "start":
+                response = _error(400, "INVALID_ARGUMENT", "Only resumable uploads are supported (mock)")
+            else:
+                upload_id = uuid.uuid4().hex
+                uploads[upload_id] = json.loads(raw or b"{}").get("file", {})
+                response = Response(headers={
+                    "x-goog-upload-url": f"{str(request.base_url).rstrip('/')}/upload/v1beta/files?upload_id={upload_id}",
+                    "x-goog-upload-status": "active",
+                })
+        elif upload_id not in uploads:
+            response = _error(404, "NOT_FOUND", "Unknown upload (mock)")
+        else:
+            metadata = uploads.pop(upload_id)
+            file_id = upload_id[:12]
+            files[file_id] = raw
+            response = JSONResponse(content={"file": {
+                "name": f"files/{file_id}",
+                "displayName": metadata.get("display_name", ""),
+                "mimeType": "application/pdf",
+                "sizeBytes": str(len(raw)),
+                "uri": f"{str(request.base_url).rstrip('/')}/v1beta/files/{file_id}",
+                "state": "ACTIVE",
+            }})
+        count("upload", response.status_code, len(raw), len(response.body))
+        return response
+
+    @app.get("/v1beta/files/{file_id}")
+    async def get_file(file_id: str, request: Request):
+        if file_id not in files:
+            return _error(404, "NOT_FOUND", "Unknown file (mock)")
+        return {
+            "name": f"files/{file_id}",
+            "uri": f"{str(request.base_url).rstrip('/')}/v1beta/files/{file_id}",
+            "state": "ACTIVE",
+        }
+
+    @app.delete("/v1beta/files/{file_id}")
+    async def delete_file(file_id: str):
+        files.pop(file_id, None)
+        count("delete", 200, 0, 0)
+        return {}
+
+    @app.get("/_mock/stats")
+    async def mock_stats():
+        return {**state["stats"], "stored_files": len(files)}
+
+    @app.post("/_mock/reset")
+    async def mock_reset():
+        state["stats"] = new_stats()
+        return {"status": "ok"}
+
+    @app.get("/")
+    async def root():
+        return {"message": "Mock Gemini API", "recordings": [recording.name for recording in recordings]}
+
+    return app
+
+
+def app_from_env() -> FastAPI:
+    """App factory for uvicorn --factory bench.mock_gemini:app_from_env"""
+    return create_app(MockConfig.from_env())
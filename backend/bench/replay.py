@@ -0,0 +1,372 @@
+"""
+Replay benchmark for the backend against a local mock Gemini server
+
+Starts bench.mock_gemini and the backend (main:app) as uvicorn subprocesses, drives
+/upload (or /upload/stream) with the sample PDFs at a fixed concurrency, and reports
+latency percentiles, throughput, the backend's peak RSS, upstream traffic, and whether
+each output still matches its recorded reference. No network access is needed.
+
+Run from the backend directory:
+
+    python -m bench.replay --concurrency 4 --rounds 3
+    python -m bench.replay --chunked --throttle-rate 0.1 --error-rate 0.05
+    python -m bench.replay --endpoint stream --tokens-per-second 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import httpx
+
+from bench.mock_gemini import DEFAULT_DOCUMENTS_DIR, MockConfig, Recording, load_recordings
+from hierarchy import PART_KEYS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT_SECONDS = 30
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile, or None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, int(fraction * len(ordered) + 0.999999)))
+    return ordered[rank - 1]
+
+
+def compare_documents(actual, expected: dict) -> Optional[str]:
+    """
+    Structurally compare a parsed document with its reference
+
+    Clause indexes and text are compared with surrounding whitespace stripped, and null
+    and empty children are treated as equal.
+
+    Returns:
+        None when they match, otherwise a description of the first difference
+    """
+    if not isinstance(actual, dict):
+        return f"document is {type(actual).__name__}, not an object"
+    for key in ("section", "name"):
+        if (actual.get(key) or "").strip() != (expected.get(key) or "").strip():
+            return f"{key}: {actual.get(key)!r} != {expected.get(key)!r}"
+    for part_key in PART_KEYS:
+        difference = _compare_items(
+            (actual.get(part_key) or {}).get("partItems") or [],
+            (expected.get(part_key) or {}).get("partItems") or [],
+            f"{part_key}.partItems",
+        )
+        if difference:
+            return difference
+    return None
+
+
+def _compare_items(actual: list, expected: list, path: str) -> Optional[str]:
+    for position, (item, reference) in enumerate(zip(actual, expected)):
+        item_path = f"{path}[{position}]"
+        if (item.get("index") or "").strip() != (reference.get("index") or "").strip():
+            return f"{item_path}.index: {item.get('index')!r} != {reference.get('index')!r}"
+        if (item.get("text") or "").strip() != (reference.get("text") or "").strip():
+            return f"{item_path}.text differs (clause {reference.get('index')})"
+        difference = _compare_items(item.get("children") or [], reference.get("children") or [], f"{item_path}.children")
+        if difference:
+            return difference
+    if len(actual) != len(expected):
+        return f"{path}: {len(actual)} clauses, expected {len(expected)}"
+    return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _memory_bytes(pid: int, field: str) -> Optional[int]:
+    """VmRSS or VmHWM (peak RSS) from /proc/<pid>/status, or None where /proc is unavailable"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _start_server(app: str, port: int, env: dict, log_path: str, factory: bool = False) -> subprocess.Popen:
+    command = [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    if factory:
+        command.append("--factory")
+    log = open(log_path, "wb")
+    try:
+        return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        log.close()
+
+
+async def _wait_ready(client: httpx.AsyncClient, url: str, process: subprocess.Popen, log_path: str):
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    with open(log_path, "r", errors="replace") as f:
+        tail = f.read()[-2000:]
+    raise RuntimeError(f"{url} did not start (see {log_path}):\n{tail}")
+
+
+def _stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+async def _send(client: httpx.AsyncClient, args, recording: Recording) -> dict:
+    """Upload one PDF and check the output against its recording"""
+    form = {
+        "model": args.model,
+        "cache": args.cache,
+    }
+    if args.endpoint == "upload":
+        form.update({
+            "chunked": str(args.chunked).lower(),
+            "max_chunk_pages": str(args.max_chunk_pages),
+            "output_format": args.output_format,
+        })
+    else:
+        form["format"] = "ndjson"
+
+    with open(recording.pdf_path, "rb") as f:
+        content = f.read()
+    files = {"pdf": (os.path.basename(recording.pdf_path), content, "application/pdf")}
+    path = "/upload" if args.endpoint == "upload" else "/upload/stream"
+
+    result = {"name": recording.name, "status": None, "cache": None, "first_item_seconds": None, "difference": None}
+    started = time.perf_counter()
+    try:
+        if args.endpoint == "upload":
+            response = await client.post(path, data=form, files=files)
+            result["status"] = response.status_code
+            result["cache"] = response.headers.get("x-cache")
+            body = response.json()
+            document = body.get("data")
+            if isinstance(document, str):
+                try:
+                    document = json.loads(document)
+                except ValueError:
+                    pass
+            if response.status_code != 200:
+                result["difference"] = body.get("error", "request failed")
+        else:
+            document = None
+            async with client.stream("POST", path, data=form, files=files) as response:
+                result["status"] = response.status_code
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["event"] == "item" and result["first_item_seconds"] is None:
+                        result["first_item_seconds"] = time.perf_counter() - started
+                    elif event["event"] == "done":
+                        document = event.get("document")
+                        result["cache"] = event.get("cache")
+                    elif event["event"] == "error":
+                        result["difference"] = event["error"]
+        if result["difference"] is None:
+            result["difference"] = compare_documents(document, recording.document)
+    except (httpx.HTTPError, ValueError) as e:
+        result["difference"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+async def run(args) -> dict:
+    """Start both servers, run the load and collect the report"""
+    recordings = load_recordings(args.documents_dir)
+    if args.only:
+        recordings = [recording for recording in recordings if any(name.lower() in recording.name.lower() for name in args.only)]
+    if not recordings:
+        raise RuntimeError(f"No recordings found in {args.documents_dir}")
+
+    workdir = tempfile.mkdtemp(prefix="pdf-parser-bench-")
+    mock_port = _free_port()
+    backend_port = _free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    backend_url = f"http://127.0.0.1:{backend_port}"
+
+    mock_config = MockConfig(
+        documents_dir=os.path.abspath(args.documents_dir),
+        latency_seconds=args.latency,
+        latency_jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_delay_seconds=args.retry_delay,
+        chunk_parents=not args.chunk_orphans,
+        seed=args.seed,
+    )
+    mock_env = {**os.environ, **mock_config.to_env()}
+    backend_env = {
+        **os.environ,
+        "GEMINI_BASE_URL": mock_url,
+        "GEMINI_API_KEY": "bench",
+        "RESULT_CACHE_DIR": os.path.join(workdir, "cache"),
+        "JOBS_DIR": os.path.join(workdir, "jobs"),
+        "SPECS_DIR": os.path.join(workdir, "specs"),
+    }
+    # Keep retries quick unless the caller asked otherwise
+    backend_env.setdefault("GEMINI_BACKOFF_BASE", "0.2")
+
+    mock_log = os.path.join(workdir, "mock.log")
+    backend_log = os.path.join(workdir, "backend.log")
+    mock = _start_server("bench.mock_gemini:app_from_env", mock_port, mock_env, mock_log, factory=True)
+    backend = _start_server("main:app", backend_port, backend_env, backend_log)
+    try:
+        timeout = httpx.Timeout(args.timeout, connect=10.0)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=backend_url, timeout=timeout, limits=limits) as client:
+            await _wait_ready(client, f"{mock_url}/", mock, mock_log)
+            await _wait_ready(client, f"{backend_url}/", backend, backend_log)
+            rss_before = _memory_bytes(backend.pid, "VmRSS")
+
+            work = [recording for _ in range(args.rounds) for recording in recordings]
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def worker(recording: Recording) -> dict:
+                async with semaphore:
+                    return await _send(client, args, recording)
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(worker(recording) for recording in work))
+            wall_seconds = time.perf_counter() - started
+
+            peak_rss = _memory_bytes(backend.pid, "VmHWM")
+            upstream = (await client.get(f"{mock_url}/_mock/stats")).json()
+    finally:
+        _stop(backend)
+        _stop(mock)
+
+    latencies = [result["seconds"] for result in results if result["status"] == 200]
+    first_items = [result["first_item_seconds"] for result in results if result["first_item_seconds"] is not None]
+    statuses, cache_statuses = {}, {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+        if result["cache"]:
+            cache_statuses[result["cache"]] = cache_statuses.get(result["cache"], 0) + 1
+
+    return {
+        "settings": {
+            "endpoint": args.endpoint,
+            "model": args.model,
+            "cache": args.cache,
+            "chunked": args.chunked,
+            "output_format": args.output_format,
+            "concurrency": args.concurrency,
+            "requests": len(work),
+            "mock": {key: value for key, value in vars(mock_config).items() if key != "documents_dir"},
+        },
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(work) / wall_seconds, 3) if wall_seconds else None,
+        "latency_seconds": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies) if latencies else None,
+        },
+        "first_item_seconds": {
+            "p50": percentile(first_items, 0.50),
+            "p95": percentile(first_items, 0.95),
+        } if first_items else None,
+        "statuses": statuses,
+        "cache": cache_statuses,
+        "backend_rss_bytes": {"start": rss_before, "peak": peak_rss},
+        "upstream": upstream,
+        "matches": sum(1 for result in results if result["difference"] is None),
+        "mismatches": sorted({(result["name"], result["difference"]) for result in results if result["difference"]}),
+        "logs": {"backend": backend_log, "mock": mock_log},
+    }
+
+
+def _seconds(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value:.3f}s"
+
+
+def _megabytes(value: Optional[int]) -> str:
+    return "n/a" if value is None else f"{value / (1024 * 1024):.1f} MB"
+
+
+def print_report(report: dict):
+    settings = report["settings"]
+    latency = report["latency_seconds"]
+    upstream = report["upstream"]
+    mode = "stream" if settings["endpoint"] == "stream" else settings["output_format"] + (", chunked" if settings["chunked"] else "")
+    print(f"Replay: {settings['requests']} requests to /{'upload' if settings['endpoint'] == 'upload' else 'upload/stream'} "
+          f"({mode}, cache={settings['cache']}, {settings['model']}) at concurrency {settings['concurrency']}")
+    print(f"  latency     p50 {_seconds(latency['p50'])}  p95 {_seconds(latency['p95'])}  "
+          f"p99 {_seconds(latency['p99'])}  max {_seconds(latency['max'])}")
+    if report["first_item_seconds"]:
+        print(f"  first item  p50 {_seconds(report['first_item_seconds']['p50'])}  p95 {_seconds(report['first_item_seconds']['p95'])}")
+    print(f"  throughput  {report['throughput_rps']} req/s over {report['wall_seconds']}s")
+    print(f"  statuses    {report['statuses']}  cache {report['cache'] or 'n/a'}")
+    rss = report["backend_rss_bytes"]
+    print(f"  backend RSS start {_megabytes(rss['start'])}  peak {_megabytes(rss['peak'])}")
+    print(f"  upstream    {sum(upstream['requests'].values())} requests {upstream['requests']}  "
+          f"responses {upstream['responses']}")
+    print(f"              sent {_megabytes(upstream['bytes_received'])}  received {_megabytes(upstream['bytes_sent'])}")
+    print(f"  outputs     {report['matches']}/{settings['requests']} match their references")
+    for name, difference in report["mismatches"]:
+        print(f"    {name}: {difference}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay the sample PDFs against a mock Gemini server")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once")
+    parser.add_argument("--rounds", type=int, default=3, help="Times each sample PDF is sent")
+    parser.add_argument("--only", nargs="*", help="Only send samples whose name contains one of these")
+    parser.add_argument("--endpoint", choices=("upload", "stream"), default="upload")
+    parser.add_argument("--model", default="gemini-2.5-flash")
+    parser.add_argument("--cache", choices=("use", "bypass", "refresh"), default="bypass",
+                        help="Backend cache mode; bypass (default) sends every request upstream")
+    parser.add_argument("--chunked", action="store_true", help="Use page-chunked parsing")
+    parser.add_argument("--max-chunk-pages", type=int, default=8)
+    parser.add_argument("--chunk-orphans", action="store_true",
+                        help="Mock leaves out repeated parents, so chunks start with orphaned clauses")
+    parser.add_argument("--output-format", choices=("json", "flat"), default="json")
+    parser.add_argument("--latency", type=float, default=0.5, help="Mock time to first byte, in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency of up to this many seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Mock output speed; 0 returns output at once")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock calls that return 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of mock calls that return 429")
+    parser.add_argument("--retry-delay", type=float, default=1.0, help="retryDelay the mock sends with 429s, in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for injected latency and failures")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Per-request client timeout, in seconds")
+    parser.add_argument("--documents-dir", default=DEFAULT_DOCUMENTS_DIR)
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["matches"] == report["settings"]["requests"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,395 @@
+import asyncio
+import copy
+import io
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from pypdf import PdfReader, PdfWriter
+
+from gemini_parser import parse_pdf_with_gemini, GeminiModel, PARSE_PROMPT
+from hierarchy import empty_document, index_style, INDEX_STYLES, PART_KEYS
+import fast_json
+import metrics
+from uploads import PdfFile
+
+DEFAULT_MAX_CHUNK_PAGES = 8
+DEFAULT_CHUNK_OVERLAP_PAGES = 1
+DEFAULT_CHUNK_CONCURRENCY = 4
+
+# Appended to PARSE_PROMPT for each chunk; also part of the result cache key
+CHUNK_PROMPT = '''
+---
+
+📄 This PDF is pages {first_page}-{last_page} of a longer specification that is being parsed in pieces.
+- It may start or end in the middle of a part or a clause. Extract only the content on these pages.
+- Content that appears before any "PART" heading on these pages belongs to PART {part_number}; put it in "part{part_number}".
+- If the first clause continues from an earlier page, still nest it under its parent clauses, repeating each parent's "index" and "text" exactly as printed (e.g. "1.05" and its title) so the pieces can be stitched back together.
+- If the section number or title is not on these pages, return empty strings for "section" and "name".
+'''
+
+# Headings such as "PART 2 - PRODUCTS" at the start of a line
+PART_HEADING_RE = re.compile(r"^\s*PART\s+([123])\b", re.MULTILINE)
+
+def _normalize_index(index: Optional[str]) -> str:
+    return (index or "").strip().rstrip(".").lower()
+
+
+def find_part_pages(reader: PdfReader) -> dict:
+    """
+    Find the first page of each PART heading
+
+    Returns:
+        Dict of part number -> 0-based page index
+    """
+    part_pages = {}
+    for page_number, page in enumerate(reader.pages):
+        text = page.extract_text() or ""
+        for match in PART_HEADING_RE.finditer(text):
+            part_pages.setdefault(int(match.group(1)), page_number)
+    return part_pages
+
+
+def plan_chunks(
+    page_count: int,
+    part_pages: dict,
+    max_pages: int = DEFAULT_MAX_CHUNK_PAGES,
+    overlap: int = DEFAULT_CHUNK_OVERLAP_PAGES,
+) -> List[Tuple[int, int, int]]:
+    """
+    Split a document into page ranges, preferring PART boundaries
+
+    Documents that fit in one chunk are not split. Otherwise a page that starts a PART
+    is shared by the chunk before and after it, since the previous part usually ends on
+    the same page. Segments longer than max_pages are cut into windows that overlap by
+    `overlap` pages.
+
+    Returns:
+        List of (first_page, last_page, part_number) with 0-based inclusive pages
+    """
+    max_pages = max(1, max_pages)
+    overlap = max(0, min(overlap, max_pages - 1))
+
+    if page_count <= max_pages:
+        return [(0, page_count - 1, 1)]
+
+    # Segment starts: page 0 (cover pages go with PART 1) plus every later PART heading page
+    starts = [(0, 1)]
+    for part_number, page_number in sorted(part_pages.items(), key=lambda item: (item[1], item[0])):
+        if part_number == 1 or page_number <= starts[-1][0]:
+            continue
+        starts.append((page_number, part_number))
+
+    chunks = []
+    for i, (first, part_number) in enumerate(starts):
+        last = starts[i + 1][0] if i + 1 < len(starts) else page_count - 1
+        page = first
+        while True:
+            end = min(page + max_pages - 1, last)
+            chunks.append((page, end, part_number))
+            if end >= last:
+                break
+            page = end + 1 - overlap
+    return chunks
+
+
+@contextmanager
+def _open_reader(file_content) -> Iterator[PdfReader]:
+    """PdfReader over PDF bytes, or over a PdfFile's open file so pages are read as needed"""
+    if isinstance(file_content, (bytes, bytearray)):
+        yield PdfReader(io.BytesIO(file_content))
+        return
+    # pypdf reads a path into memory, but seeks through a file object
+    with open(file_content.path, "rb") as f:
+        yield PdfReader(f)
+
+
+def _write_chunk(reader: PdfReader, first_page: int, last_page: int, directory: Optional[str]) -> PdfFile:
+    writer = PdfWriter()
+    for page_number in range(first_page, last_page + 1):
+        writer.add_page(reader.pages[page_number])
+    fd, path = tempfile.mkstemp(suffix=".pdf", prefix="chunk-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            writer.write(f)
+        return PdfFile.from_path(path, f"pages-{first_page + 1}-{last_page + 1}.pdf", owned=True)
+    except BaseException:
+        os.remove(path)
+        raise
+
+
+def count_pages(file_content) -> int:
+    """Page count of a PDF (bytes or PdfFile); blocking, so call via asyncio.to_thread"""
+    with _open_reader(file_content) as reader:
+        return len(reader.pages)
+
+
+def split_pdf(
+    file_content,
+    max_pages: int = DEFAULT_MAX_CHUNK_PAGES,
+    overlap: int = DEFAULT_CHUNK_OVERLAP_PAGES,
+) -> List[dict]:
+    """
+    Split a PDF (bytes, or a PdfFile read from disk) into chunk PDFs along PART boundaries
+
+    Each chunk is written to its own temporary file as soon as it is cut, next to the
+    source PdfFile, so only one chunk is in memory at a time. Blocking, so call via
+    asyncio.to_thread; the caller cleans up the chunk files.
+
+    Returns:
+        List of dicts with "first_page", "last_page" (1-based), "part" and "pdf" (PdfFile)
+    """
+    directory = None if isinstance(file_content, (bytes, bytearray)) else os.path.dirname(file_content.path)
+    chunks = []
+    try:
+        with _open_reader(file_content) as reader:
+            ranges = plan_chunks(len(reader.pages), find_part_pages(reader), max_pages, overlap)
+            for first, last, part_number in ranges:
+                chunks.append({
+                    "first_page": first + 1,
+                    "last_page": last + 1,
+                    "part": part_number,
+                    "pdf": _write_chunk(reader, first, last, directory),
+                })
+    except BaseException:
+        for chunk in chunks:
+            chunk["pdf"].cleanup()
+        raise
+    return chunks
+
+
+def _merge_text(existing: str, incoming: str) -> str:
+    """Keep the more complete text when a clause was cut at a page boundary"""
+    existing = existing or ""
+    incoming = incoming or ""
+    if len(incoming) > len(existing) and incoming.startswith(existing):
+        return incoming
+    return existing or incoming
+
+
+def _tail_parent_for(items: list, style: str) -> Optional[list]:
+    """
+    Find the children list at the tail of `items` where a clause of `style` belongs
+
+    Walks down the last clause at each level and returns the first children list whose
+    clauses have that style, or the list under a clause one step up the numbering ladder.
+    """
+    if style not in INDEX_STYLES:
+        return None
+    depth_wanted = INDEX_STYLES.index(style)
+    node_list = items
+    while node_list:
+        last = node_list[-1]
+        last_style = index_style(last.get("index"))
+        if last_style in INDEX_STYLES and INDEX_STYLES.index(last_style) == depth_wanted - 1:
+            if last.get("children") is None:
+                last["children"] = []
+            return last["children"]
+        node_list = last.get("children")
+        if node_list and index_style(node_list[0].get("index")) == style:
+            return node_list
+    return None
+
+
+def _depth(item: dict) -> Optional[int]:
+    """Position of a clause's style on the numbering ladder, or None for other indexes"""
+    style = index_style(item.get("index"))
+    return INDEX_STYLES.index(style) if style in INDEX_STYLES else None
+
+
+def _texts_agree(existing: Optional[str], incoming: Optional[str]) -> bool:
+    """True if one text is the other, possibly cut off at a page boundary, or either is empty"""
+    existing = " ".join((existing or "").split()).casefold()
+    incoming = " ".join((incoming or "").split()).casefold()
+    return existing.startswith(incoming) or incoming.startswith(existing)
+
+
+def _same_clause(existing: dict, item: dict) -> bool:
+    return (
+        _normalize_index(existing.get("index")) == _normalize_index(item.get("index"))
+        and _texts_agree(existing.get("text"), item.get("text"))
+    )
+
+
+def _reading_order(items: list) -> list:
+    """Every clause under `items`, depth first"""
+    clauses = []
+    pending = list(reversed(items))
+    while pending:
+        item = pending.pop()
+        clauses.append(item)
+        pending.extend(reversed(item.get("children") or []))
+    return clauses
+
+
+def _overlap_repeats(target: list, incoming: list) -> dict:
+    """
+    id() of each incoming clause that repeats the end of `target` -> the clause it repeats
+
+    The overlap page repeats the last clauses of `target` in reading order, so a repeat is
+    only accepted when every clause from the match to the end of `target` lines up with
+    the start of `incoming`. Boilerplate clauses that recur in earlier articles do not.
+    """
+    target_clauses = _reading_order(target)
+    incoming_clauses = _reading_order(incoming)
+    # Longest overlap first: it cannot be longer than the incoming chunk
+    for start in range(max(0, len(target_clauses) - len(incoming_clauses)), len(target_clauses)):
+        repeated = target_clauses[start:]
+        if all(_same_clause(existing, item) for existing, item in zip(repeated, incoming_clauses)):
+            return {id(item): existing for existing, item in zip(repeated, incoming_clauses)}
+    return {}
+
+
+def _merge_clause(existing: dict, item: dict) -> None:
+    existing["text"] = _merge_text(existing.get("text"), item.get("text"))
+    if item.get("children"):
+        existing["children"] = merge_items(existing.get("children") or [], item["children"])
+
+
+def merge_items(target: list, incoming: list) -> list:
+    """
+    Merge clauses from the next chunk into the clauses accumulated so far
+
+    Clauses with the same index and text (or text cut off at a page boundary) as an
+    existing sibling (the overlap page, or a clause whose children continue on the next
+    chunk) are merged recursively instead of duplicated. Leading clauses that are deeper
+    than the top level (the chunk starts mid-clause without repeating its parents) are
+    merged into the clauses they repeat from the end of `target`, or else attached at
+    their own level under its tail.
+    Incoming clauses are copied, so the chunk documents are left unchanged.
+    """
+    incoming = incoming or []
+    position = 0
+    target_depth = _depth(target[-1]) if target else None
+    if target_depth is not None:
+        repeats = None
+        # Orphaned continuation, e.g. "2., C., 1.06" after "1.05 > B. > 1."
+        while position < len(incoming):
+            item_depth = _depth(incoming[position])
+            if item_depth is None or item_depth <= target_depth:
+                break
+            if repeats is None:
+                repeats = _overlap_repeats(target, incoming)
+            repeated = repeats.get(id(incoming[position]))
+            if repeated is not None:
+                _merge_clause(repeated, incoming[position])
+                position += 1
+                continue
+            parent_children = _tail_parent_for(target, INDEX_STYLES[item_depth])
+            if parent_children is None:
+                break
+            merge_items(parent_children, [incoming[position]])
+            position += 1
+
+    for item in incoming[position:]:
+        item_key = _normalize_index(item.get("index"))
+
+        existing = None
+        for candidate in reversed(target):
+            if _normalize_index(candidate.get("index")) == item_key:
+                # Same index with different text is another clause, e.g. "1." of the next list
+                if _texts_agree(candidate.get("text"), item.get("text")):
+                    existing = candidate
+                break
+
+        if existing is not None:
+            _merge_clause(existing, item)
+            continue
+
+        target.append(copy.deepcopy(item))
+    return target
+
+
+def merge_chunk_documents(documents: List[dict]) -> dict:
+    """
+    Merge per-chunk documents, in page order, into one section/name/part1..part3 document
+    """
+    merged = empty_document()
+    for document in documents:
+        if not merged["section"] and document.get("section"):
+            merged["section"] = document["section"]
+        if not merged["name"] and document.get("name"):
+            merged["name"] = document["name"]
+        for part_key in PART_KEYS:
+            part = document.get(part_key) or {}
+            merge_items(merged[part_key]["partItems"], part.get("partItems") or [])
+    return merged
+
+
+async def parse_pdf_chunked(
+    file_content,
+    model: GeminiModel = GeminiModel.GEMINI_2_5_FLASH,
+    max_pages: int = DEFAULT_MAX_CHUNK_PAGES,
+    overlap: int = DEFAULT_CHUNK_OVERLAP_PAGES,
+    concurrency: int = DEFAULT_CHUNK_CONCURRENCY,
+):
+    """
+    Parse a PDF as concurrent page-range chunks and merge the results
+
+    Args:
+        file_content: PDF file content as bytes, or a PdfFile spooled to disk
+        model: Selected Gemini model
+        max_pages: Maximum pages per chunk
+        overlap: Pages shared between consecutive chunks of the same part
+        concurrency: Maximum chunks in flight at once
+
+    A PDF that fits in one chunk is parsed whole with the normal prompt. If a chunk fails,
+    the chunks still running are cancelled so they stop using quota.
+
+    Returns:
+        Tuple of (merged JSON string, merged document or None when a single-chunk PDF's
+        output is not JSON, list of per-chunk timing dicts)
+    """
+    if await asyncio.to_thread(count_pages, file_content) <= max(1, max_pages):
+        text, document = await parse_pdf_with_gemini(file_content, model, with_document=True)
+        return text, document, []
+    with metrics.span("split", model.value):
+        chunks = await asyncio.to_thread(split_pdf, file_content, max_pages, overlap)
+    try:
+        return await _parse_chunks(chunks, model, concurrency)
+    finally:
+        for chunk in chunks:
+            chunk["pdf"].cleanup()
+
+
+async def _parse_chunks(chunks: List[dict], model: GeminiModel, concurrency: int):
+    print(f"Split PDF into {len(chunks)} chunks: {[(c['first_page'], c['last_page']) for c in chunks]}")
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    timings = [None] * len(chunks)
+
+    async def run_chunk(i: int, chunk: dict) -> dict:
+        prompt = PARSE_PROMPT + CHUNK_PROMPT.format(
+            first_page=chunk["first_page"],
+            last_page=chunk["last_page"],
+            part_number=chunk["part"],
+        )
+        async with semaphore:
+            started = time.perf_counter()
+            # Each chunk is a PdfFile, so a large one is streamed or sent through the Files API
+            _, document = await parse_pdf_with_gemini(chunk["pdf"], model, prompt=prompt, with_document=True)
+            elapsed = time.perf_counter() - started
+        if not isinstance(document, dict):
+            raise Exception(f"Chunk pages {chunk['first_page']}-{chunk['last_page']} did not return a JSON object")
+        timings[i] = {
+            "pages": [chunk["first_page"], chunk["last_page"]],
+            "seconds": round(elapsed, 3),
+            "bytes": chunk["pdf"].size,
+        }
+        return document
+
+    tasks = [asyncio.ensure_future(run_chunk(i, chunk)) for i, chunk in enumerate(chunks)]
+    try:
+        documents = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    with metrics.span("merge", model.value):
+        merged = merge_chunk_documents(documents)
+    with metrics.span("serialize", model.value):
+        return fast_json.dumps(merged), merged, timings
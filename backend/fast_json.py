@@ -0,0 +1,20 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the standard library is used without it
+    orjson = None
+
+
+def dumps(data) -> str:
+    """Compact JSON text, non-ASCII characters kept as-is"""
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_bytes(data) -> bytes:
+    """Compact UTF-8 JSON, for response bodies"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
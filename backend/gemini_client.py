@@ -0,0 +1,477 @@
+import asyncio
+import email.utils
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+import httpx
+
+import metrics
+from uploads import estimate_pages
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+# Default (requests per minute, input tokens per minute) per model, overridable with
+# GEMINI_RPM_<MODEL> / GEMINI_TPM_<MODEL>, e.g. GEMINI_RPM_GEMINI_2_5_FLASH=300
+DEFAULT_RATE_LIMITS = {
+    "gemini-2.5-pro": (150, 2_000_000),
+    "gemini-2.5-flash": (1000, 1_000_000),
+    "gemini-2.0-flash-lite": (4000, 4_000_000),
+}
+FALLBACK_RATE_LIMIT = (60, 1_000_000)
+
+# Gemini bills each PDF page as a fixed number of input tokens
+TOKENS_PER_PDF_PAGE = 258
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class StreamedBody:
+    """A request body produced by an async iterator factory, with a known length"""
+
+    def __init__(self, factory: Callable[[], AsyncIterator[bytes]], length: int):
+        self.factory = factory
+        self.length = length
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+def estimate_request_tokens(prompt: str, pdf_content) -> int:
+    """
+    Cheap estimate of the input tokens a parse request will use
+
+    Counts page objects in the PDF rather than parsing it (falling back to the page tree
+    when they are compressed), and ~4 characters per prompt token. pdf_content is the PDF's
+    bytes, or an uploads.PdfFile whose pages were counted on upload.
+    """
+    if isinstance(pdf_content, (bytes, bytearray)):
+        pages = estimate_pages(pdf_content)
+    else:
+        pages = pdf_content.page_estimate or 1
+    return pages * TOKENS_PER_PDF_PAGE + len(prompt) // 4
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at capacity per `period` seconds"""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """
+        Wait until `amount` tokens are available and take them
+
+        Requests larger than the bucket are capped at its capacity so they can still run.
+
+        Returns:
+            Seconds spent waiting
+        """
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        # The lock keeps waiters in FIFO order instead of letting small requests starve big ones
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def consume(self, amount: float):
+        """Take tokens without waiting; the balance may go negative"""
+        self._refill()
+        self.tokens -= amount
+
+
+class ModelRateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one model"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        waited = await self.requests.acquire(1)
+        waited += await self.tokens.acquire(estimated_tokens)
+        return waited
+
+
+class GeminiClient:
+    """
+    Shared HTTP client for the Gemini API
+
+    Holds one pooled httpx.AsyncClient (HTTP/2 keep-alive when h2 is installed), a rate
+    limiter per model, and retries 429/5xx responses with jittered exponential backoff
+    that honours Retry-After.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        timeout_seconds: float = 600,
+        http2: bool = True,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        rate_limits: Optional[dict] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits)
+
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("h2 is not installed, falling back to HTTP/1.1 for Gemini requests")
+                http2 = False
+
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            timeout=httpx.Timeout(timeout_seconds, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            transport=transport,
+        )
+        self._limiters = {}
+        self.stats = {}
+
+    @classmethod
+    def from_env(cls, **overrides) -> "GeminiClient":
+        """Create a client configured from GEMINI_* environment variables"""
+        rate_limits = {}
+        for model, (rpm, tpm) in DEFAULT_RATE_LIMITS.items():
+            env_name = model.upper().replace("-", "_").replace(".", "_")
+            rate_limits[model] = (
+                int(os.getenv(f"GEMINI_RPM_{env_name}", rpm)),
+                int(os.getenv(f"GEMINI_TPM_{env_name}", tpm)),
+            )
+        options = dict(
+            base_url=os.getenv("GEMINI_BASE_URL", DEFAULT_BASE_URL),
+            timeout_seconds=float(os.getenv("GEMINI_TIMEOUT_SECONDS", "600")),
+            http2=_env_flag("GEMINI_HTTP2", True),
+            max_connections=int(os.getenv("GEMINI_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("GEMINI_MAX_KEEPALIVE_CONNECTIONS", "10")),
+            keepalive_expiry=float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", "30")),
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "4")),
+            backoff_base=float(os.getenv("GEMINI_BACKOFF_BASE", "1")),
+            backoff_max=float(os.getenv("GEMINI_BACKOFF_MAX", "60")),
+            rate_limits=rate_limits,
+        )
+        options.update(overrides)
+        return cls(**options)
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    def _limiter(self, model: str) -> ModelRateLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            rpm, tpm = self.rate_limits.get(model, FALLBACK_RATE_LIMIT)
+            limiter = self._limiters[model] = ModelRateLimiter(rpm, tpm)
+        return limiter
+
+    def _model_stats(self, model: str) -> dict:
+        stats = self.stats.get(model)
+        if stats is None:
+            stats = self.stats[model] = {
+                "requests": 0,
+                "retries": 0,
+                "throttled": 0,
+                "failures": 0,
+                "queue_wait_seconds_total": 0.0,
+                "queue_wait_seconds_max": 0.0,
+            }
+        return stats
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> Optional[float]:
+        """
+        Full-jitter exponential backoff, but never sooner than the server asked for
+
+        Returns None when the server asks for a longer wait than backoff_max (e.g. a
+        daily quota is spent), so the response is returned instead of retried.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        server_delay = _server_retry_delay(response) if response is not None else None
+        if server_delay is not None:
+            if server_delay > self.backoff_max:
+                return None
+            delay = max(delay, server_delay)
+        return delay
+
+    async def post(
+        self,
+        model: str,
+        method: str,
+        body,
+        api_key: str,
+        estimated_tokens: int = 0,
+    ) -> httpx.Response:
+        """
+        POST to models/{model}:{method}, rate limited and retried
+
+        Args:
+            model: Gemini model value, e.g. "gemini-2.5-flash"
+            method: API method, e.g. "generateContent"
+            body: JSON request body, or a StreamedBody for large requests
+            api_key: Gemini API key, sent as the x-goog-api-key header
+            estimated_tokens: Input token estimate charged against the model's TPM bucket
+
+        Returns:
+            The final httpx.Response (successful, non-retryable, or after the last retry)
+        """
+        return await self._send(model, method, body, api_key, estimated_tokens)
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        model: str,
+        method: str,
+        body,
+        api_key: str,
+        estimated_tokens: int = 0,
+    ):
+        """
+        Like post(), but yields the response with its body unread, for server-sent events
+
+        Retries only happen before the first byte of a successful response. Error
+        responses are read in full so callers can inspect them.
+        """
+        response = await self._send(model, method, body, api_key, estimated_tokens, stream=True)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+            if response.status_code == 200:
+                metrics.GEMINI_BYTES.inc(model, "received", amount=response.num_bytes_downloaded)
+
+    async def _send(
+        self,
+        model: str,
+        method: str,
+        body,
+        api_key: str,
+        estimated_tokens: int,
+        stream: bool = False,
+    ) -> httpx.Response:
+        url = f"/v1beta/models/{model}:{method}"
+        headers = {"Content-Type": "application/json", "x-goog-api-key": api_key}
+        params = {"alt": "sse"} if stream else None
+
+        def build_request() -> httpx.Request:
+            if isinstance(body, StreamedBody):
+                # A fresh iterator per attempt, so retries resend the whole body
+                return self.http.build_request(
+                    "POST", url, content=body.factory(), params=params,
+                    headers={**headers, "Content-Length": str(body.length)},
+                )
+            return self.http.build_request("POST", url, json=body, headers=headers, params=params)
+
+        return await self._send_with_retries(model, build_request, estimated_tokens, stream)
+
+    async def _send_with_retries(
+        self,
+        model: str,
+        build_request: Callable[[], httpx.Request],
+        estimated_tokens: int = 0,
+        stream: bool = False,
+    ) -> httpx.Response:
+        """Send a request built fresh for each attempt, rate limited under model and retried"""
+        limiter = self._limiter(model)
+        stats = self._model_stats(model)
+
+        attempt = 0
+        while True:
+            waited = await limiter.acquire(estimated_tokens)
+            stats["requests"] += 1
+            stats["queue_wait_seconds_total"] += waited
+            stats["queue_wait_seconds_max"] = max(stats["queue_wait_seconds_max"], waited)
+            if waited > 0:
+                metrics.record_stage("rate_limit_wait", waited, model)
+
+            response = None
+            try:
+                request = build_request()
+                metrics.GEMINI_BYTES.inc(model, "sent", amount=int(request.headers.get("content-length", 0)))
+                response = await self.http.send(request, stream=stream)
+                if stream and response.status_code != 200:
+                    await response.aread()
+                    await response.aclose()
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+                metrics.GEMINI_REQUESTS.inc(model, type(e).__name__)
+                if attempt >= self.max_retries:
+                    stats["failures"] += 1
+                    raise
+                print(f"Gemini request failed ({type(e).__name__}), retrying")
+            else:
+                metrics.GEMINI_REQUESTS.inc(model, str(response.status_code))
+                if not stream or response.status_code != 200:
+                    metrics.GEMINI_BYTES.inc(model, "received", amount=response.num_bytes_downloaded)
+                if response.status_code == 429:
+                    stats["throttled"] += 1
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return response
+                if attempt >= self.max_retries:
+                    stats["failures"] += 1
+                    return response
+
+            delay = self._retry_delay(attempt, response)
+            if delay is None:
+                print(f"Gemini {model} returned {response.status_code} and asked to wait longer than {self.backoff_max}s, not retrying")
+                stats["failures"] += 1
+                return response
+            status = response.status_code if response is not None else "connection error"
+            print(f"Gemini {model} returned {status}, retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+            stats["retries"] += 1
+            metrics.GEMINI_RETRIES.inc(model)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def upload_file(self, pdf, api_key: str, mime_type: str = "application/pdf", model: str = "") -> dict:
+        """
+        Upload a file with the Files API resumable protocol, streaming it from disk
+
+        Each step goes through the model's request bucket and is retried like post().
+        Waiting for the file to finish processing is bounded by timeout_seconds.
+
+        Args:
+            pdf: uploads.PdfFile to send
+            api_key: Gemini API key
+            mime_type: MIME type of the file
+            model: Model the file is uploaded for, to rate limit and label its requests
+
+        Returns:
+            The "file" resource, with "name", "uri" and "state"
+        """
+        start = await self._send_with_retries(model, lambda: self.http.build_request(
+            "POST",
+            "/upload/v1beta/files",
+            headers={
+                "x-goog-api-key": api_key,
+                "X-Goog-Upload-Protocol": "resumable",
+                "X-Goog-Upload-Command": "start",
+                "X-Goog-Upload-Header-Content-Length": str(pdf.size),
+                "X-Goog-Upload-Header-Content-Type": mime_type,
+            },
+            json={"file": {"display_name": pdf.filename or os.path.basename(pdf.path)}},
+        ))
+        upload_url = start.headers.get("x-goog-upload-url")
+        if start.status_code != 200 or not upload_url:
+            raise Exception(f"Gemini file upload could not start: HTTP {start.status_code}")
+
+        # A fresh iterator per attempt, so a retried upload resends the file from offset 0
+        response = await self._send_with_retries(model, lambda: self.http.build_request(
+            "POST",
+            upload_url,
+            headers={
+                "Content-Length": str(pdf.size),
+                "X-Goog-Upload-Offset": "0",
+                "X-Goog-Upload-Command": "upload, finalize",
+            },
+            content=pdf.aiter_chunks(),
+        ))
+        if response.status_code != 200:
+            raise Exception(f"Gemini file upload failed: HTTP {response.status_code}")
+        file = response.json()["file"]
+
+        # Large files are processed asynchronously before they can be referenced
+        deadline = time.monotonic() + self.timeout_seconds
+        while file.get("state") == "PROCESSING":
+            if time.monotonic() >= deadline:
+                await self.delete_file(file["name"], api_key)
+                raise httpx.ReadTimeout(f"Gemini file {file['name']} was still processing after {self.timeout_seconds}s")
+            await asyncio.sleep(1)
+            poll = await self._send_with_retries(model, lambda: self.http.build_request(
+                "GET", f"/v1beta/{file['name']}", headers={"x-goog-api-key": api_key},
+            ))
+            if poll.status_code != 200:
+                raise Exception(f"Gemini file status check failed: HTTP {poll.status_code}")
+            file = poll.json()
+        if file.get("state") == "FAILED":
+            raise Exception(f"Gemini could not process uploaded file {file.get('name')}")
+        return file
+
+    async def delete_file(self, name: str, api_key: str):
+        """Best-effort removal of an uploaded file once it is no longer needed"""
+        try:
+            await self.http.delete(f"/v1beta/{name}", headers={"x-goog-api-key": api_key})
+        except httpx.HTTPError as e:
+            print(f"Could not delete Gemini file {name}: {e}")
+
+    def settle_tokens(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """Charge the difference once usageMetadata reports the real input token count"""
+        if actual_tokens > estimated_tokens:
+            self._limiter(model).tokens.consume(actual_tokens - estimated_tokens)
+
+    def snapshot(self) -> dict:
+        return {model: dict(stats) for model, stats in self.stats.items()}
+
+
+def _server_retry_delay(response: httpx.Response) -> Optional[float]:
+    """Seconds from a Retry-After header, or from a google.rpc.RetryInfo error detail"""
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                parsed = email.utils.parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                parsed = None
+            if parsed is not None:
+                return max(0.0, parsed.timestamp() - time.time())
+
+    try:
+        details = response.json().get("error", {}).get("details", [])
+    except ValueError:
+        return None
+    for detail in details:
+        retry_delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+        if isinstance(retry_delay, str) and retry_delay.endswith("s"):
+            try:
+                return float(retry_delay[:-1])
+            except ValueError:
+                pass
+    return None
+
+
+# Shared client, created by the app lifespan (or lazily outside the app)
+_client: Optional[GeminiClient] = None
+
+
+def get_gemini_client() -> GeminiClient:
+    global _client
+    if _client is None:
+        _client = GeminiClient.from_env()
+    return _client
+
+
+def set_gemini_client(client: Optional[GeminiClient]):
+    global _client
+    _client = client
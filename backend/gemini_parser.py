@@ -2,8 +2,13 @@ import base64
 import httpx
 import os
 import json
+import time
 from dotenv import load_dotenv
 from enum import Enum
+from gemini_client import get_gemini_client, estimate_request_tokens, StreamedBody
+from uploads import PdfFile
+import fast_json
+import metrics
 
 load_dotenv()
 
@@ -20,29 +25,8 @@ MODEL_DESCRIPTIONS = {
     GeminiModel.GEMINI_2_0_FLASH_LITE: "Cost effective - Budget-friendly option for simpler documents"
 }
 
-async def parse_pdf_with_gemini(file_content: bytes, model: GeminiModel = GeminiModel.GEMINI_2_5_FLASH) -> str:
-    """
-    Parse PDF using the specified Gemini model
-    
-    Args:
-        file_content: PDF file content as bytes
-        model: Selected Gemini model (defaults to Gemini 2.5 Flash - reasoning and speed balance)
-    
-    Returns:
-        Parsed JSON string
-    """
-    try:
-        print(f"Starting PDF processing with {model.value}, file size: {len(file_content)} bytes")
-        print(f"Model description: {MODEL_DESCRIPTIONS[model]}")
-        
-        # Hardcoded 5-minute timeout
-        timeout_seconds = 600
-        print(f"File size: {len(file_content) / (1024 * 1024):.2f} MB, using timeout: {timeout_seconds} seconds")
-        
-        encoded = base64.b64encode(file_content).decode()
-        print(f"PDF encoded to base64, length: {len(encoded)} characters")
-
-        prompt = '''You are a parsing engine that converts construction specification PDFs into structured JSON.
+# Prompt sent with every PDF; also part of the result cache key
+PARSE_PROMPT = '''You are a parsing engine that converts construction specification PDFs into structured JSON.
 
 ⚠️ Do not infer, hallucinate, or generate content not explicitly present in the provided PDF.
 
@@ -87,70 +71,241 @@ Your job is to extract only the technical specification content starting from "P
 Only return the structured JSON. No commentary, no assumptions.
 '''
 
+# Requests whose inline body (prompt plus base64 PDF, ~1.33x the PDF) would reach this size
+# send the PDF through the Files API instead; Gemini's inline limit covers the whole request
+FILES_API_THRESHOLD_BYTES = int(float(os.getenv('GEMINI_FILES_API_THRESHOLD_MB', '20')) * 1024 * 1024)
+
+def _build_request_body(file_content: bytes, prompt: str) -> dict:
+    """generateContent request body with the prompt and the PDF as inline base64 data"""
+    encoded = base64.b64encode(file_content).decode()
+
+    return {
+        "contents": [
+            {
+                "parts": [
+                    {"text": prompt},
+                    {
+                        "inlineData": {
+                            "mimeType": "application/pdf",
+                            "data": encoded
+                        }
+                    }
+                ]
+            }
+        ]
+    }
+
+def _build_streamed_request_body(pdf: PdfFile, prompt: str) -> StreamedBody:
+    """
+    Same body as _build_request_body, but base64-encoded from disk one chunk at a time
+
+    The encoded PDF is never held in memory as a whole; CHUNK_SIZE is a multiple of 3 so
+    the encoded chunks concatenate into valid base64.
+    """
+    template = json.dumps(_build_request_body(b"", prompt), ensure_ascii=False)
+    prefix, suffix = template.split('"data": ""')
+    prefix = (prefix + '"data": "').encode()
+    suffix = ('"' + suffix).encode()
+    encoded_length = 4 * ((pdf.size + 2) // 3)
+
+    async def factory():
+        yield prefix
+        async for chunk in pdf.aiter_chunks():
+            yield base64.b64encode(chunk)
+        yield suffix
+
+    return StreamedBody(factory, len(prefix) + encoded_length + len(suffix))
+
+async def _prepare_request(client, file_content, prompt: str, api_key: str, model: str):
+    """
+    Build the request body for bytes or a spooled PdfFile
+
+    A spooled PdfFile whose inline request stays below the Files API threshold is
+    base64-encoded while it is sent, so its encoding time is part of the "upstream" stage.
+
+    Returns:
+        Tuple of (body, name of an uploaded Files API file to delete afterwards, or None)
+    """
+    if isinstance(file_content, (bytes, bytearray)):
+        with metrics.span("encode", model):
+            return _build_request_body(file_content, prompt), None
+
+    inline_body = _build_streamed_request_body(file_content, prompt)
+    if inline_body.length >= FILES_API_THRESHOLD_BYTES:
+        print(f"PDF is {file_content.size} bytes ({inline_body.length} inline), uploading through the Files API")
+        with metrics.span("file_upload", model):
+            uploaded = await client.upload_file(file_content, api_key, model=model)
         body = {
             "contents": [
                 {
                     "parts": [
                         {"text": prompt},
                         {
-                            "inlineData": {
+                            "fileData": {
                                 "mimeType": "application/pdf",
-                                "data": encoded
+                                "fileUri": uploaded["uri"]
                             }
                         }
                     ]
                 }
             ]
         }
+        return body, uploaded["name"]
 
-        headers = {"Content-Type": "application/json"}
+    return inline_body, None
+
+def _pdf_size(file_content) -> int:
+    return len(file_content) if isinstance(file_content, (bytes, bytearray)) else file_content.size
+
+async def parse_pdf_with_gemini(file_content, model: GeminiModel = GeminiModel.GEMINI_2_5_FLASH, prompt: str = PARSE_PROMPT, expect_json: bool = True, with_document: bool = False):
+    """
+    Parse PDF using the specified Gemini model
+    
+    Args:
+        file_content: PDF file content as bytes, or a PdfFile spooled to disk
+        model: Selected Gemini model (defaults to Gemini 2.5 Flash - reasoning and speed balance)
+        prompt: Instructions sent alongside the PDF (defaults to PARSE_PROMPT)
+        expect_json: Reformat the output as compact JSON; False returns the model's text as-is
+        with_document: Also return the parsed document, so callers need not parse the text again
+    
+    Returns:
+        Parsed JSON string, or the raw model text when expect_json is False. With
+        with_document, a tuple of (text, document dict or None when the output is not JSON)
+    """
+    uploaded_name = None
+    started = time.perf_counter()
+    try:
+        # Shared pooled client: rate limited per model, retries 429/5xx with backoff
+        client = get_gemini_client()
+        timeout_seconds = client.timeout_seconds
+        
         api_key = os.getenv('GEMINI_API_KEY')
         
         if not api_key:
             raise Exception("GEMINI_API_KEY not found in environment variables")
         
-        # Use the selected model in the API URL
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model.value}:generateContent?key={api_key}"
-        print(f"Making request to Gemini API using {model.value} with {timeout_seconds}s timeout...")
+        body, uploaded_name = await _prepare_request(client, file_content, prompt, api_key, model.value)
+        estimated_tokens = estimate_request_tokens(prompt, file_content)
 
-        async with httpx.AsyncClient(timeout=timeout_seconds) as client:
-            response = await client.post(url, json=body, headers=headers)
-            print(f"Gemini API response status: {response.status_code}")
-            
+        with metrics.span("upstream", model.value):
+            response = await client.post(model.value, "generateContent", body, api_key, estimated_tokens)
+        
+        with metrics.span("response_decode", model.value):
             result = response.json()
-            print(f"Gemini API response received, length: {len(str(result))} characters")
 
-            if response.status_code != 200:
-                error_message = result.get('error', {}).get('message', 'Unknown error')
-                print(f"Gemini API error: {error_message}")
-                raise Exception(f"Gemini API error: {error_message}")
+        if response.status_code != 200:
+            error_message = result.get('error', {}).get('message', 'Unknown error')
+            print(f"Gemini API error ({response.status_code}): {error_message}")
+            raise Exception(f"Gemini API error: {error_message}")
 
-            content = result['candidates'][0]['content']['parts'][0]['text']
-            print(f"Extracted content from Gemini response, length: {len(content)} characters")
+        usage_metadata = result.get('usageMetadata', {})
+        metrics.record_usage(model.value, usage_metadata)
+        prompt_tokens = usage_metadata.get('promptTokenCount')
+        if prompt_tokens:
+            client.settle_tokens(model.value, estimated_tokens, prompt_tokens)
 
-            try:
+        content = result['candidates'][0]['content']['parts'][0]['text']
+        print(
+            f"Parsed {_pdf_size(file_content)} byte PDF with {model.value} in {time.perf_counter() - started:.3f}s, "
+            f"{usage_metadata.get('promptTokenCount', '?')} prompt / {usage_metadata.get('candidatesTokenCount', '?')} output tokens"
+        )
+
+        if not expect_json:
+            return content
+
+        try:
+            with metrics.span("json_repair", model.value):
                 content = content.strip()
                 if content.startswith('```json'):
                     content = content[7:]
                 if content.endswith('```'):
                     content = content[:-3]
                 content = content.strip()
-
                 json_data = json.loads(content)
-                formatted_json = json.dumps(json_data, indent=2, ensure_ascii=False)
-                print(f"JSON successfully formatted, length: {len(formatted_json)} characters")
-                return formatted_json
-            except json.JSONDecodeError as json_error:
-                print(f"JSON parsing error: {json_error}")
-                print(f"Raw content: {content[:200]}...")
-                return content
-                
-    except httpx.ReadTimeout:
+
+            # Re-dump compactly: drops the model's whitespace
+            with metrics.span("serialize", model.value):
+                text = fast_json.dumps(json_data)
+            return (text, json_data) if with_document else text
+        except json.JSONDecodeError as json_error:
+            print(f"JSON parsing error: {json_error}")
+            print(f"Raw content: {content[:200]}...")
+            return (content, None) if with_document else content
+            
+    except httpx.TimeoutException:
         print(f"Timeout error: Gemini API took too long to respond (>{timeout_seconds}s)")
+        metrics.GEMINI_TIMEOUTS.inc(model.value)
+        metrics.mark_error("timeout")
         raise Exception(f"PDF processing timed out after {timeout_seconds} seconds. Try with a smaller PDF file.")
     except Exception as e:
         print(f"Error in parse_pdf_with_gemini: {str(e)}")
         raise e
+    finally:
+        if uploaded_name:
+            await get_gemini_client().delete_file(uploaded_name, os.getenv('GEMINI_API_KEY'))
+
+async def stream_pdf_with_gemini(file_content, model: GeminiModel = GeminiModel.GEMINI_2_5_FLASH, prompt: str = PARSE_PROMPT):
+    """
+    Stream model output for a PDF using streamGenerateContent
+
+    Args:
+        file_content: PDF file content as bytes, or a PdfFile spooled to disk
+        model: Selected Gemini model
+        prompt: Instructions sent alongside the PDF (defaults to PARSE_PROMPT)
+
+    Yields:
+        Pieces of the model's text output as they arrive
+    """
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise Exception("GEMINI_API_KEY not found in environment variables")
+
+    client = get_gemini_client()
+    body, uploaded_name = await _prepare_request(client, file_content, prompt, api_key, model.value)
+    estimated_tokens = estimate_request_tokens(prompt, file_content)
+
+    started = time.perf_counter()
+    first_output = True
+    try:
+        async with client.stream(model.value, "streamGenerateContent", body, api_key, estimated_tokens) as response:
+            if response.status_code != 200:
+                try:
+                    error_message = response.json().get('error', {}).get('message', 'Unknown error')
+                except ValueError:
+                    error_message = f"HTTP {response.status_code}"
+                print(f"Gemini API error: {error_message}")
+                raise Exception(f"Gemini API error: {error_message}")
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                if 'error' in event:
+                    raise Exception(f"Gemini API error: {event['error'].get('message', 'Unknown error')}")
+
+                if (event.get('candidates') or [{}])[0].get('finishReason'):
+                    usage_metadata = event.get('usageMetadata', {})
+                    metrics.record_usage(model.value, usage_metadata)
+                    prompt_tokens = usage_metadata.get('promptTokenCount')
+                    if prompt_tokens:
+                        client.settle_tokens(model.value, estimated_tokens, prompt_tokens)
+                    metrics.record_stage("upstream", time.perf_counter() - started, model.value)
+
+                for candidate in (event.get('candidates') or [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            if first_output:
+                                metrics.record_stage("upstream_first_output", time.perf_counter() - started, model.value)
+                                first_output = False
+                            yield part['text']
+    except httpx.TimeoutException:
+        print(f"Timeout error: Gemini API stream stalled (>{client.timeout_seconds}s)")
+        metrics.GEMINI_TIMEOUTS.inc(model.value)
+        metrics.mark_error("timeout")
+        raise Exception(f"PDF processing timed out after {client.timeout_seconds} seconds without output.")
+    finally:
+        if uploaded_name:
+            await client.delete_file(uploaded_name, api_key)
 
 def get_available_models():
     """
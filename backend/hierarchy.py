@@ -0,0 +1,383 @@
+import re
+from typing import List, Optional, Tuple
+
+PART_KEYS = ("part1", "part2", "part3")
+
+
+def empty_document() -> dict:
+    """A section/name/partN document with no clauses yet"""
+    return {"section": "", "name": "", **{part_key: {"partItems": []} for part_key in PART_KEYS}}
+
+# Asks for one clause per line instead of nested JSON, which needs far fewer output tokens.
+# The nested document is rebuilt locally by build_document(); also part of the result cache key
+FLAT_PROMPT = '''You are a parsing engine that converts construction specification PDFs into a compact line format.
+
+⚠️ Do not infer, hallucinate, or generate content not explicitly present in the provided PDF.
+
+Your only source of truth is the actual text content extracted from the uploaded PDF. If a section, part, or clause does not exist in the file, do not invent it.
+
+---
+
+Extract only the technical specification content starting from "PART 1 - GENERAL", and return it in exactly this format, one entry per line:
+
+SECTION<TAB>233000
+NAME<TAB>HVAC AIR DISTRIBUTION
+PART 1
+1.01<TAB>SUMMARY
+A.<TAB>Section includes...
+1.<TAB>First subclause...
+a.<TAB>Nested subclause...
+PART 2
+2.01<TAB>...
+
+📌 Format Rules:
+- <TAB> is a single tab character. Each clause line is its number exactly as printed (e.g. 1.01, A., 1., a.), a tab, then the clause text.
+- List clauses in reading order. Do not indent and do not describe nesting; it is inferred from the numbering.
+- Keep each clause on one line. Write a line break inside a clause (e.g. in a table) as the two characters \\n.
+- Write "PART 1", "PART 2" or "PART 3" on its own line before that part's clauses. Omit parts that do not exist in the PDF.
+- Use only text that is part of the technical specification. Ignore headers, footers, text on cover pages and other miscellaneous metadata.
+
+Only return the lines. No JSON, no code fences, no commentary, no assumptions.
+'''
+
+# Lookalike characters that show up in extracted numbering, mapped to ASCII for classification
+_HOMOGLYPHS = str.maketrans({
+    "А": "A", "В": "B", "С": "C", "Е": "E", "Н": "H", "К": "K", "М": "M", "О": "O", "Р": "P", "Т": "T", "Х": "X",
+    "а": "a", "с": "c", "е": "e", "о": "o", "р": "p", "х": "x", "у": "y",
+    "Α": "A", "Β": "B", "Ε": "E", "Ζ": "Z", "Η": "H", "Ι": "I", "Κ": "K", "Μ": "M", "Ν": "N", "Ο": "O", "Ρ": "P",
+    "Τ": "T", "Υ": "Y", "Χ": "X", "ο": "o",
+})
+
+# MasterFormat numbering ladder, outermost first: 1.01 (or 1.1) -> A. -> 1. -> a.
+ARTICLE_RE = re.compile(r"^(\d+)\.(\d+)\.?$")
+UPPER_RE = re.compile(r"^([A-Z])\.$")
+NUMBER_RE = re.compile(r"^(\d+)\.$")
+LOWER_RE = re.compile(r"^([a-z])\.$")
+INDEX_STYLES = ("article", "upper", "number", "lower")
+
+PART_LINE_RE = re.compile(r"^PART\s+([123])\b", re.IGNORECASE)
+# Clause line without a tab: an index-looking token followed by whitespace
+UNTABBED_CLAUSE_RE = re.compile(r"^(\S{1,8}\.)\s+(.*)$")
+
+_ESCAPES = {"n": "\n", "t": "\t", "\\": "\\"}
+_ESCAPE_RE = re.compile(r"\\([nt\\])")
+
+
+def normalize_index(index: Optional[str]) -> str:
+    """Clause index stripped, with lookalike characters mapped to ASCII"""
+    return (index or "").strip().translate(_HOMOGLYPHS)
+
+
+def index_style(index: Optional[str]) -> str:
+    """Classify a clause index into one of INDEX_STYLES, or "other" """
+    index = normalize_index(index)
+    if ARTICLE_RE.match(index):
+        return "article"
+    if UPPER_RE.match(index):
+        return "upper"
+    if NUMBER_RE.match(index):
+        return "number"
+    if LOWER_RE.match(index):
+        return "lower"
+    return "other"
+
+
+def index_ordinal(index: Optional[str]) -> Optional[int]:
+    """Position of an index within its list: A./a./1. -> 1, 1.05 -> 5, or None"""
+    index = normalize_index(index)
+    match = ARTICLE_RE.match(index)
+    if match:
+        return int(match.group(2))
+    match = NUMBER_RE.match(index)
+    if match:
+        return int(match.group(1))
+    match = UPPER_RE.match(index) or LOWER_RE.match(index)
+    if match:
+        return ord(match.group(1).lower()) - ord("a") + 1
+    return None
+
+
+def _article_number(index: Optional[str]) -> Optional[Tuple[int, int]]:
+    """(part, article) of an article index: "2.05" -> (2, 5), or None"""
+    match = ARTICLE_RE.match(normalize_index(index))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def _is_letter(style: str) -> bool:
+    return style in ("upper", "lower")
+
+
+def _escape(text: str) -> str:
+    return (text or "").replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def _unescape(text: str) -> str:
+    return _ESCAPE_RE.sub(lambda match: _ESCAPES[match.group(1)], text)
+
+
+def flatten_document(document: dict) -> str:
+    """Render a parsed document in the FLAT_PROMPT line format"""
+    lines = [f"SECTION\t{_escape(document.get('section', ''))}", f"NAME\t{_escape(document.get('name', ''))}"]
+
+    def walk(items):
+        for item in items or []:
+            lines.append(f"{item.get('index', '')}\t{_escape(item.get('text', ''))}")
+            walk(item.get("children"))
+
+    for part_number, part_key in enumerate(PART_KEYS, start=1):
+        items = (document.get(part_key) or {}).get("partItems") or []
+        if items:
+            lines.append(f"PART {part_number}")
+            walk(items)
+    return "\n".join(lines) + "\n"
+
+
+class _Frame:
+    """One open level of the hierarchy: the list being filled and the last clause in it"""
+
+    __slots__ = ("items", "style", "ordinal", "node")
+
+    def __init__(self, items: list, style: str, ordinal: Optional[int], node: dict):
+        self.items = items
+        self.style = style
+        self.ordinal = ordinal
+        self.node = node
+
+
+class HierarchyBuilder:
+    """
+    Rebuilds the nested section/name/partN.partItems/children document from flat clauses
+
+    Nesting is inferred from the 1.01 -> A. -> 1. -> a. numbering ladder: a clause that
+    restarts a list (A., 1., a.) opens a new level under the previous clause, and any other
+    clause continues the nearest open list of the same style. Numbering problems are
+    repaired by placing the clause at the most plausible level and recorded in `issues`;
+    clauses are never renumbered or invented.
+
+    A letter that fits both an outer list and a deeper list of the other case ("C." after
+    "B. > 3. > b.") is held until the next clause: "d.", another "C." or a continuation of the
+    levels in between keeps it in the deeper list, anything else places it in the outer
+    one. Call finish() after the last line.
+    """
+
+    def __init__(self):
+        self.document = empty_document()
+        self.issues: List[dict] = []
+        self._part_number = 1
+        self._stack: List[_Frame] = []
+        self._line_number = 0
+        # Ambiguous clause waiting for the next one: (node, outer position, deeper position, line number)
+        self._pending: Optional[tuple] = None
+
+    def _issue(self, kind: str, index: str, message: str):
+        self.issues.append({
+            "line": self._line_number,
+            "part": f"part{self._part_number}",
+            "index": index,
+            "kind": kind,
+            "message": message,
+        })
+
+    def start_part(self, part_number: int):
+        self._resolve_pending(None, None)
+        if part_number == self._part_number and self._stack:
+            # Marker for the part an article already switched to: keep its clauses open
+            return
+        self._part_number = part_number
+        self._stack = []
+
+    def finish(self):
+        """Place a clause still waiting for lookahead; call after the last line"""
+        self._resolve_pending(None, None)
+
+    def _find_frame(self, style: str, ordinal: Optional[int]) -> Tuple[Optional[int], str]:
+        """
+        Choose the open level a continuing clause belongs to
+
+        Returns:
+            (stack position or None, issue kind or "")
+        """
+        same_style = [i for i in range(len(self._stack) - 1, -1, -1) if self._stack[i].style == style]
+        if ordinal is None:
+            return (same_style[0], "") if same_style else (None, "orphan")
+
+        for i in same_style:
+            if self._stack[i].ordinal is not None and ordinal == self._stack[i].ordinal + 1:
+                return i, ""
+        if _is_letter(style):
+            # "C." after "b." is a mis-cased continuation, not a new level
+            for i in range(len(self._stack) - 1, -1, -1):
+                frame = self._stack[i]
+                if _is_letter(frame.style) and frame.style != style and frame.ordinal is not None and ordinal == frame.ordinal + 1:
+                    return i, "case"
+        for i in same_style:
+            frame_ordinal = self._stack[i].ordinal
+            if frame_ordinal is None:
+                return i, ""
+            if ordinal > frame_ordinal:
+                return i, "gap"
+            if ordinal == frame_ordinal:
+                return i, "duplicate"
+            return i, "out_of_order"
+        return None, "orphan"
+
+    def _mis_cased_alternative(self, position: int, style: str, ordinal: int) -> Optional[int]:
+        """Deeper open list of the other letter case that the clause would also continue"""
+        if not _is_letter(style):
+            return None
+        for i in range(len(self._stack) - 1, position, -1):
+            frame = self._stack[i]
+            if _is_letter(frame.style) and frame.style != style and frame.ordinal is not None and ordinal == frame.ordinal + 1:
+                return i
+        return None
+
+    def _resolve_pending(self, next_style: Optional[str], next_ordinal: Optional[int]):
+        """Place the held clause now that the next clause (or the end of the part) is known"""
+        if self._pending is None:
+            return
+        node, outer, deeper, line_number = self._pending
+        self._pending = None
+
+        ordinal = index_ordinal(node["index"])
+        position, kind = outer, ""
+        if next_ordinal is not None:
+            if next_style == self._stack[deeper].style and next_ordinal == ordinal + 1:
+                position, kind = deeper, "case"
+            elif next_style == self._stack[outer].style and next_ordinal == ordinal:
+                # The outer list's own clause with this letter comes next
+                position, kind = deeper, "case"
+            elif any(
+                frame.style == next_style and frame.ordinal is not None and next_ordinal == frame.ordinal + 1
+                for frame in self._stack[outer + 1:deeper]
+            ):
+                # The next clause continues a level that the outer placement would close
+                position, kind = deeper, "case"
+
+        current_line = self._line_number
+        self._line_number = line_number
+        self._continue_frame(position, kind, node)
+        self._line_number = current_line
+
+    def _continue_frame(self, position: int, kind: str, node: dict):
+        frame = self._stack[position]
+        if kind in ("gap", "duplicate", "out_of_order"):
+            self._issue(kind, node["index"], f"Clause {node['index']} follows {frame.node['index']}")
+        elif kind == "case":
+            self._issue(kind, node["index"], f"Clause {node['index']} continues {frame.node['index']} with a different letter case")
+        frame.items.append(node)
+        del self._stack[position + 1:]
+        # A mis-cased letter keeps the list's style so the next clause still continues it
+        self._stack[position] = _Frame(frame.items, frame.style, index_ordinal(node["index"]), node)
+
+    def add_clause(self, index: str, text: str):
+        index = (index or "").strip()
+        node = {"index": index, "text": text, "children": None}
+        style = index_style(index)
+        ordinal = index_ordinal(index)
+        self._resolve_pending(style, ordinal)
+        part_items = self.document[f"part{self._part_number}"]["partItems"]
+
+        if style == "article":
+            number = _article_number(index)
+            if self._part_number < number[0] <= len(PART_KEYS):
+                # The PART marker was left out: the article's number says which part it starts
+                self._issue("part_missing", index, f"Article {index} starts PART {number[0]} without a PART line")
+                self.start_part(number[0])
+                part_items = self.document[f"part{self._part_number}"]["partItems"]
+            elif number[0] != self._part_number:
+                self._issue("part_mismatch", index, f"Article {index} is listed under PART {self._part_number}")
+            previous = _article_number(self._stack[0].node["index"]) if self._stack else None
+            if previous is not None and number != (previous[0], previous[1] + 1) and not (number[0] > previous[0] and number[1] == 1):
+                kind = "gap" if number > previous else ("duplicate" if number == previous else "out_of_order")
+                self._issue(kind, index, f"Article {index} follows {self._stack[0].node['index']}")
+            elif previous is None and part_items:
+                self._issue("orphan", index, f"Article {index} follows clauses that have no article")
+            part_items.append(node)
+            self._stack = [_Frame(part_items, style, ordinal, node)]
+            return
+
+        if ordinal == 1 or style == "other" and not any(frame.style == style for frame in self._stack):
+            # Start of a new list: nest under the previous clause
+            if self._stack:
+                parent = self._stack[-1].node
+                if parent["children"] is None:
+                    parent["children"] = []
+                target = parent["children"]
+            else:
+                if part_items:
+                    self._issue("orphan", index, f"Clause {index} is not under an article")
+                target = part_items
+            if target:
+                self._issue("duplicate", index, f"Clause {index} restarts a list that already has clauses")
+            target.append(node)
+            self._stack.append(_Frame(target, style, ordinal, node))
+            return
+
+        position, kind = self._find_frame(style, ordinal)
+        if position is None:
+            # Nothing to continue: the list's first clause is missing, so nest under the previous clause
+            if self._stack:
+                parent = self._stack[-1].node
+                if parent["children"] is None:
+                    parent["children"] = []
+                target = parent["children"]
+            else:
+                target = part_items
+            self._issue("gap", index, f"Clause {index} starts a list without its first clause")
+            target.append(node)
+            self._stack.append(_Frame(target, style, ordinal, node))
+            return
+
+        if kind == "":
+            deeper = self._mis_cased_alternative(position, style, ordinal)
+            if deeper is not None:
+                self._pending = (node, position, deeper, self._line_number)
+                return
+        self._continue_frame(position, kind, node)
+
+    def feed_line(self, line: str):
+        """Consume one line of FLAT_PROMPT output"""
+        self._line_number += 1
+        line = line.rstrip("\r\n")
+        stripped = line.strip()
+        if not stripped or stripped.startswith("```"):
+            return
+
+        head, tab, rest = line.partition("\t")
+        head = head.strip()
+        if tab and head.upper() == "SECTION":
+            self.document["section"] = _unescape(rest.strip())
+            return
+        if tab and head.upper() == "NAME":
+            self.document["name"] = _unescape(rest.strip())
+            return
+
+        part_match = PART_LINE_RE.match(stripped)
+        if part_match and not tab:
+            self.start_part(int(part_match.group(1)))
+            return
+
+        if not tab:
+            match = UNTABBED_CLAUSE_RE.match(stripped)
+            if match is None:
+                self._issue("unparsed", "", f"Line without a clause number: {stripped[:80]}")
+                return
+            head, rest = match.group(1), match.group(2)
+        self.add_clause(head, _unescape(rest))
+
+
+def build_document(flat_text: str) -> Tuple[dict, List[dict]]:
+    """
+    Build the nested document from FLAT_PROMPT output
+
+    Args:
+        flat_text: Model output, one clause per line
+
+    Returns:
+        Tuple of (document dict, list of numbering issues found and repaired)
+    """
+    builder = HierarchyBuilder()
+    for line in flat_text.splitlines():
+        builder.feed_line(line)
+    builder.finish()
+    return builder.document, builder.issues
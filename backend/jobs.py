@@ -0,0 +1,296 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import shutil
+import time
+import traceback
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from result_cache import write_text_atomic
+from uploads import PdfFile
+
+DEFAULT_JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs")
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Prefix of uploads spooled into the jobs directory before submit() claims them
+SPOOL_PREFIX = "upload-"
+
+# Processor signature: (PdfFile, model value, options) -> parsed JSON string
+JobProcessor = Callable[[PdfFile, str, dict], Awaitable[str]]
+
+
+class JobManager:
+    """
+    Bounded asyncio worker pool for batch parse jobs
+
+    Jobs are persisted as JSON records next to their input PDF, so pending work is requeued
+    after a restart. Lower priority values run first, and within a priority smaller PDFs run
+    first so they give fast feedback. Each model also has its own concurrency cap; a worker
+    only takes a job whose model has a free slot, so jobs for a saturated model never hold
+    workers that jobs for other models could use.
+    """
+
+    def __init__(
+        self,
+        processor: JobProcessor,
+        directory: str = DEFAULT_JOBS_DIR,
+        workers: int = 4,
+        model_concurrency: Optional[Dict[str, int]] = None,
+        default_model_concurrency: int = 2,
+    ):
+        self.processor = processor
+        self.directory = directory
+        self.worker_count = max(1, workers)
+        self.model_concurrency = dict(model_concurrency or {})
+        self.default_model_concurrency = max(1, default_model_concurrency)
+
+        self.jobs: Dict[str, dict] = {}
+        # model -> heap of (priority, size, sequence, job id)
+        self._pending: Dict[str, list] = {}
+        self._running: Dict[str, int] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, processor: JobProcessor) -> "JobManager":
+        """Create a manager configured from JOBS_* environment variables"""
+        model_concurrency = {}
+        # e.g. JOBS_MODEL_CONCURRENCY=gemini-2.5-pro:1,gemini-2.5-flash:4
+        for entry in os.getenv("JOBS_MODEL_CONCURRENCY", "").split(","):
+            if ":" in entry:
+                model, limit = entry.split(":", 1)
+                model_concurrency[model.strip()] = int(limit)
+        return cls(
+            processor,
+            directory=os.getenv("JOBS_DIR", DEFAULT_JOBS_DIR),
+            workers=int(os.getenv("JOBS_WORKERS", "4")),
+            model_concurrency=model_concurrency,
+            default_model_concurrency=int(os.getenv("JOBS_DEFAULT_MODEL_CONCURRENCY", "2")),
+        )
+
+    def _record_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _pdf_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.pdf")
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.result.json")
+
+    def _write_record(self, job: dict):
+        write_text_atomic(self._record_path(job["id"]), json.dumps(job))
+
+    async def _save(self, job: dict):
+        await asyncio.to_thread(self._write_record, dict(job))
+
+    def _model_limit(self, model: str) -> int:
+        return max(1, self.model_concurrency.get(model, self.default_model_concurrency))
+
+    def _enqueue(self, job: dict):
+        heap = self._pending.setdefault(job["model"], [])
+        heapq.heappush(heap, (job["priority"], job["size"], next(self._sequence), job["id"]))
+        self._wakeup.set()
+
+    def _take_ready(self) -> Optional[dict]:
+        """Pop the first queued job, in priority order, among models below their cap"""
+        while True:
+            model = None
+            for candidate, heap in self._pending.items():
+                if not heap or self._running.get(candidate, 0) >= self._model_limit(candidate):
+                    continue
+                if model is None or heap[0] < self._pending[model][0]:
+                    model = candidate
+            if model is None:
+                return None
+            job = self.jobs.get(heapq.heappop(self._pending[model])[3])
+            if job is not None and job["status"] == JOB_QUEUED:
+                self._running[model] = self._running.get(model, 0) + 1
+                return job
+
+    async def start(self):
+        """Load persisted jobs, requeue unfinished ones and start the workers"""
+        self._wakeup = asyncio.Event()
+        self._pending = {}
+        self._running = {}
+        requeued = 0
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith(SPOOL_PREFIX):
+                # Upload spooled before a crash, never turned into a job
+                os.remove(os.path.join(self.directory, name))
+                continue
+            if not name.endswith(".json") or name.endswith(".result.json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable job record {name}: {e}")
+                continue
+            self.jobs[job["id"]] = job
+            if job["status"] in (JOB_QUEUED, JOB_RUNNING):
+                # A job that was running when the process stopped starts again from scratch
+                job["status"] = JOB_QUEUED
+                job["started_at"] = None
+                self._enqueue(job)
+                requeued += 1
+        if requeued:
+            print(f"Requeued {requeued} unfinished jobs from {self.directory}")
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(
+        self,
+        batch_id: str,
+        filename: str,
+        pdf: PdfFile,
+        model: str,
+        priority: int = 0,
+        options: Optional[dict] = None,
+    ) -> dict:
+        """
+        Move a spooled PDF into the jobs directory and queue it for parsing
+
+        Args:
+            batch_id: Batch the job belongs to
+            filename: Original file name, for reporting
+            pdf: Spooled PDF; spool it into this manager's directory so the move is a rename
+            model: Gemini model value
+            priority: Lower values run first
+            options: Extra parse options passed through to the processor
+
+        Returns:
+            The job record
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "batch_id": batch_id,
+            "filename": filename,
+            "model": model,
+            "priority": priority,
+            "size": pdf.size,
+            "options": options or {},
+            "status": JOB_QUEUED,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+
+        def write_input():
+            shutil.move(pdf.path, self._pdf_path(job_id))
+            self._write_record(job)
+
+        await asyncio.to_thread(write_input)
+        self.jobs[job_id] = job
+        self._enqueue(job)
+        return job
+
+    async def _worker(self):
+        while True:
+            job = self._take_ready()
+            if job is None:
+                # Woken by a new job or a freed model slot
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                # e.g. the job record could not be saved; fail this job but keep the worker
+                print(f"Job {job['id']} failed: {e}")
+                print(traceback.format_exc())
+                job["status"] = JOB_FAILED
+                job["error"] = job["error"] or str(e)
+                job["finished_at"] = job["finished_at"] or time.time()
+            finally:
+                self._running[job["model"]] -= 1
+                self._wakeup.set()
+
+    async def _run(self, job: dict):
+        job["status"] = JOB_RUNNING
+        job["started_at"] = time.time()
+        await self._save(job)
+        print(f"Job {job['id']} started: {job['filename']} with {job['model']}")
+
+        try:
+            pdf = await asyncio.to_thread(PdfFile.from_path, self._pdf_path(job["id"]), job["filename"])
+            result = await self.processor(pdf, job["model"], job["options"])
+            await asyncio.to_thread(write_text_atomic, self._result_path(job["id"]), result)
+            job["status"] = JOB_DONE
+        except asyncio.CancelledError:
+            # Shutting down: leave the job queued on disk so it resumes on restart
+            job["status"] = JOB_QUEUED
+            job["started_at"] = None
+            await asyncio.shield(self._save(job))
+            raise
+        except Exception as e:
+            print(f"Job {job['id']} failed: {e}")
+            print(traceback.format_exc())
+            job["status"] = JOB_FAILED
+            job["error"] = str(e)
+
+        job["finished_at"] = time.time()
+        await self._save(job)
+        if job["status"] == JOB_DONE:
+            # The result is persisted; the input copy is no longer needed
+            try:
+                os.remove(self._pdf_path(job["id"]))
+            except FileNotFoundError:
+                pass
+        print(f"Job {job['id']} {job['status']} in {job['finished_at'] - job['started_at']:.2f}s")
+
+    async def spool(self, source) -> PdfFile:
+        """Spool an upload (or any object with async read(n)) into the jobs directory"""
+        return await PdfFile.from_upload(source, directory=self.directory, prefix=SPOOL_PREFIX)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    async def get_result(self, job_id: str) -> Optional[str]:
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] != JOB_DONE:
+            return None
+        return await asyncio.to_thread(_read_text, self._result_path(job_id))
+
+    def batch_status(self, batch_id: str) -> Optional[dict]:
+        """Counts by state and overall progress for a batch"""
+        jobs = [job for job in self.jobs.values() if job["batch_id"] == batch_id]
+        if not jobs:
+            return None
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        for job in jobs:
+            counts[job["status"]] += 1
+        finished = counts[JOB_DONE] + counts[JOB_FAILED]
+        return {
+            "batch_id": batch_id,
+            "total": len(jobs),
+            "counts": counts,
+            "progress": round(finished / len(jobs), 4),
+            "complete": finished == len(jobs),
+            "jobs": sorted(jobs, key=lambda job: job["created_at"]),
+        }
+
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
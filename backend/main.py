@@ -1,11 +1,53 @@
-from fastapi import FastAPI, File, UploadFile, Form
+from fastapi import FastAPI, File, UploadFile, Form, Body
+from typing import List
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from gemini_parser import parse_pdf_with_gemini, GeminiModel, get_available_models
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from gemini_parser import parse_pdf_with_gemini, stream_pdf_with_gemini, GeminiModel, get_available_models, PARSE_PROMPT
+from chunked_parser import (
+    parse_pdf_chunked,
+    count_pages,
+    CHUNK_PROMPT,
+    DEFAULT_MAX_CHUNK_PAGES,
+    DEFAULT_CHUNK_OVERLAP_PAGES,
+    DEFAULT_CHUNK_CONCURRENCY,
+)
+from gemini_client import GeminiClient, get_gemini_client, set_gemini_client
+from result_cache import ResultCache, make_cache_key, CACHE_MODES
+from jobs import JobManager, SPOOL_PREFIX
+from hierarchy import FLAT_PROMPT, build_document, empty_document
+from stream_parser import IncrementalDocumentParser, iter_document_events, EVENT_ITEM
+from uploads import PdfFile, CHUNK_SIZE
+from spec_store import SpecStore
+import fast_json
+import metrics
 import uvicorn
 import traceback
+import json
+import asyncio
+import time
+import os
+import tempfile
+import uuid
+import zipfile
+from contextlib import asynccontextmanager
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled Gemini client for the whole app so connections and TLS sessions are reused
+    client = GeminiClient.from_env()
+    set_gemini_client(client)
+    # Index stored sections in the background; search sees them as they load
+    spec_loader = asyncio.create_task(spec_store.load())
+    await job_manager.start()
+    try:
+        yield
+    finally:
+        spec_loader.cancel()
+        await job_manager.stop()
+        set_gemini_client(None)
+        await client.aclose()
 
-app = FastAPI(title="PDF Parser API", version="1.0.0")
+app = FastAPI(title="PDF Parser API", version="1.0.0", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -14,8 +56,244 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache", "Server-Timing"],
 )
 
+# Latency, bytes, status and Server-Timing for the parse endpoints; /metrics exposes the totals
+app.add_middleware(metrics.MetricsMiddleware, paths=("/upload", "/upload/stream", "/jobs"))
+
+# Parsed results keyed by PDF hash + model + prompt
+result_cache = ResultCache.from_env()
+
+# Latest parse of each section, indexed by clause path and full text
+spec_store = SpecStore.from_env()
+
+def _is_json(text: str) -> bool:
+    try:
+        json.loads(text)
+        return True
+    except ValueError:
+        return False
+
+def _document_response(data_text: str, extras: dict = None, headers: dict = None, valid: bool = None) -> Response:
+    """
+    Respond with {"data": <document>, **extras}, with the document as a JSON object
+
+    The document's JSON text is spliced into the body as-is instead of being parsed and
+    serialized again. Model output that is not valid JSON is returned as a string.
+
+    Args:
+        data_text: Parsed document as JSON text
+        extras: Additional top-level fields
+        headers: Response headers
+        valid: Whether data_text is valid JSON, when the caller already knows; None checks it
+    """
+    extras = extras or {}
+    with metrics.span("respond"):
+        if valid is None:
+            valid = _is_json(data_text)
+        if not valid:
+            return JSONResponse(content={"data": data_text, **extras}, headers=headers)
+        
+        body = b'{"data":' + data_text.encode()
+        if extras:
+            body += b',' + fast_json.dumps_bytes(extras)[1:]
+        else:
+            body += b'}'
+        return Response(content=body, media_type="application/json", headers=headers)
+
+# Model output formats for /upload: nested JSON, or flat lines rebuilt into JSON locally
+OUTPUT_FORMATS = ("json", "flat")
+
+async def run_parse(
+    pdf: PdfFile,
+    selected_model: GeminiModel,
+    cache_mode: str = "use",
+    chunk_options: dict = None,
+    output_format: str = "json",
+):
+    """
+    Parse a PDF through the result cache, whole or in chunks
+
+    Args:
+        pdf: PDF spooled to disk
+        selected_model: Gemini model to use
+        cache_mode: One of CACHE_MODES
+        chunk_options: max_pages/overlap/concurrency for chunked parsing, or None to send the whole PDF;
+            PDFs that fit in one chunk are sent whole
+        output_format: One of OUTPUT_FORMATS; "flat" is not combined with chunk_options
+
+    Returns:
+        Tuple of (parsed JSON string, cache status, extra response fields, whether the
+        string is valid JSON)
+    """
+    # Filled in by compute(); empty when the result came from the cache or another request
+    extras = {}
+    # The parsed document (None for invalid JSON), set by compute() so it is never parsed again
+    produced = {}
+    if chunk_options is not None and await asyncio.to_thread(count_pages, pdf) <= chunk_options["max_pages"]:
+        # Fits in one chunk: parse it whole with the normal prompt, sharing that cache entry
+        chunk_options = None
+        extras["chunks"] = []
+    if chunk_options is not None:
+        extras["chunks"] = []
+
+        async def compute():
+            merged_text, produced["document"], timings = await parse_pdf_chunked(pdf, selected_model, **chunk_options)
+            extras["chunks"].extend(timings)
+            return merged_text
+
+        # Chunk size and overlap change the prompts sent, so they are part of the key
+        key = make_cache_key(
+            pdf.sha256,
+            selected_model.value,
+            PARSE_PROMPT + CHUNK_PROMPT,
+            f"chunked:{chunk_options['max_pages']}:{chunk_options['overlap']}",
+        )
+    elif output_format == "flat":
+        extras["hierarchy_issues"] = []
+
+        async def compute():
+            flat_text = await parse_pdf_with_gemini(pdf, selected_model, prompt=FLAT_PROMPT, expect_json=False)
+            with metrics.span("hierarchy", selected_model.value):
+                document, issues = build_document(flat_text)
+            extras["hierarchy_issues"].extend(issues)
+            if issues:
+                print(f"Hierarchy builder repaired {len(issues)} numbering issues")
+            produced["document"] = document
+            return fast_json.dumps(document)
+
+        key = make_cache_key(pdf.sha256, selected_model.value, FLAT_PROMPT, "flat")
+    else:
+        async def compute():
+            text, produced["document"] = await parse_pdf_with_gemini(pdf, selected_model, with_document=True)
+            return text
+
+        key = make_cache_key(pdf.sha256, selected_model.value, PARSE_PROMPT)
+
+    parsed_text, cache_status = await result_cache.get_or_compute(
+        key,
+        compute,
+        mode=cache_mode,
+        should_store=lambda _: produced.get("document") is not None,  # Never cache unparseable model output
+    )
+    metrics.CACHE_RESULTS.inc(cache_status)
+    if "document" in produced:
+        document = produced["document"]
+        valid = document is not None
+        if valid:
+            await _store_spec(document, pdf.sha256, selected_model.value)
+    elif cache_status == "hit":
+        # Only valid JSON is cached
+        valid = True
+        if not spec_store.has_source(pdf.sha256):
+            await _store_spec(parsed_text, pdf.sha256, selected_model.value)
+    else:
+        # Coalesced onto another request, which stored the section itself
+        valid = _is_json(parsed_text)
+    return parsed_text, cache_status, extras, valid
+
+async def _store_spec(parsed, pdf_sha256: str, model: str):
+    """Ingest a parsed document (JSON text or dict) into the spec store; never fails the parse itself"""
+    try:
+        with metrics.span("spec_ingest", model):
+            document = json.loads(parsed) if isinstance(parsed, str) else parsed
+            await spec_store.ingest(document, source=pdf_sha256)
+    except ValueError:
+        pass  # Unparseable model output is returned to the caller but not stored
+    except Exception as e:
+        print(f"Could not store parsed section: {e}")
+
+def _parse_options_error(cache: str, chunked: bool, max_chunk_pages: int, chunk_overlap_pages: int, chunk_concurrency: int, output_format: str):
+    """Validation message for the shared /upload and /jobs parse options, or None"""
+    if cache not in CACHE_MODES:
+        return f"Invalid cache mode: {cache}. Available modes: {list(CACHE_MODES)}"
+    if output_format not in OUTPUT_FORMATS:
+        return f"Invalid output format: {output_format}. Available formats: {list(OUTPUT_FORMATS)}"
+    if chunked and (max_chunk_pages < 1 or chunk_overlap_pages < 0 or chunk_concurrency < 1):
+        return "max_chunk_pages and chunk_concurrency must be at least 1, chunk_overlap_pages at least 0"
+    if chunked and output_format != "json":
+        return "Chunked parsing only supports the json output format"
+    return None
+
+def _chunk_options(chunked: bool, max_chunk_pages: int, chunk_overlap_pages: int, chunk_concurrency: int):
+    if not chunked:
+        return None
+    return {
+        "max_pages": max_chunk_pages,
+        "overlap": chunk_overlap_pages,
+        "concurrency": chunk_concurrency,
+    }
+
+async def _process_job(pdf: PdfFile, model: str, options: dict) -> str:
+    parsed_text, _, _, _ = await run_parse(
+        pdf,
+        GeminiModel(model),
+        options.get("cache", "use"),
+        options.get("chunk_options"),
+        options.get("output_format", "json"),
+    )
+    return parsed_text
+
+# Batch jobs run on a bounded worker pool and persist to disk
+job_manager = JobManager.from_env(_process_job)
+
+# Limits on what one uploaded zip may expand to
+ZIP_MAX_MEMBERS = int(os.getenv("JOBS_ZIP_MAX_MEMBERS", "500"))
+ZIP_MAX_BYTES = int(float(os.getenv("JOBS_ZIP_MAX_MB", "1024")) * 1024 * 1024)
+
+class ZipLimitError(ValueError):
+    """A zip upload has too many PDFs or expands past ZIP_MAX_BYTES"""
+
+def _expand_upload(spooled: PdfFile) -> List[PdfFile]:
+    """
+    Return the spooled PDF itself, or each PDF inside a spooled zip
+
+    Zip members are extracted to their own spool files in the jobs directory, one chunk
+    at a time. Raises ZipLimitError past ZIP_MAX_MEMBERS PDFs or ZIP_MAX_BYTES extracted;
+    the byte limit is enforced while copying, not only from the sizes the zip declares.
+    Blocking, so call via asyncio.to_thread.
+    """
+    if not spooled.filename.lower().endswith('.zip'):
+        return [spooled]
+    
+    documents = []
+    try:
+        with zipfile.ZipFile(spooled.path) as archive:
+            members = [
+                info for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith('.pdf') and not info.filename.startswith('__MACOSX/')
+            ]
+            if len(members) > ZIP_MAX_MEMBERS:
+                raise ZipLimitError(f"{spooled.filename} has {len(members)} PDFs; the limit is {ZIP_MAX_MEMBERS}")
+            if sum(info.file_size for info in members) > ZIP_MAX_BYTES:
+                raise ZipLimitError(f"{spooled.filename} expands to more than {ZIP_MAX_BYTES // (1024 * 1024)} MB")
+            
+            remaining = ZIP_MAX_BYTES
+            for info in members:
+                fd, path = tempfile.mkstemp(suffix=".pdf", prefix=SPOOL_PREFIX, dir=job_manager.directory)
+                try:
+                    with os.fdopen(fd, "wb") as target, archive.open(info) as source:
+                        while True:
+                            chunk = source.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            remaining -= len(chunk)
+                            if remaining < 0:
+                                raise ZipLimitError(f"{spooled.filename} expands to more than {ZIP_MAX_BYTES // (1024 * 1024)} MB")
+                            target.write(chunk)
+                except BaseException:
+                    os.remove(path)
+                    raise
+                documents.append(PdfFile.from_path(path, info.filename, owned=True))
+    except BaseException:
+        for document in documents:
+            document.cleanup()
+        raise
+    finally:
+        spooled.cleanup()
+    return documents
+
 @app.get("/")
 async def root():
     return {"message": "PDF Parser API is running"}
@@ -35,10 +313,31 @@ async def get_models():
         ]
     }
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters and sizes of the result cache"""
+    return result_cache.snapshot()
+
+@app.get("/gemini/stats")
+async def get_gemini_stats():
+    """Per-model request, retry, throttle and rate-limit queue-wait counters"""
+    return get_gemini_client().snapshot()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: request and stage latency, bytes, errors, in-flight requests and Gemini token usage"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.post("/upload")
 async def upload_file(
     pdf: UploadFile = File(...),
-    model: str = Form("gemini-2.5-flash")  # Default to Gemini 2.5 Flash
+    model: str = Form("gemini-2.5-flash"),  # Default to Gemini 2.5 Flash
+    cache: str = Form("use"),  # "use", "bypass" or "refresh"
+    chunked: bool = Form(False),  # Parse page-range chunks concurrently and merge
+    max_chunk_pages: int = Form(DEFAULT_MAX_CHUNK_PAGES),
+    chunk_overlap_pages: int = Form(DEFAULT_CHUNK_OVERLAP_PAGES),
+    chunk_concurrency: int = Form(DEFAULT_CHUNK_CONCURRENCY),
+    output_format: str = Form("json")  # "json", or "flat" to rebuild the hierarchy locally
 ):
     if not pdf.filename.lower().endswith('.pdf'):
         return JSONResponse(
@@ -56,14 +355,25 @@ async def upload_file(
                 content={"error": f"Invalid model: {model}. Available models: {[m.value for m in GeminiModel]}"}
             )
         
+        options_error = _parse_options_error(cache, chunked, max_chunk_pages, chunk_overlap_pages, chunk_concurrency, output_format)
+        if options_error:
+            return JSONResponse(status_code=400, content={"error": options_error})
+        
+        metrics.set_model(selected_model.value)
         print(f"Processing PDF: {pdf.filename}, size: {pdf.size} bytes with model: {selected_model.value}")
-        content = await pdf.read()
-        print(f"PDF content read successfully, length: {len(content)} bytes")
+        # Spool to disk in chunks instead of holding the whole upload in memory
+        with metrics.span("upload_read"):
+            pdf_file = await PdfFile.from_upload(pdf)
         
-        parsed_text = await parse_pdf_with_gemini(content, selected_model)
-        print(f"PDF parsed successfully, response length: {len(parsed_text)} characters")
+        try:
+            chunk_options = _chunk_options(chunked, max_chunk_pages, chunk_overlap_pages, chunk_concurrency)
+            parsed_text, cache_status, extras, valid = await run_parse(pdf_file, selected_model, cache, chunk_options, output_format)
+        finally:
+            pdf_file.cleanup()
+        print(f"PDF parsed successfully ({cache_status}), response length: {len(parsed_text)} characters")
         
-        return JSONResponse(content={"data": parsed_text})
+        # Extras (chunk timings, hierarchy issues) are empty when the result came from the cache
+        return _document_response(parsed_text, extras, {"X-Cache": cache_status}, valid=valid)
     except Exception as e:
         error_msg = f"Error processing PDF: {str(e)}"
         print(error_msg)
@@ -74,5 +384,302 @@ async def upload_file(
             content={"error": error_msg}
         )
 
+# Streaming output formats for /upload/stream
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+def _format_event(event: str, payload: dict, stream_format: str) -> str:
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {fast_json.dumps(payload)}\n\n"
+    return fast_json.dumps({"event": event, **payload}) + "\n"
+
+def _apply_event(document: dict, event: tuple):
+    """Add one IncrementalDocumentParser event to a document being assembled"""
+    if event[0] == EVENT_ITEM:
+        _, part_key, item = event
+        document[part_key]["partItems"].append(item)
+    else:
+        kind, value = event
+        document[kind] = value
+
+@app.post("/upload/stream")
+async def upload_file_stream(
+    pdf: UploadFile = File(...),
+    model: str = Form("gemini-2.5-flash"),
+    cache: str = Form("use"),  # "use", "bypass" or "refresh"
+    format: str = Form("ndjson"),  # "ndjson" or "sse"
+    include_document: bool = Form(True)  # Send the complete document in the final event
+):
+    """
+    Parse a PDF and stream section, name and each top-level clause as soon as it is generated
+
+    Events are "section", "name", "item" (with "part" and "item"), then "done" with the
+    complete document, or "error". With include_document=false the final event carries only
+    counts, and the server never holds more than one clause of the output at a time.
+    """
+    if not pdf.filename.lower().endswith('.pdf'):
+        return JSONResponse(
+            status_code=400, 
+            content={"error": "Only PDF files are allowed"}
+        )
+    
+    try:
+        selected_model = GeminiModel(model)
+    except ValueError:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Invalid model: {model}. Available models: {[m.value for m in GeminiModel]}"}
+        )
+    
+    if cache not in CACHE_MODES:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Invalid cache mode: {cache}. Available modes: {list(CACHE_MODES)}"}
+        )
+    
+    if format not in STREAM_MEDIA_TYPES:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Invalid format: {format}. Available formats: {list(STREAM_MEDIA_TYPES)}"}
+        )
+    
+    metrics.set_model(selected_model.value)
+    print(f"Streaming PDF: {pdf.filename}, size: {pdf.size} bytes with model: {selected_model.value}")
+    with metrics.span("upload_read"):
+        pdf_file = await PdfFile.from_upload(pdf)
+    key = make_cache_key(pdf_file.sha256, selected_model.value, PARSE_PROMPT)
+    
+    async def produce(document: dict = None):
+        """Model output as events; when given a document, assembles and stores it once the stream ends"""
+        parser = IncrementalDocumentParser()
+        async for text in stream_pdf_with_gemini(pdf_file, selected_model):
+            for event in parser.feed(text):
+                if document is not None:
+                    _apply_event(document, event)
+                yield event
+        if not parser.done:
+            raise Exception("Model output ended before the document was complete")
+        if document is not None:
+            if cache != "bypass":
+                await result_cache.put(key, fast_json.dumps(document))
+            await _store_spec(document, pdf_file.sha256, selected_model.value)
+    
+    async def produce_shared():
+        try:
+            async for event in produce(empty_document()):
+                yield event
+        finally:
+            pdf_file.cleanup()
+    
+    async def replay(cached_document: dict):
+        for event in iter_document_events(cached_document):
+            yield event
+    
+    async def events():
+        started = time.perf_counter()
+        document = empty_document()
+        item_count = 0
+        first_item_seconds = None
+        source = None
+        # False once a shared stream has taken over the spooled PDF
+        owns_file = True
+        try:
+            cached = await result_cache.get(key) if cache == "use" else None
+            if cached is not None and _is_json(cached):
+                cache_status = "hit"
+                cached_document = json.loads(cached)
+                source = replay(cached_document)
+                if not spec_store.has_source(pdf_file.sha256):
+                    await _store_spec(cached_document, pdf_file.sha256, selected_model.value)
+            elif include_document and cache != "bypass":
+                # Concurrent misses for the same PDF share one upstream stream
+                source, cache_status = result_cache.join_stream(key, produce_shared, cache)
+                owns_file = cache_status != "miss"
+            else:
+                # Sharing needs every event buffered, so streams without the document are not shared
+                cache_status = "miss" if cache != "bypass" else "bypass"
+                source = produce(empty_document() if include_document else None)
+            
+            async for event in source:
+                if event[0] == EVENT_ITEM:
+                    _, part_key, item = event
+                    if first_item_seconds is None:
+                        first_item_seconds = round(time.perf_counter() - started, 3)
+                    if include_document:
+                        document[part_key]["partItems"].append(item)
+                    yield _format_event("item", {"part": part_key, "position": item_count, "item": item}, format)
+                    item_count += 1
+                else:
+                    kind, value = event
+                    document[kind] = value
+                    yield _format_event(kind, {"value": value}, format)
+            
+            final = {
+                "items": item_count,
+                "seconds": round(time.perf_counter() - started, 3),
+                "first_item_seconds": first_item_seconds,
+                "cache": cache_status,
+            }
+            if include_document:
+                final["document"] = document
+            print(f"PDF streamed successfully ({cache_status}): {item_count} items in {final['seconds']}s")
+            yield _format_event("done", final, format)
+        except Exception as e:
+            error_msg = f"Error processing PDF: {str(e)}"
+            print(error_msg)
+            print(traceback.format_exc())
+            metrics.mark_error()
+            yield _format_event("error", {"error": error_msg}, format)
+        finally:
+            if source is not None:
+                await source.aclose()
+            if owns_file:
+                pdf_file.cleanup()
+    
+    return StreamingResponse(
+        events(),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/jobs")
+async def create_jobs(
+    files: List[UploadFile] = File(...),
+    model: str = Form("gemini-2.5-flash"),
+    priority: int = Form(0),  # Lower runs first; within a priority smaller PDFs run first
+    cache: str = Form("use"),
+    chunked: bool = Form(False),
+    max_chunk_pages: int = Form(DEFAULT_MAX_CHUNK_PAGES),
+    chunk_overlap_pages: int = Form(DEFAULT_CHUNK_OVERLAP_PAGES),
+    chunk_concurrency: int = Form(DEFAULT_CHUNK_CONCURRENCY),
+    output_format: str = Form("json")
+):
+    """Queue PDFs (or zips of PDFs) for background parsing and return their job IDs"""
+    try:
+        selected_model = GeminiModel(model)
+    except ValueError:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Invalid model: {model}. Available models: {[m.value for m in GeminiModel]}"}
+        )
+    
+    options_error = _parse_options_error(cache, chunked, max_chunk_pages, chunk_overlap_pages, chunk_concurrency, output_format)
+    if options_error:
+        return JSONResponse(status_code=400, content={"error": options_error})
+    
+    for upload in files:
+        if not upload.filename.lower().endswith(('.pdf', '.zip')):
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Only PDF or zip files are allowed: {upload.filename}"}
+            )
+    
+    metrics.set_model(selected_model.value)
+    documents = []
+    for upload in files:
+        with metrics.span("upload_read"):
+            spooled = await job_manager.spool(upload)
+        try:
+            documents.extend(await asyncio.to_thread(_expand_upload, spooled))
+        except zipfile.BadZipFile:
+            for document in documents:
+                document.cleanup()
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Invalid zip file: {upload.filename}"}
+            )
+        except ZipLimitError as e:
+            for document in documents:
+                document.cleanup()
+            return JSONResponse(status_code=400, content={"error": str(e)})
+    
+    if not documents:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "No PDF files found in the upload"}
+        )
+    
+    options = {
+        "cache": cache,
+        "chunk_options": _chunk_options(chunked, max_chunk_pages, chunk_overlap_pages, chunk_concurrency),
+        "output_format": output_format,
+    }
+    
+    batch_id = uuid.uuid4().hex
+    jobs = [
+        await job_manager.submit(batch_id, document.filename, document, selected_model.value, priority, options)
+        for document in documents
+    ]
+    print(f"Queued batch {batch_id} with {len(jobs)} jobs using model: {selected_model.value}")
+    
+    return JSONResponse(
+        status_code=202,
+        content={
+            "batch_id": batch_id,
+            "jobs": [{"id": job["id"], "filename": job["filename"], "status": job["status"]} for job in jobs],
+        }
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status, plus the parsed result once it is done"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Job not found: {job_id}"})
+    
+    result = await job_manager.get_result(job_id)
+    if result is None:
+        return job
+    return _document_response(result, job)
+
+@app.get("/specs")
+async def list_specs():
+    """Every stored section with its revision and clause count"""
+    return {"sections": spec_store.list_sections(), **spec_store.snapshot()}
+
+@app.post("/specs")
+async def store_spec(document: dict = Body(...)):
+    """Store an already parsed document (the `data` of an /upload response)"""
+    result = await spec_store.ingest(document)
+    if result["status"] == "skipped":
+        return JSONResponse(status_code=400, content={"error": result["reason"]})
+    return result
+
+@app.get("/specs/{section}")
+async def get_spec(section: str):
+    """Latest stored revision of a section, e.g. /specs/233000 or /specs/23%2030%2000"""
+    record = await spec_store.get_section(section)
+    if record is None:
+        return JSONResponse(status_code=404, content={"error": f"Section not found: {section}"})
+    return record
+
+@app.get("/specs/{section}/items/{path:path}")
+async def get_spec_item(section: str, path: str, part: str = None):
+    """One clause by its index chain, e.g. /specs/233000/items/2.03.B.4, with its children and parents"""
+    clause = await spec_store.get_clause(section, path, part)
+    if clause is None:
+        return JSONResponse(status_code=404, content={"error": f"Clause not found: {section} {path}"})
+    return clause
+
+@app.get("/search")
+async def search_specs(q: str, section: str = None, limit: int = 20, offset: int = 0):
+    """Clauses across stored sections that contain every word of q"""
+    if limit < 1 or limit > 200 or offset < 0:
+        return JSONResponse(status_code=400, content={"error": "limit must be between 1 and 200, offset at least 0"})
+    started = time.perf_counter()
+    result = await spec_store.search(q, section, limit, offset)
+    result["took_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Progress of every job in a batch"""
+    status = job_manager.batch_status(batch_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": f"Batch not found: {batch_id}"})
+    return status
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
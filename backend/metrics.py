@@ -0,0 +1,270 @@
+import bisect
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers sub-millisecond local stages up to multi-minute Gemini calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, object] = {}
+        REGISTRY.append(self)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonic total per label combination"""
+
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Current value per label combination"""
+
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Bucketed observations per label combination; rendered cumulatively"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            # [per-bucket counts (last is +Inf), sum]
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+# Every metric registers itself here in definition order
+REGISTRY: List[_Metric] = []
+
+REQUEST_SECONDS = Histogram("pdf_parser_request_seconds", "Time from request start to the last response byte", ("endpoint", "model"))
+REQUESTS = Counter("pdf_parser_requests_total", "Requests handled, by response status", ("endpoint", "model", "status"))
+REQUEST_ERRORS = Counter("pdf_parser_request_errors_total", "Failed requests; kind is timeout or error", ("endpoint", "model", "kind"))
+IN_FLIGHT = Gauge("pdf_parser_requests_in_flight", "Requests currently being handled", ("endpoint",))
+REQUEST_BYTES = Counter("pdf_parser_request_bytes_total", "Request body bytes received from clients", ("endpoint",))
+RESPONSE_BYTES = Counter("pdf_parser_response_bytes_total", "Response body bytes sent to clients", ("endpoint",))
+STAGE_SECONDS = Histogram("pdf_parser_stage_seconds", "Time spent in each parse stage", ("model", "stage"))
+CACHE_RESULTS = Counter("pdf_parser_cache_results_total", "Result cache outcomes", ("status",))
+
+GEMINI_REQUESTS = Counter("gemini_requests_total", "Gemini API attempts, including retries, by HTTP status", ("model", "status"))
+GEMINI_RETRIES = Counter("gemini_retries_total", "Gemini API attempts that were retried", ("model",))
+GEMINI_TIMEOUTS = Counter("gemini_timeouts_total", "Gemini API calls that timed out", ("model",))
+GEMINI_BYTES = Counter("gemini_bytes_total", "Bytes exchanged with the Gemini API", ("model", "direction"))
+GEMINI_TOKENS = Counter("gemini_tokens_total", "Tokens reported in Gemini usageMetadata", ("model", "type"))
+
+# usageMetadata field -> token type label
+_USAGE_FIELDS = {
+    "promptTokenCount": "prompt",
+    "candidatesTokenCount": "output",
+    "thoughtsTokenCount": "thinking",
+    "cachedContentTokenCount": "cached",
+    "totalTokenCount": "total",
+}
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class RequestTimings:
+    """Stage durations collected while one request is handled, for its Server-Timing header"""
+
+    __slots__ = ("model", "error", "stages")
+
+    def __init__(self):
+        self.model = ""
+        self.error: Optional[str] = None
+        # stage -> [total seconds, count]; stages of concurrent chunks add up
+        self.stages: Dict[str, list] = {}
+
+    def add(self, stage: str, seconds: float):
+        entry = self.stages.get(stage)
+        if entry is None:
+            self.stages[stage] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def server_timing(self, total_seconds: Optional[float] = None) -> str:
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, (seconds, _) in self.stages.items()]
+        if total_seconds is not None:
+            entries.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+    def summary(self) -> str:
+        return ", ".join(f"{stage} {seconds:.3f}s" for stage, (seconds, _) in self.stages.items())
+
+
+# Timings of the request being handled; asyncio tasks started by it share the same object
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def set_model(model: str):
+    """Label the current request's metrics with the model it uses"""
+    timings = _current.get()
+    if timings is not None:
+        timings.model = model
+
+
+def mark_error(kind: str = "error"):
+    """Count the current request as failed even if its status is 200, e.g. a streamed error event"""
+    timings = _current.get()
+    if timings is not None and timings.error is None:
+        timings.error = kind
+
+
+def record_stage(stage: str, seconds: float, model: Optional[str] = None):
+    timings = _current.get()
+    if model is None:
+        model = timings.model if timings is not None else ""
+    STAGE_SECONDS.observe(seconds, model, stage)
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str, model: Optional[str] = None):
+    """Time a block as one parse stage, e.g. `with span("upstream", model.value):`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, model)
+
+
+def record_usage(model: str, usage_metadata: Optional[dict]):
+    """Count the tokens in a Gemini usageMetadata object"""
+    for field, token_type in _USAGE_FIELDS.items():
+        count = (usage_metadata or {}).get(field)
+        if count:
+            GEMINI_TOKENS.inc(model, token_type, amount=count)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times requests to the given paths
+
+    Tracks in-flight requests, body bytes in and out, latency to the last response byte
+    and status, and adds a Server-Timing header with the stages recorded while the
+    request was handled. Streaming responses get the header when they start, so it
+    only covers the stages finished by then.
+    """
+
+    def __init__(self, app, paths: Sequence[str]):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = scope["path"]
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        status = [500]
+        IN_FLIGHT.inc(endpoint)
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                REQUEST_BYTES.inc(endpoint, amount=len(message.get("body", b"")))
+            return message
+
+        async def timing_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                header = timings.server_timing(time.perf_counter() - started)
+                if header:
+                    message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header.encode())]}
+            elif message["type"] == "http.response.body":
+                RESPONSE_BYTES.inc(endpoint, amount=len(message.get("body", b"")))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, timing_send)
+        finally:
+            IN_FLIGHT.dec(endpoint)
+            model = timings.model
+            REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, model)
+            REQUESTS.inc(endpoint, model, str(status[0]))
+            if timings.error is not None or status[0] >= 500:
+                REQUEST_ERRORS.inc(endpoint, model, timings.error or "error")
+            _current.reset(token)
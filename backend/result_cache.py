@@ -0,0 +1,376 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+# Cache-control values accepted by /upload
+CACHE_USE = "use"          # Serve from cache when possible, store fresh results
+CACHE_BYPASS = "bypass"    # Skip the cache entirely (no read, no write)
+CACHE_REFRESH = "refresh"  # Skip the read, re-parse and overwrite the stored entry
+CACHE_MODES = (CACHE_USE, CACHE_BYPASS, CACHE_REFRESH)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+
+def sha256_hex(data) -> str:
+    """Hex SHA-256 of bytes or a string"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_text_atomic(path: str, text: str):
+    """
+    Write a UTF-8 text file so readers see either the old or the new contents
+
+    The temporary file is unique per writer thread, so concurrent writes of one path
+    cannot clobber each other, and it is removed if the write fails.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def make_cache_key(pdf_digest: str, model: str, prompt: str, variant: str = "") -> str:
+    """
+    Build a content-addressed cache key
+
+    Args:
+        pdf_digest: SHA-256 hex digest of the PDF bytes
+        model: Gemini model value, e.g. "gemini-2.5-flash"
+        prompt: Prompt text sent alongside the PDF
+        variant: Extra discriminator for parse options that change the output
+
+    Returns:
+        Hex key that is safe to use as a file name
+    """
+    return sha256_hex("\n".join([pdf_digest, model, sha256_hex(prompt), variant]))
+
+
+class StreamBroadcast:
+    """
+    Events of one in-flight stream, kept so callers that join late get them from the start
+
+    The producer publishes every event and then finishes, with an error if it failed;
+    each subscriber iterates the events it has not seen yet and waits for more.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._published = asyncio.Event()
+
+    def publish(self, event):
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        # Wake current subscribers; later waits use a fresh event
+        published, self._published = self._published, asyncio.Event()
+        published.set()
+
+    async def subscribe(self) -> AsyncIterator:
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._published.wait()
+
+
+class ResultCache:
+    """
+    Two-tier cache for parse results: an in-memory LRU in front of a directory of JSON files.
+
+    Concurrent lookups of the same key are coalesced so only one upstream call is made.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = DEFAULT_CACHE_DIR,
+        max_memory_entries: int = 64,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+        ttl_seconds: float = 7 * 24 * 3600,
+    ):
+        self.directory = directory
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()  # key -> (stored_at, value)
+        self._inflight = {}           # key -> asyncio.Task
+        self._streams = {}            # key -> StreamBroadcast
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "stores": 0,
+            "evictions": 0,
+            "bypassed": 0,
+            "disk_errors": 0,
+        }
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        """Create a cache configured from RESULT_CACHE_* environment variables"""
+        directory = os.getenv("RESULT_CACHE_DIR", DEFAULT_CACHE_DIR)
+        return cls(
+            directory=directory or None,
+            max_memory_entries=int(os.getenv("RESULT_CACHE_MEMORY_ENTRIES", "64")),
+            max_disk_bytes=int(os.getenv("RESULT_CACHE_DISK_MB", "512")) * 1024 * 1024,
+            ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+        )
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if self._expired(stored_at):
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: str, value: str, stored_at: Optional[float] = None):
+        self._memory[key] = (stored_at if stored_at is not None else time.time(), value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _disk_get(self, key: str):
+        """Return (stored_at, value) from disk, or None when missing or expired"""
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if self._expired(stored_at):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = f.read()
+            # Bump the access time so disk eviction is least-recently-used
+            os.utime(path, (time.time(), stored_at))
+            return stored_at, value
+        except FileNotFoundError:
+            return None
+
+    def _disk_put(self, key: str, value: str):
+        if not self.directory:
+            return
+        write_text_atomic(self._path(key), value)
+        self._disk_evict()
+
+    def _disk_evict(self):
+        """Drop expired files, then least-recently-used files until under max_disk_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if self._expired(st.st_mtime):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self.stats["evictions"] += 1
+                continue
+            entries.append((st.st_atime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats["evictions"] += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a key in memory, then on disk (promoting disk hits into memory)"""
+        value = self._memory_get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+
+        entry = await asyncio.to_thread(self._disk_get, key)
+        if entry is not None:
+            stored_at, value = entry
+            self._memory_put(key, value, stored_at)
+            self.stats["disk_hits"] += 1
+            return value
+        return None
+
+    async def put(self, key: str, value: str):
+        """Store a value; disk errors are logged and leave the entry memory-only"""
+        self._memory_put(key, value)
+        self.stats["stores"] += 1
+        try:
+            await asyncio.to_thread(self._disk_put, key, value)
+        except OSError as e:
+            self.stats["disk_errors"] += 1
+            print(f"Could not write cache entry {key[:12]} to disk: {e}")
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[str]],
+        mode: str = CACHE_USE,
+        should_store: Optional[Callable[[str], bool]] = None,
+    ):
+        """
+        Return the cached value for key, computing and storing it on a miss
+
+        Concurrent callers for the same key share one in-flight computation. Failed
+        computations are not cached and the error is raised to every waiter.
+
+        Args:
+            key: Cache key from make_cache_key
+            compute: Coroutine factory that produces the value
+            mode: One of CACHE_MODES
+            should_store: Optional predicate; values it rejects are returned but not cached
+
+        Returns:
+            Tuple of (value, status) where status is "hit", "miss", "coalesced" or "bypass"
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode: {mode}. Expected one of {list(CACHE_MODES)}")
+
+        if mode == CACHE_BYPASS:
+            self.stats["bypassed"] += 1
+            return await compute(), "bypass"
+
+        if mode == CACHE_USE:
+            value = await self.get(key)
+            if value is not None:
+                return value, "hit"
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task), "coalesced"
+
+        self.stats["misses"] += 1
+
+        async def run():
+            try:
+                value = await compute()
+                if should_store is None or should_store(value):
+                    await self.put(key, value)
+                return value
+            finally:
+                self._inflight.pop(key, None)
+
+        # Run as a separate task so a cancelled leader does not fail the followers
+        task = asyncio.ensure_future(run())
+        self._inflight[key] = task
+        return await asyncio.shield(task), "miss"
+
+    def join_stream(
+        self,
+        key: str,
+        produce: Callable[[], AsyncIterator],
+        mode: str = CACHE_USE,
+    ) -> Tuple[AsyncIterator, str]:
+        """
+        Share one in-flight event stream among concurrent callers for the same key
+
+        The first caller starts produce() as a separate task and later callers replay its
+        events from the start, so a cache miss makes one upstream call however many
+        requests are waiting on it. The producer is responsible for storing the result;
+        it keeps running when the caller that started it goes away.
+
+        Args:
+            key: Cache key from make_cache_key
+            produce: Async generator factory for the events
+            mode: One of CACHE_MODES; bypass never shares a stream
+
+        Returns:
+            Tuple of (event iterator, status) where status is "miss", "coalesced" or "bypass"
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode: {mode}. Expected one of {list(CACHE_MODES)}")
+
+        if mode == CACHE_BYPASS:
+            self.stats["bypassed"] += 1
+            return produce(), "bypass"
+
+        broadcast = self._streams.get(key)
+        if broadcast is not None:
+            self.stats["coalesced"] += 1
+            return broadcast.subscribe(), "coalesced"
+
+        self.stats["misses"] += 1
+        broadcast = self._streams[key] = StreamBroadcast()
+
+        async def run():
+            try:
+                async for event in produce():
+                    broadcast.publish(event)
+                broadcast.finish()
+            except Exception as e:
+                broadcast.finish(e)
+            finally:
+                if not broadcast.done:
+                    broadcast.finish(asyncio.CancelledError())
+                self._streams.pop(key, None)
+
+        # Held by the broadcast so the task is not garbage collected while it runs
+        broadcast.task = asyncio.ensure_future(run())
+        return broadcast.subscribe(), "miss"
+
+    def snapshot(self) -> dict:
+        """Counters plus current sizes, for the stats endpoint"""
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return {
+            **self.stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "inflight": len(self._inflight) + len(self._streams),
+        }
@@ -0,0 +1,668 @@
+import asyncio
+import bisect
+import json
+import os
+import re
+import time
+from array import array
+from collections import OrderedDict
+from itertools import compress
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import fast_json
+from hierarchy import ARTICLE_RE, PART_KEYS, normalize_index
+from result_cache import sha256_hex, write_text_atomic
+
+DEFAULT_SPECS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "specs")
+
+# Tokens of clause text and search queries: runs of letters and digits, case-folded
+TOKEN_RE = re.compile(r"[0-9a-z]+")
+# "shall" is in most specification clauses, so it only slows searches down
+STOPWORDS = frozenset("a an and are as at be by for from in is it of on or shall that the this to with".split())
+
+# PDF digests remembered per section, so cached parses of the same PDF are not re-ingested
+MAX_SOURCES = 20
+
+# Compact the clause id space once dead ids outnumber live ones (and there are at least this many)
+COMPACT_MIN_DEAD = 10000
+
+# Clauses rank by token count; longer ones all rank last together
+MAX_RANK_LENGTH = 255
+
+# Joins the fields of a clause's in-memory search entry
+ENTRY_SEPARATOR = "\x1f"
+
+# Intersect posting lists by binary search when the other list is this many times longer
+BISECT_RATIO = 16
+
+# Queries whose rarest term is in more than 1/BITMAP_RATIO of all clause ids are answered
+# from cached bitmaps instead of posting lists
+BITMAP_RATIO = 256
+
+# From _prepare: path map, then per clause its ranking length, distinct tokens and search entry
+_Prepared = Tuple[Dict[str, int], List[int], List[set], List[bytes]]
+
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(bits: int) -> int:
+        return bin(bits).count("1")
+
+
+def section_key(section: Optional[str]) -> str:
+    """Normalized section number: "23 30 00", "23-30-00" and "233000" are the same section"""
+    return re.sub(r"[^0-9A-Za-z.]", "", section or "").upper().strip(".")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [token for token in TOKEN_RE.findall((text or "").casefold()) if token not in STOPWORDS]
+
+
+def _path_segment(index: Optional[str]) -> str:
+    """One clause path segment: "A." -> "A", "2.3" -> "2.03" """
+    index = normalize_index(index)
+    match = ARTICLE_RE.match(index)
+    if match:
+        return f"{int(match.group(1))}.{int(match.group(2)):02d}"
+    return index.rstrip(".").strip()
+
+
+def normalize_path(path: str) -> List[str]:
+    """
+    Candidate stored keys for a requested clause path such as "2.03.B.4" or "2.3/B/4"
+
+    A leading "<number>.<number>" is read as an article first, then as two plain segments.
+    """
+    segments = [segment.strip() for segment in normalize_index(path).replace("/", ".").split(".") if segment.strip()]
+    candidates = []
+    if len(segments) >= 2 and segments[0].isdigit() and segments[1].isdigit():
+        candidates.append(".".join([f"{int(segments[0])}.{int(segments[1]):02d}"] + segments[2:]))
+    candidates.append(".".join(segments))
+    return candidates
+
+
+def document_error(document) -> Optional[str]:
+    """Why a document does not have the section/name/partN shape, or None if it does"""
+    if not isinstance(document, dict):
+        return "Document must be a JSON object"
+    for field in ("section", "name"):
+        if document.get(field) is not None and not isinstance(document[field], str):
+            return f"{field} must be a string"
+    for part_key in PART_KEYS:
+        part = document.get(part_key)
+        if part is None:
+            continue
+        if not isinstance(part, dict):
+            return f"{part_key} must be an object"
+        pending = [(part.get("partItems"), f"{part_key}.partItems")]
+        while pending:
+            items, where = pending.pop()
+            if items is None:
+                continue
+            if not isinstance(items, list):
+                return f"{where} must be a list"
+            for i, item in enumerate(items):
+                if not isinstance(item, dict):
+                    return f"{where}[{i}] must be an object"
+                for field in ("index", "text"):
+                    if item.get(field) is not None and not isinstance(item[field], str):
+                        return f"{where}[{i}].{field} must be a string"
+                pending.append((item.get("children"), f"{where}[{i}].children"))
+    return None
+
+
+def _record_error(record) -> Optional[str]:
+    """Why a stored record cannot be indexed, or None"""
+    if not isinstance(record, dict):
+        return "record must be a JSON object"
+    for field, kind in (("section", str), ("name", str), ("revision", int), ("updated_at", (int, float)), ("sha256", str)):
+        if not isinstance(record.get(field), kind):
+            return f"record has no valid {field}"
+    if not isinstance(record.get("sources", []), list):
+        return "sources must be a list"
+    return document_error(record.get("document"))
+
+
+def iter_clauses(document: dict) -> Iterator[Tuple[str, str, int, dict]]:
+    """
+    Every clause of a parsed document in reading order
+
+    Yields:
+        (part key, clause path such as "2.03.B.4", position of the parent clause or -1, clause dict)
+    """
+    position = 0
+    for part_key in PART_KEYS:
+        items = (document.get(part_key) or {}).get("partItems") or []
+        # Depth-first without recursion: children come before the next sibling
+        pending = [(item, "", -1) for item in reversed(items)]
+        while pending:
+            item, parent_path, parent_position = pending.pop()
+            if not isinstance(item, dict):
+                continue
+            segment = _path_segment(item.get("index"))
+            path = f"{parent_path}.{segment}" if parent_path else segment
+            yield part_key, path, parent_position, item
+            for child in reversed(item.get("children") or []):
+                pending.append((child, path, position))
+            position += 1
+
+
+def _to_bits(ids) -> int:
+    """Bitmap (bit i set for each id i) of sorted clause ids"""
+    if not len(ids):
+        return 0
+    base = ids[0] & ~7
+    bits = bytearray(((ids[-1] - base) >> 3) + 1)
+    for clause_id in ids:
+        clause_id -= base
+        bits[clause_id >> 3] |= 1 << (clause_id & 7)
+    return int.from_bytes(bits, "little") << base
+
+
+def _bit_ids(bits: int, count: int) -> List[int]:
+    """The `count` lowest ids set in a bitmap, ascending"""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    ids = []
+    for match in _NONZERO_BYTE.finditer(data):
+        base = match.start() * 8
+        byte = data[match.start()]
+        for bit in range(8):
+            if byte >> bit & 1:
+                ids.append(base + bit)
+        if len(ids) >= count:
+            break
+    return ids[:count]
+
+
+def _intersect(ids, other: array) -> list:
+    """Sorted ids that are also in `other`, a sorted posting list"""
+    if len(other) > BISECT_RATIO * len(ids):
+        matches = []
+        for clause_id in ids:
+            j = bisect.bisect_left(other, clause_id)
+            if j < len(other) and other[j] == clause_id:
+                matches.append(clause_id)
+        return matches
+    return sorted(set(ids).intersection(other))
+
+
+def _length_bitmaps(lengths, first_id: int) -> Dict[int, int]:
+    """Ranking length -> bitmap of the clause ids with it, for per-clause lengths from first_id on"""
+    by_length: Dict[int, List[int]] = {}
+    for clause_id, length in enumerate(lengths, start=first_id):
+        by_length.setdefault(length, []).append(clause_id)
+    return {length: _to_bits(ids) for length, ids in by_length.items()}
+
+
+class _Section:
+    """In-memory entry for the current revision of a section; the document itself stays on disk"""
+
+    __slots__ = ("key", "section", "name", "revision", "updated_at", "sha256", "sources", "first_id", "clause_count",
+                 "paths", "entries", "entry_ends")
+
+    def __init__(self, key: str, record: dict, first_id: int, paths: Dict[str, int], entries: List[bytes]):
+        self.key = key
+        self.section = record["section"]
+        self.name = record["name"]
+        self.revision = record["revision"]
+        self.updated_at = record["updated_at"]
+        self.sha256 = record["sha256"]
+        self.sources = list(record.get("sources", []))
+        # Clause ids of this revision are first_id + position in reading order
+        self.first_id = first_id
+        self.clause_count = len(entries)
+        # Clause path -> position of its first occurrence
+        self.paths = paths
+        # Search result fields of every clause, packed; clause i ends at entry_ends[i]
+        self.entries = b"".join(entries)
+        self.entry_ends = array("I")
+        end = 0
+        for entry in entries:
+            end += len(entry)
+            self.entry_ends.append(end)
+
+    def entry(self, position: int) -> List[str]:
+        """(part key, path, index, text) of the clause at a reading-order position"""
+        start = self.entry_ends[position - 1] if position else 0
+        return self.entries[start:self.entry_ends[position]].decode("utf-8").split(ENTRY_SEPARATOR, 3)
+
+    def summary(self) -> dict:
+        return {
+            "section": self.section,
+            "name": self.name,
+            "revision": self.revision,
+            "updated_at": self.updated_at,
+            "clauses": self.clause_count,
+        }
+
+
+class SpecStore:
+    """
+    Persistent store of parsed sections with an in-memory clause and full-text index
+
+    The latest revision of each section is a JSON file in `directory`. Memory holds only
+    compact structures: per section a clause path map and its clauses' search result
+    fields packed in one buffer, and an inverted index from token to sorted clause ids
+    (uint32 arrays). Queries on common terms are answered from bitmaps of those ids, built
+    on first use and cached. Ingesting a new revision of a section marks its old clause
+    ids dead and appends new ones, so only that section is re-indexed; dead ids are
+    compacted away once they outnumber live ones. Whole documents (for get_section and
+    get_clause) are read from disk, with the most recently used ones kept parsed.
+
+    Index updates happen on the event loop, so readers never see a half-indexed section.
+    """
+
+    def __init__(self, directory: str = DEFAULT_SPECS_DIR, max_cached_documents: int = 256):
+        self.directory = directory
+        self.max_cached_documents = max(1, max_cached_documents)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.sections: Dict[str, _Section] = {}
+        self._sources: Dict[str, str] = {}  # PDF digest -> section key
+        self._postings: Dict[str, array] = {}
+        # Per clause id: owning section key, token count (for ranking), and whether it is current
+        self._clause_section: List[str] = []
+        self._clause_length = bytearray()
+        self._alive = bytearray()
+        self._dead = 0
+        # Bitmaps over clause ids: dead ids, per token (with how much of its posting list
+        # they cover), and per ranking length (covering ids below _length_bits_end)
+        self._dead_bits = 0
+        self._token_bits: Dict[str, Tuple[int, int]] = {}
+        self._length_bits = [0] * (MAX_RANK_LENGTH + 1)
+        self._length_bits_end = 0
+        # Bumped by _compact, which renumbers clause ids
+        self._generation = 0
+        self.loading = False
+        # section key -> (document, clauses from iter_clauses)
+        self._documents: "OrderedDict[str, Tuple[dict, list]]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SpecStore":
+        """Create a store configured from SPECS_* environment variables"""
+        return cls(
+            directory=os.getenv("SPECS_DIR", DEFAULT_SPECS_DIR),
+            max_cached_documents=int(os.getenv("SPECS_MAX_CACHED_DOCUMENTS", "256")),
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read_record(self, key: str) -> dict:
+        with open(self._path(key), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_record(self, key: str, record: dict):
+        write_text_atomic(self._path(key), fast_json.dumps(record))
+
+    def _read_prepared(self, key: str) -> Tuple[dict, _Prepared]:
+        """Read, check and prepare one stored record; blocking, so call via asyncio.to_thread"""
+        record = self._read_record(key)
+        error = _record_error(record)
+        if error:
+            raise ValueError(error)
+        return record, self._prepare(record)
+
+    async def load(self):
+        """
+        Index every stored section
+
+        Files are read and tokenized in a worker thread, one section at a time, and each is
+        indexed on the event loop as soon as it is ready, so the app serves requests (and
+        finds the sections loaded so far) while a large store loads. A section ingested
+        meanwhile is not replaced by its older file. The ranking bitmaps are then built in
+        the worker thread too.
+        """
+        self.loading = True
+        try:
+            names = await asyncio.to_thread(lambda: sorted(os.listdir(self.directory)))
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                key = name[:-len(".json")]
+                try:
+                    record, prepared = await asyncio.to_thread(self._read_prepared, key)
+                except (OSError, ValueError) as e:
+                    print(f"Skipping unreadable spec record {name}: {e}")
+                    continue
+                async with self._lock:
+                    existing = self.sections.get(key)
+                    if existing is None or existing.revision < record["revision"]:
+                        self._index(key, record, prepared)
+
+            # Rank bitmaps for everything loaded, so the first search does not build them
+            generation, end = self._generation, len(self._alive)
+            bitmaps = await asyncio.to_thread(_length_bitmaps, bytes(self._clause_length[:end]), 0)
+            if self._generation == generation and self._length_bits_end == 0:
+                self._add_length_bits(bitmaps, end)
+        finally:
+            self.loading = False
+        if self.sections:
+            print(f"Indexed {len(self.sections)} sections ({len(self._alive) - self._dead} clauses) from {self.directory}")
+
+    @staticmethod
+    def _prepare(record: dict) -> _Prepared:
+        """
+        Everything _index needs from a record, computed without touching the index
+
+        Returns:
+            (path -> position of its first occurrence, then per clause in reading order:
+            ranking length, distinct tokens, and the encoded result entry)
+        """
+        paths: Dict[str, int] = {}
+        lengths = []
+        token_sets = []
+        entries = []
+        for position, (part_key, path, _, item) in enumerate(iter_clauses(record["document"])):
+            paths.setdefault(path, position)
+            tokens = tokenize(item.get("text"))
+            lengths.append(min(len(tokens), MAX_RANK_LENGTH))
+            token_sets.append(set(tokens))
+            entries.append(ENTRY_SEPARATOR.join((part_key, path, item.get("index") or "", item.get("text") or "")).encode("utf-8"))
+        return paths, lengths, token_sets, entries
+
+    def _index(self, key: str, record: dict, prepared: _Prepared):
+        """Make `record`, already run through _prepare, the indexed revision of a section"""
+        paths, lengths, token_sets, entries = prepared
+        old = self.sections.get(key)
+        if old is not None:
+            self._alive[old.first_id:old.first_id + old.clause_count] = bytes(old.clause_count)
+            self._dead += old.clause_count
+            self._dead_bits |= ((1 << old.clause_count) - 1) << old.first_id
+            self._documents.pop(key, None)
+
+        first_id = len(self._alive)
+        self._clause_section.extend([key] * len(entries))
+        self._clause_length.extend(lengths)
+        self._alive.extend(b"\x01" * len(entries))
+        postings_get = self._postings.get
+        for clause_id, tokens in enumerate(token_sets, start=first_id):
+            for token in tokens:
+                postings = postings_get(token)
+                if postings is None:
+                    postings = self._postings[token] = array("I")
+                postings.append(clause_id)
+
+        section = _Section(key, record, first_id, paths, entries)
+        self.sections[key] = section
+        for source in section.sources:
+            self._sources[source] = key
+
+        if self._dead >= COMPACT_MIN_DEAD and self._dead > len(self._alive) - self._dead:
+            self._compact()
+
+    def _bits(self, token: str) -> int:
+        """Bitmap of a token's posting list, extended with ids appended since it was cached"""
+        postings = self._postings[token]
+        covered, bits = self._token_bits.get(token, (0, 0))
+        if covered < len(postings):
+            bits |= _to_bits(postings[covered:])
+            self._token_bits[token] = (len(postings), bits)
+        return bits
+
+    def _lengths(self) -> List[int]:
+        """Per ranking length, the bitmap of clause ids with that length"""
+        end = len(self._alive)
+        if self._length_bits_end < end:
+            self._add_length_bits(_length_bitmaps(self._clause_length[self._length_bits_end:end], self._length_bits_end), end)
+        return self._length_bits
+
+    def _add_length_bits(self, bitmaps: Dict[int, int], end: int):
+        for length, bits in bitmaps.items():
+            self._length_bits[length] |= bits
+        self._length_bits_end = end
+
+    def _compact(self):
+        """Renumber live clause ids densely and drop dead ones from every posting list"""
+        new_ids = array("i", [-1]) * len(self._alive)
+        next_id = 0
+        for clause_id, alive in enumerate(self._alive):
+            if alive:
+                new_ids[clause_id] = next_id
+                next_id += 1
+
+        for token in list(self._postings):
+            postings = array("I", (new_ids[clause_id] for clause_id in self._postings[token] if self._alive[clause_id]))
+            if postings:
+                self._postings[token] = postings
+            else:
+                del self._postings[token]
+
+        self._clause_section = list(compress(self._clause_section, self._alive))
+        self._clause_length = bytearray(compress(self._clause_length, self._alive))
+        for section in self.sections.values():
+            section.first_id = new_ids[section.first_id] if section.clause_count else 0
+        self._alive = bytearray(b"\x01") * next_id
+        self._dead = 0
+        self._dead_bits = 0
+        self._token_bits.clear()
+        self._length_bits = [0] * (MAX_RANK_LENGTH + 1)
+        self._length_bits_end = 0
+        self._generation += 1
+
+    async def _document(self, key: str) -> Tuple[dict, list]:
+        """Parsed document and its clause list, through a small LRU"""
+        cached = self._documents.get(key)
+        if cached is not None:
+            self._documents.move_to_end(key)
+            return cached
+        record = await asyncio.to_thread(self._read_record, key)
+        cached = (record, list(iter_clauses(record["document"])))
+        # The section may have been re-ingested while the file was being read
+        if self.sections.get(key) is not None and self.sections[key].sha256 == record["sha256"]:
+            self._documents[key] = cached
+            while len(self._documents) > self.max_cached_documents:
+                self._documents.popitem(last=False)
+        return cached
+
+    def has_source(self, pdf_sha256: str) -> bool:
+        """True if a PDF with this digest has already been ingested"""
+        return pdf_sha256 in self._sources
+
+    async def ingest(self, document: dict, source: str = "") -> dict:
+        """
+        Store a parsed document as the latest revision of its section
+
+        Args:
+            document: Parsed section/name/partN document
+            source: SHA-256 of the PDF it was parsed from, if any
+
+        Returns:
+            Dict with "status" (created, updated, unchanged or skipped), "section" and "revision"
+        """
+        error = document_error(document)
+        if error:
+            return {"status": "skipped", "section": None, "revision": None, "reason": error}
+        key = section_key(document.get("section"))
+        if not key:
+            return {"status": "skipped", "section": None, "revision": None, "reason": "Document has no section number"}
+
+        digest = sha256_hex(fast_json.dumps(document))
+        async with self._lock:
+            existing = self.sections.get(key)
+            if existing is not None and existing.sha256 == digest:
+                if source and source not in existing.sources:
+                    existing.sources = (existing.sources + [source])[-MAX_SOURCES:]
+                    self._sources[source] = key
+                return {"status": "unchanged", "section": existing.section, "revision": existing.revision}
+
+            sources = list(existing.sources) if existing is not None else []
+            if source and source not in sources:
+                sources = (sources + [source])[-MAX_SOURCES:]
+            record = {
+                "section": document.get("section", ""),
+                "name": document.get("name") or "",
+                "revision": existing.revision + 1 if existing is not None else 1,
+                "updated_at": time.time(),
+                "sha256": digest,
+                "sources": sources,
+                "document": document,
+            }
+            # Tokenize before writing, so a document that cannot be indexed never replaces the stored one
+            prepared = await asyncio.to_thread(self._prepare, record)
+            await asyncio.to_thread(self._write_record, key, record)
+            self._index(key, record, prepared)
+            status = "updated" if existing is not None else "created"
+            print(f"Spec store {status} section {record['section']} (revision {record['revision']}, {self.sections[key].clause_count} clauses)")
+            return {"status": status, "section": record["section"], "revision": record["revision"]}
+
+    def list_sections(self) -> List[dict]:
+        return [self.sections[key].summary() for key in sorted(self.sections)]
+
+    async def get_section(self, section: str) -> Optional[dict]:
+        """Stored record (metadata and document) of a section, or None"""
+        key = section_key(section)
+        if key not in self.sections:
+            return None
+        record, _ = await self._document(key)
+        return record
+
+    async def get_clause(self, section: str, path: str, part: Optional[str] = None) -> Optional[dict]:
+        """
+        Look up one clause by its path, e.g. "2.03.B.4"
+
+        Args:
+            section: Section number in any spacing, e.g. "23 30 00"
+            path: Clause indexes joined with "." or "/"; trailing dots are optional
+            part: Restrict to one part key, for paths that repeat across parts
+
+        Returns:
+            The clause with its children and parent chain, or None
+        """
+        key = section_key(section)
+        entry = self.sections.get(key)
+        if entry is None:
+            return None
+        record, clauses = await self._document(key)
+
+        position = None
+        for candidate in normalize_path(path):
+            found = entry.paths.get(candidate)
+            if found is not None and part is not None and clauses[found][0] != part:
+                found = next((i for i, clause in enumerate(clauses) if clause[1] == candidate and clause[0] == part), None)
+            if found is not None:
+                position = found
+                break
+        if position is None:
+            return None
+
+        part_key, clause_path, parent, item = clauses[position]
+        parents = []
+        while parent >= 0:
+            _, parent_path, grandparent, parent_item = clauses[parent]
+            parents.append({"path": parent_path, "index": parent_item.get("index"), "text": parent_item.get("text")})
+            parent = grandparent
+        return {
+            "section": record["section"],
+            "name": record["name"],
+            "revision": record["revision"],
+            "part": part_key,
+            "path": clause_path,
+            "parents": parents[::-1],
+            **item,
+        }
+
+    async def search(self, query: str, section: Optional[str] = None, limit: int = 20, offset: int = 0) -> dict:
+        """
+        Clauses whose text contains every query term
+
+        Results are ordered by how much of the clause the query covers (shorter clauses
+        first), then by section and reading order.
+
+        Returns:
+            Dict with "total" and the requested page of "results"
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        empty = {"query": query, "terms": terms, "total": 0, "results": []}
+        if not terms:
+            return empty
+
+        postings = []
+        for term in terms:
+            if not self._postings.get(term):
+                return empty
+            postings.append((len(self._postings[term]), term))
+        postings.sort()
+
+        if section:
+            entry = self.sections.get(section_key(section))
+            if entry is None:
+                return empty
+            total, page = self._match_ids(postings, entry.first_id, entry.first_id + entry.clause_count, offset, limit)
+        elif postings[0][0] * BITMAP_RATIO > len(self._alive):
+            total, page = self._match_bits(postings, offset, limit)
+        else:
+            total, page = self._match_ids(postings, 0, len(self._alive), offset, limit)
+
+        # Built from memory without awaiting, so an ingest cannot renumber the ids meanwhile
+        results = []
+        for clause_id in page:
+            entry = self.sections[self._clause_section[clause_id]]
+            part_key, path, index, text = entry.entry(clause_id - entry.first_id)
+            results.append({
+                "section": entry.section,
+                "name": entry.name,
+                "part": part_key,
+                "path": path,
+                "index": index,
+                "text": text,
+            })
+        return {"query": query, "terms": terms, "total": total, "results": results}
+
+    def _match_ids(self, postings: List[Tuple[int, str]], low: int, high: int, offset: int, limit: int) -> Tuple[int, List[int]]:
+        """
+        Match count and ranked page of clause ids in [low, high) containing every token,
+        by intersecting posting lists; for rare terms or a single section
+        """
+        rarest = self._postings[postings[0][1]]
+        matches = rarest[bisect.bisect_left(rarest, low):bisect.bisect_left(rarest, high)]
+        for _, token in postings[1:]:
+            matches = _intersect(matches, self._postings[token])
+        if self._dead:
+            matches = [clause_id for clause_id in matches if self._alive[clause_id]]
+        # Stable, so clauses of equal length stay in id (section, reading) order
+        ranked = sorted(matches, key=self._clause_length.__getitem__)
+        return len(matches), ranked[offset:offset + limit]
+
+    def _match_bits(self, postings: List[Tuple[int, str]], offset: int, limit: int) -> Tuple[int, List[int]]:
+        """
+        Match count and ranked page of clause ids containing every token, from bitmaps;
+        for common terms, where posting lists are too long to walk per query
+        """
+        bits = self._bits(postings[0][1])
+        for _, token in postings[1:]:
+            bits &= self._bits(token)
+        if self._dead:
+            bits &= ~self._dead_bits
+
+        page = []
+        skip = offset
+        for length_bits in self._lengths():
+            hits = bits & length_bits
+            if not hits:
+                continue
+            if skip:
+                count = _popcount(hits)
+                if count <= skip:
+                    skip -= count
+                    continue
+            page.extend(_bit_ids(hits, skip + limit - len(page))[skip:])
+            skip = 0
+            if len(page) >= limit:
+                break
+        return _popcount(bits), page
+
+    def snapshot(self) -> dict:
+        return {
+            "section_count": len(self.sections),
+            "clauses": len(self._alive) - self._dead,
+            "dead_clause_ids": self._dead,
+            "terms": len(self._postings),
+            "cached_documents": len(self._documents),
+            "entry_bytes": sum(len(section.entries) for section in self.sections.values()),
+            "cached_bitmaps": len(self._token_bits),
+            "loading": self.loading,
+        }
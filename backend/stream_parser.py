@@ -0,0 +1,163 @@
+import json
+import re
+from typing import Iterator, List, Optional, Tuple
+
+from hierarchy import PART_KEYS
+
+# Next character that can end or escape a JSON string
+_STRING_SPECIAL_RE = re.compile(r'["\\]')
+
+# Events produced by IncrementalDocumentParser.feed()
+EVENT_SECTION = "section"
+EVENT_NAME = "name"
+EVENT_ITEM = "item"
+
+
+class IncrementalDocumentParser:
+    """
+    Incremental scanner for the section/name/partN.partItems document as it streams in
+
+    Feed it model output in arbitrary pieces. It emits "section" and "name" as soon as their
+    string values close, and each top-level partItems entry as soon as its object closes.
+    Only the entry currently being received is buffered, so memory stays bounded by the
+    largest single clause rather than the whole document. Text before the first "{" (such
+    as a ```json fence) and after the document closes is ignored.
+    """
+
+    def __init__(self):
+        # Each frame is [container type "{" or "[", current key, expecting a key]
+        self._stack: List[list] = []
+        self._in_string = False
+        self._escape = False
+        self._done = False
+
+        # Raw text of the string or partItems entry being captured
+        self._capture: Optional[List[str]] = None
+        self._capture_kind: Optional[str] = None  # "key", "value" or "item"
+        self._capture_depth = 0
+        self._capture_part: Optional[str] = None
+
+        self.items_emitted = 0
+
+    @property
+    def done(self) -> bool:
+        """True once the top-level object has closed"""
+        return self._done
+
+    def _item_part(self) -> Optional[str]:
+        """Part key if an object opened now would be a top-level partItems entry"""
+        if len(self._stack) != 3:
+            return None
+        root, part, items = self._stack
+        if root[0] == "{" and part[0] == "{" and items[0] == "[" and root[1] in PART_KEYS and part[1] == "partItems":
+            return root[1]
+        return None
+
+    def _finish_string(self, raw: str) -> Iterator[Tuple]:
+        frame = self._stack[-1] if self._stack else None
+        kind = self._capture_kind
+        if kind == "key":
+            frame[1] = json.loads(raw)
+            frame[2] = False
+        elif kind == "value":
+            key = frame[1]
+            event = EVENT_SECTION if key == "section" else EVENT_NAME
+            yield (event, json.loads(raw))
+
+    def feed(self, text: str) -> Iterator[Tuple]:
+        """
+        Consume the next piece of model output
+
+        Yields:
+            ("section", str), ("name", str) or ("item", part_key, item_dict) tuples
+        """
+        if self._done:
+            return
+        i = 0
+        n = len(text)
+        # Start of the slice of `text` that belongs to the active capture
+        capture_from = 0 if self._capture is not None else None
+
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                match = _STRING_SPECIAL_RE.search(text, i)
+                if match is None:
+                    i = n
+                    break
+                i = match.start()
+                if text[i] == "\\":
+                    self._escape = True
+                    i += 1
+                    continue
+                # Closing quote
+                self._in_string = False
+                i += 1
+                if self._capture_kind in ("key", "value"):
+                    self._capture.append(text[capture_from:i])
+                    raw = "".join(self._capture)
+                    self._capture = None
+                    capture_from = None
+                    yield from self._finish_string(raw)
+                    self._capture_kind = None
+                continue
+
+            ch = text[i]
+            if ch == '"':
+                self._in_string = True
+                frame = self._stack[-1] if self._stack else None
+                if self._capture is None and frame is not None and frame[0] == "{":
+                    if frame[2]:
+                        self._capture_kind = "key"
+                    elif len(self._stack) == 1 and frame[1] in ("section", "name"):
+                        self._capture_kind = "value"
+                    if self._capture_kind is not None:
+                        self._capture = []
+                        capture_from = i
+            elif ch == "{" or ch == "[":
+                if ch == "{" and self._capture is None:
+                    part = self._item_part()
+                    if part is not None:
+                        self._capture = []
+                        self._capture_kind = "item"
+                        self._capture_depth = len(self._stack)
+                        self._capture_part = part
+                        capture_from = i
+                if not self._stack and ch == "[":
+                    # Not our document shape; keep scanning for the top-level object
+                    i += 1
+                    continue
+                self._stack.append([ch, None, ch == "{"])
+            elif ch == "}" or ch == "]":
+                if self._stack:
+                    self._stack.pop()
+                if self._capture_kind == "item" and len(self._stack) == self._capture_depth:
+                    self._capture.append(text[capture_from:i + 1])
+                    item = json.loads("".join(self._capture))
+                    self._capture = None
+                    self._capture_kind = None
+                    capture_from = None
+                    self.items_emitted += 1
+                    yield (EVENT_ITEM, self._capture_part, item)
+                if not self._stack:
+                    self._done = True
+                    return
+            elif ch == ",":
+                if self._stack and self._stack[-1][0] == "{":
+                    self._stack[-1][2] = True
+            i += 1
+
+        if self._capture is not None and capture_from is not None:
+            self._capture.append(text[capture_from:])
+
+
+def iter_document_events(document: dict) -> Iterator[Tuple]:
+    """Events for an already parsed document, in the same shape feed() produces"""
+    yield (EVENT_SECTION, document.get("section", ""))
+    yield (EVENT_NAME, document.get("name", ""))
+    for part_key in PART_KEYS:
+        for item in (document.get(part_key) or {}).get("partItems") or []:
+            yield (EVENT_ITEM, part_key, item)
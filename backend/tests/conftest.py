@@ -0,0 +1,15 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+# The backend modules are imported as top-level modules, as uvicorn does from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main builds its result cache, job manager and spec store from the environment on import
+_STATE_DIR = tempfile.mkdtemp(prefix="pdf-parser-tests-")
+atexit.register(shutil.rmtree, _STATE_DIR, True)
+for _name in ("RESULT_CACHE_DIR", "JOBS_DIR", "SPECS_DIR"):
+    os.environ[_name] = os.path.join(_STATE_DIR, _name.lower())
+os.environ.setdefault("GEMINI_API_KEY", "test")
@@ -0,0 +1,251 @@
+import asyncio
+import copy
+import glob
+import os
+import shutil
+
+import pytest
+
+import chunked_parser
+from chunked_parser import merge_chunk_documents, merge_items
+from uploads import PdfFile
+
+DOCUMENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "documents")
+
+
+def sample_pdf(prefix: str) -> PdfFile:
+    (path,) = glob.glob(os.path.join(DOCUMENTS_DIR, f"{prefix}*.pdf"))
+    return PdfFile.from_path(path)
+
+
+def clause(index, text, children=None):
+    return {"index": index, "text": text, "children": children}
+
+
+def document(part1=None, part2=None, section="", name=""):
+    return {
+        "section": section,
+        "name": name,
+        "part1": {"partItems": part1 or []},
+        "part2": {"partItems": part2 or []},
+        "part3": {"partItems": []},
+    }
+
+
+def indexes(items):
+    return [(item["index"], indexes(item["children"] or [])) for item in items]
+
+
+def test_overlap_page_is_not_duplicated():
+    first = document([
+        clause("1.01", "SUMMARY", [clause("A.", "Section includes ducts.")]),
+        clause("1.02", "SUBMITTALS", [clause("A.", "Product data.")]),
+    ], section="233000", name="HVAC AIR DISTRIBUTION")
+    second = document([
+        clause("1.02", "SUBMITTALS", [clause("A.", "Product data."), clause("B.", "Shop drawings.")]),
+        clause("1.03", "QUALITY ASSURANCE"),
+    ])
+
+    merged = merge_chunk_documents([first, second])
+
+    assert merged["section"] == "233000"
+    assert merged["name"] == "HVAC AIR DISTRIBUTION"
+    assert indexes(merged["part1"]["partItems"]) == [
+        ("1.01", [("A.", [])]),
+        ("1.02", [("A.", []), ("B.", [])]),
+        ("1.03", []),
+    ]
+
+
+def test_repeated_parent_continues_cut_clause():
+    first = document([clause("1.05", "SUBMITTALS", [clause("A.", "Product Data: For each type of")])])
+    second = document([clause("1.05", "SUBMITTALS", [
+        clause("A.", "Product Data: For each type of product indicated."),
+        clause("B.", "Samples."),
+    ])])
+
+    items = merge_chunk_documents([first, second])["part1"]["partItems"]
+
+    assert indexes(items) == [("1.05", [("A.", []), ("B.", [])])]
+    assert items[0]["children"][0]["text"] == "Product Data: For each type of product indicated."
+
+
+def test_orphaned_continuation_goes_to_each_clause_level():
+    first = document([clause("1.05", "SUBMITTALS", [
+        clause("A.", "Product Data."),
+        clause("B.", "Shop Drawings:", [clause("1.", "Plans.")]),
+    ])])
+    second = document([
+        clause("2.", "Sections."),
+        clause("C.", "Samples."),
+        clause("1.06", "QUALITY ASSURANCE"),
+    ])
+
+    merged = merge_chunk_documents([first, second])
+
+    assert indexes(merged["part1"]["partItems"]) == [
+        ("1.05", [("A.", []), ("B.", [("1.", []), ("2.", [])]), ("C.", [])]),
+        ("1.06", []),
+    ]
+
+
+def test_orphans_from_overlap_page_merge_into_the_clauses_they_repeat():
+    first = document([
+        clause("2.01", "DUCTWORK", [
+            clause("A.", "General:", [clause("7.", "Plenum chambers."), clause("8.", "Make square elbows where")]),
+            clause("B.", "Medium Pressure Ductwork:", [clause("1.", "Rectangular ducts.")]),
+        ]),
+    ])
+    # The next chunk starts on the overlap page, inside 2.01 > A., without repeating them
+    second = document([
+        clause("8.", "Make square elbows where shown."),
+        clause("B.", "Medium Pressure Ductwork:", [clause("1.", "Rectangular ducts."), clause("2.", "Reinforcing.")]),
+        clause("2.02", "DAMPERS"),
+    ])
+
+    items = merge_chunk_documents([first, second])["part1"]["partItems"]
+
+    assert indexes(items) == [
+        ("2.01", [("A.", [("7.", []), ("8.", [])]), ("B.", [("1.", []), ("2.", [])])]),
+        ("2.02", []),
+    ]
+    assert items[0]["children"][0]["children"][1]["text"] == "Make square elbows where shown."
+
+
+def test_orphaned_lower_clause_nests_under_last_number():
+    target = [clause("2.01", "DUCTS", [clause("A.", "Ductwork:", [clause("1.", "Sheet metal:", [clause("a.", "Galvanized.")])])])]
+
+    merge_items(target, [clause("b.", "Stainless."), clause("2.", "Fittings."), clause("2.02", "DAMPERS")])
+
+    assert indexes(target) == [
+        ("2.01", [("A.", [("1.", [("a.", []), ("b.", [])]), ("2.", [])])]),
+        ("2.02", []),
+    ]
+
+
+def test_merge_leaves_chunk_documents_unchanged():
+    first = document([clause("1.05", "SUBMITTALS", [clause("B.", "Shop Drawings:", [clause("1.", "Plans.")])])])
+    second = document([clause("2.", "Sections."), clause("1.06", "QUALITY ASSURANCE")])
+    third = document([clause("1.06", "QUALITY ASSURANCE", [clause("A.", "Installer qualifications.")])])
+    originals = copy.deepcopy([first, second, third])
+
+    merge_chunk_documents([first, second, third])
+
+    assert [first, second, third] == originals
+
+
+def test_single_chunk_pdf_is_parsed_whole(monkeypatch):
+    calls = []
+
+    async def fake_parse(file_content, model, prompt=chunked_parser.PARSE_PROMPT, expect_json=True, with_document=False):
+        calls.append((file_content, prompt))
+        return '{"section": "1"}', {"section": "1"}
+
+    def no_split(*args):
+        raise AssertionError("a single-chunk PDF is not split")
+
+    pdf = sample_pdf("22 08 00")
+    monkeypatch.setattr(chunked_parser, "split_pdf", no_split)
+    monkeypatch.setattr(chunked_parser, "parse_pdf_with_gemini", fake_parse)
+
+    text, document, timings = asyncio.run(chunked_parser.parse_pdf_chunked(pdf))
+
+    assert text == '{"section": "1"}'
+    assert document == {"section": "1"}
+    assert timings == []
+    assert calls == [(pdf, chunked_parser.PARSE_PROMPT)]
+
+
+def test_chunks_are_files_sent_as_pdf_files_and_removed(tmp_path, monkeypatch):
+    sent = []
+
+    async def fake_parse(file_content, model, prompt=chunked_parser.PARSE_PROMPT, expect_json=True, with_document=False):
+        sent.append((file_content.path, file_content.size, os.path.exists(file_content.path)))
+        return "{}", {}
+
+    source = tmp_path / "spec.pdf"
+    shutil.copy(sample_pdf("233000").path, source)
+    monkeypatch.setattr(chunked_parser, "parse_pdf_with_gemini", fake_parse)
+
+    _, _, timings = asyncio.run(chunked_parser.parse_pdf_chunked(PdfFile.from_path(str(source)), max_pages=8))
+
+    assert len(sent) == len(timings) > 1
+    assert all(os.path.dirname(path) == str(tmp_path) and existed for path, _, existed in sent)
+    assert [timing["bytes"] for timing in timings] == [size for _, size, _ in sent]
+    # Only the source is left once the chunks are parsed
+    assert os.listdir(tmp_path) == ["spec.pdf"]
+
+
+class FakeChunk:
+    def __init__(self, name: bytes):
+        self.name = name
+        self.size = len(name)
+        self.cleaned = False
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+def test_failed_chunk_cancels_the_others(monkeypatch):
+    cancelled = []
+
+    async def fake_parse(file_content, model, prompt=chunked_parser.PARSE_PROMPT, expect_json=True, with_document=False):
+        if file_content.name == b"bad":
+            await asyncio.sleep(0.01)
+            raise Exception("upstream error")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(file_content.name)
+            raise
+        return "{}", {}
+
+    chunks = [
+        {"first_page": 1, "last_page": 8, "part": 1, "pdf": FakeChunk(b"slow-1")},
+        {"first_page": 8, "last_page": 12, "part": 2, "pdf": FakeChunk(b"bad")},
+        {"first_page": 12, "last_page": 20, "part": 3, "pdf": FakeChunk(b"slow-2")},
+    ]
+    monkeypatch.setattr(chunked_parser, "count_pages", lambda *args: 20)
+    monkeypatch.setattr(chunked_parser, "split_pdf", lambda *args: chunks)
+    monkeypatch.setattr(chunked_parser, "parse_pdf_with_gemini", fake_parse)
+
+    async def parse():
+        with pytest.raises(Exception, match="upstream error"):
+            await chunked_parser.parse_pdf_chunked(b"pdf", concurrency=4)
+        # Cancelled before the error is raised, not only when the event loop shuts down
+        return sorted(cancelled)
+
+    assert asyncio.run(parse()) == [b"slow-1", b"slow-2"]
+    assert all(chunk["pdf"].cleaned for chunk in chunks)
+
+
+def test_orphan_matching_boilerplate_of_an_earlier_article_is_not_merged_into_it():
+    manufacturers = "Manufacturers: Subject to compliance with requirements, provide products by one of the following:"
+    first = document(part2=[
+        clause("2.02", "FIRE DAMPERS", [clause("B.", manufacturers, [clause("1.", "Ruskin Company.")])]),
+        clause("2.03", "SMOKE DAMPERS", [clause("A.", "Description: Motorized dampers.")]),
+    ])
+    # 2.03 > B. repeats the 2.02 > B. boilerplate, with another manufacturer list
+    second = document(part2=[
+        clause("B.", manufacturers, [clause("1.", "Greenheck Fan Corporation.")]),
+        clause("2.04", "FLEXIBLE CONNECTORS"),
+    ])
+
+    items = merge_chunk_documents([first, second])["part2"]["partItems"]
+
+    assert indexes(items) == [
+        ("2.02", [("B.", [("1.", [])])]),
+        ("2.03", [("A.", []), ("B.", [("1.", [])])]),
+        ("2.04", []),
+    ]
+    assert items[0]["children"][0]["children"][0]["text"] == "Ruskin Company."
+    assert items[1]["children"][1]["children"][0]["text"] == "Greenheck Fan Corporation."
+
+
+def test_same_index_with_different_text_is_kept():
+    first = document([clause("1.02", "SUBMITTALS", [clause("A.", "Product Data.")])])
+    second = document([clause("1.02", "SUBMITTALS", [clause("A.", "Shop Drawings.")])])
+
+    items = merge_chunk_documents([first, second])["part1"]["partItems"]
+
+    assert [child["text"] for child in items[0]["children"]] == ["Product Data.", "Shop Drawings."]
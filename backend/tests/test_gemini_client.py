@@ -0,0 +1,163 @@
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+
+from gemini_client import TOKENS_PER_PDF_PAGE, GeminiClient, estimate_request_tokens
+from uploads import PdfFile
+
+DOCUMENTS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "documents")
+
+
+def make_pdf(tmp_path) -> PdfFile:
+    path = tmp_path / "spec.pdf"
+    path.write_bytes(b"%PDF-1.4 " + b"0" * 1000)
+    return PdfFile.from_path(str(path))
+
+
+def files_api(start_failures: int = 0, processing_polls: int = 0):
+    """MockTransport handler for the resumable upload, plus the requests it received"""
+    seen = []
+    state = {"start_failures": start_failures, "polls": processing_polls}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append((request.method, request.headers.get("x-goog-upload-command", "")))
+        if request.method == "POST" and request.headers.get("x-goog-upload-command") == "start":
+            if state["start_failures"]:
+                state["start_failures"] -= 1
+                return httpx.Response(503, json={"error": {"message": "unavailable"}})
+            return httpx.Response(200, headers={"x-goog-upload-url": "https://upload.test/session"})
+        if request.method == "POST":
+            request.read()
+            return httpx.Response(200, json={"file": {"name": "files/abc", "uri": "https://files.test/abc", "state": "PROCESSING"}})
+        if request.method == "GET":
+            state["polls"] -= 1
+            return httpx.Response(200, json={"name": "files/abc", "uri": "https://files.test/abc", "state": "PROCESSING" if state["polls"] > 0 else "ACTIVE"})
+        return httpx.Response(200, json={})
+
+    return handler, seen
+
+
+def test_upload_file_retries_a_failed_step(tmp_path):
+    handler, seen = files_api(start_failures=1, processing_polls=1)
+
+    async def scenario():
+        client = GeminiClient(transport=httpx.MockTransport(handler), backoff_base=0.01, http2=False)
+        try:
+            file = await client.upload_file(make_pdf(tmp_path), "key", model="gemini-2.5-flash")
+            return file, client.snapshot()
+        finally:
+            await client.aclose()
+
+    file, stats = asyncio.run(scenario())
+
+    assert file["state"] == "ACTIVE"
+    assert [command for _, command in seen] == ["start", "start", "upload, finalize", ""]
+    assert stats["gemini-2.5-flash"]["retries"] == 1
+
+
+def test_upload_file_stops_waiting_for_processing(tmp_path):
+    handler, seen = files_api(processing_polls=1000)
+
+    async def scenario():
+        client = GeminiClient(transport=httpx.MockTransport(handler), timeout_seconds=1.5, http2=False)
+        try:
+            await client.upload_file(make_pdf(tmp_path), "key", model="gemini-2.5-flash")
+        finally:
+            await client.aclose()
+
+    with pytest.raises(httpx.TimeoutException):
+        asyncio.run(scenario())
+    # The file is deleted once the wait is abandoned
+    assert seen[-1] == ("DELETE", "")
+
+
+def scripted(*responses):
+    """MockTransport handler that returns these responses in order, then 200s"""
+    seen = []
+    pending = list(responses)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return pending.pop(0) if pending else httpx.Response(200, json={"candidates": []})
+
+    return handler, seen
+
+
+def run_posts(handler, estimated_tokens=(0,), **options):
+    async def scenario():
+        client = GeminiClient(transport=httpx.MockTransport(handler), http2=False, **{"backoff_base": 0.001, **options})
+        try:
+            started = time.monotonic()
+            responses = [
+                await client.post("gemini-2.5-flash", "generateContent", {}, "key", estimated_tokens=tokens)
+                for tokens in estimated_tokens
+            ]
+            return responses, time.monotonic() - started, client.snapshot()["gemini-2.5-flash"]
+        finally:
+            await client.aclose()
+
+    return asyncio.run(scenario())
+
+
+def test_throttled_request_waits_for_retry_after():
+    handler, seen = scripted(httpx.Response(429, headers={"Retry-After": "0.3"}))
+
+    [response], elapsed, stats = run_posts(handler)
+
+    assert response.status_code == 200
+    assert len(seen) == 2 and elapsed >= 0.3
+    assert (stats["throttled"], stats["retries"], stats["failures"]) == (1, 1, 0)
+
+
+def test_retry_info_detail_sets_the_delay():
+    retry_info = {"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "0.3s"}]}}
+    handler, seen = scripted(httpx.Response(429, json=retry_info))
+
+    [response], elapsed, _ = run_posts(handler)
+
+    assert response.status_code == 200 and elapsed >= 0.3
+
+
+def test_longer_retry_after_than_backoff_max_is_not_retried():
+    handler, seen = scripted(httpx.Response(429, headers={"Retry-After": "120"}))
+
+    [response], elapsed, stats = run_posts(handler, backoff_max=60)
+
+    assert response.status_code == 429
+    assert len(seen) == 1 and elapsed < 1
+    assert stats["failures"] == 1
+
+
+def test_retries_stop_after_max_retries():
+    handler, seen = scripted(*[httpx.Response(503, json={"error": {"message": "unavailable"}})] * 5)
+
+    [response], _, stats = run_posts(handler, max_retries=2)
+
+    assert response.status_code == 503
+    assert len(seen) == 3
+    assert (stats["requests"], stats["retries"], stats["failures"]) == (3, 2, 1)
+
+
+def test_token_bucket_wait_is_recorded():
+    handler, _ = scripted()
+    limits = {"gemini-2.5-flash": (1000, 60_000)}
+
+    # The first request empties the tokens-per-minute bucket; the second waits ~0.1s for 100 tokens
+    _, _, stats = run_posts(handler, estimated_tokens=(60_000, 100), rate_limits=limits)
+
+    assert stats["requests"] == 2
+    assert 0.05 <= stats["queue_wait_seconds_max"] < 1
+    assert stats["queue_wait_seconds_total"] == stats["queue_wait_seconds_max"]
+
+
+def test_token_estimate_counts_pages_in_compressed_object_streams():
+    # Its page objects are in object streams, so a scan for "/Type /Page" finds none
+    path = os.path.join(DOCUMENTS_DIR, "233000 HVAC Air Distribution (Long).pdf")
+    with open(path, "rb") as f:
+        content = f.read()
+
+    assert estimate_request_tokens("", content) == 30 * TOKENS_PER_PDF_PAGE
+    assert PdfFile.from_path(path).page_estimate == 30
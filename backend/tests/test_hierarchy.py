@@ -0,0 +1,105 @@
+import glob
+import json
+import os
+
+import pytest
+
+from bench.replay import compare_documents
+from hierarchy import build_document, flatten_document
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "documents", "results")
+
+
+def load_reference(prefix: str) -> dict:
+    (path,) = glob.glob(os.path.join(RESULTS_DIR, f"{prefix}*.json"))
+    with open(path, "r", encoding="utf-8") as f:
+        document = json.load(f)
+    return json.loads(document) if isinstance(document, str) else document
+
+
+def rebuild(lines: str):
+    return build_document("SECTION\t1\nNAME\tTEST\nPART 2\n" + lines)
+
+
+def clause_tree(items):
+    return [(item["index"], clause_tree(item["children"] or [])) for item in items or []]
+
+
+@pytest.mark.parametrize("prefix", ["22 08 00", "23 82 43", "233000"])
+def test_flattened_reference_rebuilds_identically(prefix):
+    reference = load_reference(prefix)
+
+    document, _ = build_document(flatten_document(reference))
+
+    assert compare_documents(document, reference) is None
+
+
+def test_medium_reference_rebuilds_with_its_stray_clauses_nested():
+    reference = load_reference("271500")
+    document, issues = build_document(flatten_document(reference))
+
+    # The reference nests two "3." clauses against their numbering; the rebuild follows it.
+    # 2.4 > A. > 3. is listed as a top-level item of part 2
+    part_items = reference["part2"]["partItems"]
+    stray = part_items.pop(4)
+    assert stray["index"] == "3."
+    part_items[3]["children"][0]["children"].append(stray)
+    # 3.1 > B. > 3. is listed next to A. and B.
+    article = reference["part3"]["partItems"][0]
+    stray = article["children"].pop(2)
+    assert stray["index"] == "3."
+    article["children"][1]["children"].append(stray)
+
+    assert compare_documents(document, reference) is None
+    assert issues == []
+
+
+def test_mis_cased_letter_followed_by_lower_letter_stays_in_deeper_list():
+    document, issues = rebuild("2.01\tDUCTWORK\nA.\tGeneral\nB.\tMedium pressure\n1.\tSealant\na.\tJoints\nb.\tSeams\nC.\tDuctmate\nd.\tListed\n2.\tRound\nC.\tLow pressure\n")
+
+    assert clause_tree(document["part2"]["partItems"]) == [
+        ("2.01", [("A.", []), ("B.", [("1.", [("a.", []), ("b.", []), ("C.", []), ("d.", [])]), ("2.", [])]), ("C.", [])]),
+    ]
+    assert [(issue["index"], issue["kind"]) for issue in issues] == [("C.", "case")]
+
+
+@pytest.mark.parametrize("following", ["D.\tNext\n", "1.\tFirst\n", ""])
+def test_letter_that_continues_outer_list_goes_there(following):
+    document, issues = rebuild("2.01\tDUCTWORK\nA.\tGeneral\nB.\tMedium pressure\n1.\tSealant\na.\tJoints\nb.\tSeams\nC.\tLow pressure\n" + following)
+
+    b_clause, c_clause = document["part2"]["partItems"][0]["children"][1:3]
+    assert clause_tree([b_clause]) == [("B.", [("1.", [("a.", []), ("b.", [])])])]
+    assert c_clause["index"] == "C."
+    assert issues == []
+
+
+def test_mis_cased_letter_before_outer_duplicate_stays_in_deeper_list():
+    document, _ = rebuild("2.21\tFILTERS\nA.\tProvide\nB.\tMedium\n7.\tManufacturers\na.\tCamfil\nb.\tEFC\nC.\tEco-Air\nC.\tStandard sizes\n")
+
+    assert clause_tree(document["part2"]["partItems"]) == [
+        ("2.21", [("A.", []), ("B.", [("7.", [("a.", []), ("b.", []), ("C.", [])])]), ("C.", [])]),
+    ]
+
+
+def test_article_of_a_later_part_without_its_part_line_starts_that_part():
+    document, issues = build_document(
+        "SECTION\t1\nNAME\tTEST\nPART 1\n1.01\tSUMMARY\nA.\tSection includes ducts.\n"
+        "2.01\tDUCTWORK\nA.\tGalvanized steel.\n2.02\tDAMPERS\nPART 3\n3.01\tINSTALLATION\n"
+    )
+
+    assert clause_tree(document["part1"]["partItems"]) == [("1.01", [("A.", [])])]
+    assert clause_tree(document["part2"]["partItems"]) == [("2.01", [("A.", [])]), ("2.02", [])]
+    assert clause_tree(document["part3"]["partItems"]) == [("3.01", [])]
+    assert [(issue["kind"], issue["index"], issue["part"]) for issue in issues] == [("part_missing", "2.01", "part1")]
+
+
+def test_article_order_compares_part_and_article_numbers():
+    _, issues = rebuild("2.01\tDUCTWORK\n2.03\tDAMPERS\n2.03\tLOUVERS\n2.02\tFANS\n1.04\tSTRAY\n")
+
+    assert [(issue["kind"], issue["index"]) for issue in issues] == [
+        ("gap", "2.03"),
+        ("duplicate", "2.03"),
+        ("out_of_order", "2.02"),
+        ("part_mismatch", "1.04"),
+        ("out_of_order", "1.04"),
+    ]
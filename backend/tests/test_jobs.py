@@ -0,0 +1,75 @@
+import asyncio
+
+from jobs import JOB_DONE, JOB_FAILED, JOB_RUNNING, JobManager
+from uploads import PdfFile
+
+
+def spool(tmp_path, name: str, size: int) -> PdfFile:
+    path = tmp_path / f"upload-{name}"
+    path.write_bytes(b"%PDF" + b"0" * size)
+    return PdfFile.from_path(str(path), name, owned=True)
+
+
+def test_saturated_model_does_not_block_other_models(tmp_path):
+    started = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def processor(pdf, model, options):
+            started.append(pdf.filename)
+            if model == "slow":
+                await gate.wait()
+            return "{}"
+
+        manager = JobManager(processor, directory=str(tmp_path / "jobs"), workers=2, model_concurrency={"slow": 1})
+        await manager.start()
+        try:
+            slow = [await manager.submit("b", f"slow-{i}", spool(tmp_path, f"slow-{i}", i), "slow") for i in range(3)]
+            fast = [await manager.submit("b", f"fast-{i}", spool(tmp_path, f"fast-{i}", i), "fast") for i in range(2)]
+            for _ in range(50):
+                await asyncio.sleep(0.01)
+            assert all(manager.get(job["id"])["status"] == JOB_DONE for job in fast)
+            assert [name for name in started if name.startswith("slow")] == ["slow-0"]
+
+            # A later, more urgent job still overtakes the slow jobs that are waiting
+            urgent = await manager.submit("b", "slow-urgent", spool(tmp_path, "slow-urgent", 99), "slow", priority=-1)
+            gate.set()
+            for _ in range(50):
+                await asyncio.sleep(0.01)
+            assert all(manager.get(job["id"])["status"] == JOB_DONE for job in slow + [urgent])
+            assert [name for name in started if name.startswith("slow")] == ["slow-0", "slow-urgent", "slow-1", "slow-2"]
+        finally:
+            await manager.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failed_record_write_fails_the_job_but_keeps_the_worker(tmp_path):
+    async def scenario():
+        async def processor(pdf, model, options):
+            return "{}"
+
+        manager = JobManager(processor, directory=str(tmp_path / "jobs"), workers=1)
+        write_record = manager._write_record
+
+        def flaky_write_record(job):
+            if job["filename"] == "broken" and job["status"] == JOB_RUNNING:
+                raise OSError("disk full")
+            write_record(job)
+
+        manager._write_record = flaky_write_record
+        await manager.start()
+        try:
+            broken = await manager.submit("b", "broken", spool(tmp_path, "broken", 1), "model")
+            healthy = await manager.submit("b", "healthy", spool(tmp_path, "healthy", 1), "model")
+            for _ in range(50):
+                await asyncio.sleep(0.01)
+            return manager.get(broken["id"]), manager.get(healthy["id"])
+        finally:
+            await manager.stop()
+
+    broken, healthy = asyncio.run(scenario())
+
+    assert broken["status"] == JOB_FAILED and broken["error"] == "disk full"
+    assert healthy["status"] == JOB_DONE
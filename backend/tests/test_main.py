@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from spec_store import SpecStore
+
+DOCUMENT = {
+    "section": "23 30 00",
+    "name": "HVAC AIR DISTRIBUTION",
+    "part1": {"partItems": [{"index": "1.01", "text": "SUMMARY", "children": [
+        {"index": "A.", "text": "Section includes ducts.", "children": None},
+    ]}]},
+    "part2": {"partItems": []},
+    "part3": {"partItems": []},
+}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "spec_store", SpecStore(str(tmp_path / "specs")))
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_list_specs_returns_sections_and_index_stats(client):
+    assert client.post("/specs", json=DOCUMENT).json()["status"] == "created"
+
+    body = client.get("/specs").json()
+
+    assert [section["section"] for section in body["sections"]] == ["23 30 00"]
+    assert body["sections"][0]["clauses"] == 2
+    assert body["section_count"] == 1 and body["clauses"] == 2
+
+
+def test_store_spec_rejects_malformed_document(client):
+    response = client.post("/specs", json={**DOCUMENT, "part2": {"partItems": "none"}})
+
+    assert response.status_code == 400
+    assert response.json() == {"error": "part2.partItems must be a list"}
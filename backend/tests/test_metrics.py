@@ -0,0 +1,102 @@
+import glob
+import json
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+from gemini_client import GeminiClient
+from spec_store import SpecStore
+
+DOCUMENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "documents")
+
+PARSED = {
+    "section": "22 08 00",
+    "name": "COMMISSIONING OF PLUMBING",
+    "part1": {"partItems": [{"index": "1.01", "text": "SUMMARY", "children": None}]},
+    "part2": {"partItems": []},
+    "part3": {"partItems": []},
+}
+
+
+def sample_value(text, series):
+    """Value of one sample line in /metrics output, or 0 when the series is absent"""
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_histogram_renders_cumulative_buckets(monkeypatch):
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    histogram = metrics.Histogram("test_seconds", "Test latency", ("endpoint",), buckets=(1, 0.1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value, "/upload")
+    histogram.observe(0.2, 'say "hi"\n')
+
+    assert metrics.render().splitlines() == [
+        "# HELP test_seconds Test latency",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{endpoint="/upload",le="0.1"} 2',
+        'test_seconds_bucket{endpoint="/upload",le="1.0"} 3',
+        'test_seconds_bucket{endpoint="/upload",le="+Inf"} 4',
+        'test_seconds_sum{endpoint="/upload"} 5.65',
+        'test_seconds_count{endpoint="/upload"} 4',
+        'test_seconds_bucket{endpoint="say \\"hi\\"\\n",le="0.1"} 0',
+        'test_seconds_bucket{endpoint="say \\"hi\\"\\n",le="1.0"} 1',
+        'test_seconds_bucket{endpoint="say \\"hi\\"\\n",le="+Inf"} 1',
+        'test_seconds_sum{endpoint="say \\"hi\\"\\n"} 0.2',
+        'test_seconds_count{endpoint="say \\"hi\\"\\n"} 1',
+    ]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={
+            "candidates": [{"content": {"parts": [{"text": json.dumps(PARSED)}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": 1200, "candidatesTokenCount": 80, "totalTokenCount": 1280},
+        })
+
+    monkeypatch.setattr(GeminiClient, "from_env", classmethod(
+        lambda cls: GeminiClient(transport=httpx.MockTransport(handler), http2=False)))
+    monkeypatch.setattr(main, "spec_store", SpecStore(str(tmp_path / "specs")))
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_upload_reports_server_timing_and_metrics(client):
+    (path,) = glob.glob(os.path.join(DOCUMENTS_DIR, "22 08 00*.pdf"))
+    labels = 'endpoint="/upload",model="gemini-2.5-flash"'
+    before = client.get("/metrics").text
+
+    with open(path, "rb") as f:
+        response = client.post("/upload", files={"pdf": ("short.pdf", f, "application/pdf")}, data={"cache": "bypass"})
+    after = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "bypass"
+    stages = dict(entry.split(";dur=") for entry in response.headers["Server-Timing"].split(", "))
+    assert {"upload_read", "upstream", "total"} <= set(stages)
+    assert all(float(duration) >= 0 for duration in stages.values())
+    assert float(stages["total"]) >= float(stages["upstream"])
+
+    assert after.headers["content-type"] == metrics.CONTENT_TYPE
+
+    def delta(series):
+        return sample_value(after.text, series) - sample_value(before, series)
+
+    assert delta(f'pdf_parser_requests_total{{{labels},status="200"}}') == 1
+    assert delta(f'pdf_parser_request_seconds_count{{{labels}}}') == 1
+    assert delta(f'pdf_parser_request_seconds_bucket{{{labels},le="+Inf"}}') == 1
+    assert sample_value(after.text, 'pdf_parser_requests_in_flight{endpoint="/upload"}') == 0
+    # The multipart body wraps the PDF in boundaries and form fields
+    assert delta('pdf_parser_request_bytes_total{endpoint="/upload"}') > os.path.getsize(path)
+    assert delta('pdf_parser_response_bytes_total{endpoint="/upload"}') == len(response.content)
+    assert delta('pdf_parser_cache_results_total{status="bypass"}') == 1
+    assert delta('gemini_requests_total{model="gemini-2.5-flash",status="200"}') == 1
+    assert delta('gemini_tokens_total{model="gemini-2.5-flash",type="prompt"}') == 1200
+    assert delta('gemini_tokens_total{model="gemini-2.5-flash",type="output"}') == 80
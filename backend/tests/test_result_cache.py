@@ -0,0 +1,217 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import result_cache
+from result_cache import CACHE_BYPASS, CACHE_REFRESH, ResultCache
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def test_concurrent_streams_share_one_producer(tmp_path):
+    calls = []
+
+    async def scenario():
+        cache = ResultCache(str(tmp_path))
+
+        async def produce():
+            calls.append("produce")
+            for event in ("section", "name", "item"):
+                await asyncio.sleep(0.01)
+                yield event
+
+        first, first_status = cache.join_stream("key", produce)
+        await asyncio.sleep(0.015)
+        # Joins after the first event was published and still gets every event
+        second, second_status = cache.join_stream("key", produce)
+        results = await asyncio.gather(collect(first), collect(second))
+        return first_status, second_status, results, cache.snapshot()
+
+    first_status, second_status, results, stats = asyncio.run(scenario())
+
+    assert (first_status, second_status) == ("miss", "coalesced")
+    assert results == [["section", "name", "item"]] * 2
+    assert calls == ["produce"]
+    assert stats["coalesced"] == 1 and stats["inflight"] == 0
+
+
+def test_stream_error_reaches_every_subscriber(tmp_path):
+    async def scenario():
+        cache = ResultCache(str(tmp_path))
+
+        async def produce():
+            yield "section"
+            await asyncio.sleep(0.01)
+            raise Exception("upstream error")
+
+        streams = [cache.join_stream("key", produce)[0] for _ in range(2)]
+        return await asyncio.gather(*(collect(stream) for stream in streams), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert [str(result) for result in results] == ["upstream error", "upstream error"]
+
+
+def test_bypass_stream_is_not_shared(tmp_path):
+    calls = []
+
+    async def scenario():
+        cache = ResultCache(str(tmp_path))
+
+        async def produce():
+            calls.append("produce")
+            yield "section"
+
+        streams = [cache.join_stream("key", produce, mode="bypass") for _ in range(2)]
+        return [status for _, status in streams], await asyncio.gather(*(collect(stream) for stream, _ in streams))
+
+    statuses, results = asyncio.run(scenario())
+
+    assert statuses == ["bypass", "bypass"]
+    assert results == [["section"], ["section"]]
+    assert calls == ["produce", "produce"]
+
+
+
+def test_concurrent_misses_share_one_computation(tmp_path):
+    calls = []
+
+    async def scenario():
+        cache = ResultCache(str(tmp_path))
+
+        async def compute():
+            calls.append("compute")
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(*(cache.get_or_compute("key", compute) for _ in range(5)))
+        return results, await cache.get_or_compute("key", compute), cache.snapshot()
+
+    results, again, stats = asyncio.run(scenario())
+
+    assert sorted(results) == [("value", "coalesced")] * 4 + [("value", "miss")]
+    assert again == ("value", "hit")
+    assert calls == ["compute"]
+    assert stats["misses"] == 1 and stats["coalesced"] == 4 and stats["inflight"] == 0
+
+
+def test_failed_computation_reaches_every_waiter_and_is_not_cached(tmp_path):
+    calls = []
+
+    async def scenario():
+        cache = ResultCache(str(tmp_path))
+
+        async def compute():
+            calls.append("compute")
+            await asyncio.sleep(0.01)
+            if len(calls) == 1:
+                raise Exception("upstream error")
+            return "value"
+
+        failures = await asyncio.gather(*(cache.get_or_compute("key", compute) for _ in range(2)), return_exceptions=True)
+        return failures, await cache.get_or_compute("key", compute)
+
+    failures, retried = asyncio.run(scenario())
+
+    assert [str(failure) for failure in failures] == ["upstream error", "upstream error"]
+    assert retried == ("value", "miss")
+    assert calls == ["compute", "compute"]
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    clock = [time.time()]
+    monkeypatch.setattr(result_cache, "time", SimpleNamespace(time=lambda: clock[0]))
+
+    async def compute():
+        return f"value at {clock[0]}"
+
+    async def scenario():
+        cache = ResultCache(str(tmp_path), ttl_seconds=60)
+        first = await cache.get_or_compute("key", compute)
+        clock[0] += 30
+        fresh = await cache.get_or_compute("key", compute)
+        clock[0] += 60
+        expired = await cache.get_or_compute("key", compute)
+        return first, fresh, expired
+
+    first, fresh, expired = asyncio.run(scenario())
+
+    assert fresh == (first[0], "hit")
+    assert expired == (f"value at {clock[0]}", "miss")
+
+
+def test_memory_eviction_falls_back_to_disk(tmp_path):
+    async def scenario():
+        cache = ResultCache(str(tmp_path), max_memory_entries=2)
+        for key in ("a", "b"):
+            await cache.put(key, key.upper())
+        await cache.get("a")  # "b" is now the least recently used
+        await cache.put("c", "C")
+        in_memory = list(cache._memory)
+        return in_memory, await cache.get("b"), cache.snapshot()
+
+    in_memory, value, stats = asyncio.run(scenario())
+
+    assert in_memory == ["a", "c"]
+    assert value == "B"
+    assert stats["disk_hits"] == 1 and stats["evictions"] == 2
+
+
+def test_disk_eviction_drops_least_recently_read(tmp_path):
+    async def scenario():
+        # Memory holds nothing, so every get reads the file and bumps its access time
+        cache = ResultCache(str(tmp_path), max_memory_entries=0, max_disk_bytes=25, ttl_seconds=0)
+        await cache.put("a", "A" * 10)
+        await cache.put("b", "B" * 10)
+        os.utime(tmp_path / "a.json", (1000, 1000))
+        os.utime(tmp_path / "b.json", (2000, 2000))
+        await cache.get("a")
+        await cache.put("c", "C" * 10)
+        return sorted(os.listdir(tmp_path)), await cache.get("b")
+
+    files, evicted = asyncio.run(scenario())
+
+    assert files == ["a.json", "c.json"]
+    assert evicted is None
+
+
+def test_bypass_skips_the_cache_and_refresh_overwrites_it(tmp_path):
+    values = iter(["fresh", "refreshed"])
+
+    async def compute():
+        return next(values)
+
+    async def scenario():
+        cache = ResultCache(str(tmp_path))
+        await cache.put("key", "stored")
+        bypassed = await cache.get_or_compute("key", compute, mode=CACHE_BYPASS)
+        after_bypass = await cache.get("key")
+        refreshed = await cache.get_or_compute("key", compute, mode=CACHE_REFRESH)
+        return bypassed, after_bypass, refreshed, await cache.get_or_compute("key", compute)
+
+    bypassed, after_bypass, refreshed, used = asyncio.run(scenario())
+
+    assert bypassed == ("fresh", "bypass")
+    assert after_bypass == "stored"
+    assert refreshed == ("refreshed", "miss")
+    assert used == ("refreshed", "hit")
+    with open(tmp_path / "key.json", "r", encoding="utf-8") as f:
+        assert f.read() == "refreshed"
+
+
+def test_rejected_values_are_returned_but_not_stored(tmp_path):
+    async def compute():
+        return "partial"
+
+    async def scenario():
+        cache = ResultCache(str(tmp_path))
+        result = await cache.get_or_compute("key", compute, should_store=lambda value: value != "partial")
+        return result, await cache.get("key")
+
+    result, stored = asyncio.run(scenario())
+
+    assert result == ("partial", "miss")
+    assert stored is None
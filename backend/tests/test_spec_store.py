@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import spec_store
+from spec_store import SpecStore
+
+
+def section(number, texts):
+    return {
+        "section": number,
+        "name": f"Section {number}",
+        "part1": {"partItems": [{"index": "1.01", "text": "GENERAL", "children": [
+            {"index": f"{chr(ord('A') + i)}.", "text": text, "children": None} for i, text in enumerate(texts)
+        ]}]},
+        "part2": {"partItems": []},
+        "part3": {"partItems": []},
+    }
+
+
+@pytest.mark.parametrize("document, reason", [
+    ({"section": "233000", "part1": []}, "part1 must be an object"),
+    ({"section": "233000", "part1": {"partItems": "none"}}, "part1.partItems must be a list"),
+    ({"section": "233000", "part2": {"partItems": [{"index": "2.01", "children": "A."}]}}, "part2.partItems[0].children must be a list"),
+    ({"section": "233000", "part1": {"partItems": [{"index": "1.01", "text": 7}]}}, "part1.partItems[0].text must be a string"),
+])
+def test_malformed_document_is_skipped_and_keeps_stored_revision(tmp_path, document, reason):
+    async def scenario():
+        store = SpecStore(str(tmp_path))
+        await store.ingest(section("233000", ["Ducts."]))
+        result = await store.ingest(document)
+        return result, await store.get_section("233000")
+
+    result, record = asyncio.run(scenario())
+
+    assert result["status"] == "skipped"
+    assert result["reason"] == reason
+    assert record["revision"] == 1
+
+
+def test_failed_write_leaves_index_unchanged(tmp_path, monkeypatch):
+    async def scenario():
+        store = SpecStore(str(tmp_path))
+        await store.ingest(section("233000", ["Galvanized ducts."]))
+
+        def fail(key, record):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(store, "_write_record", fail)
+        with pytest.raises(OSError):
+            await store.ingest(section("233000", ["Aluminum ducts."]))
+        return store, await store.search("ducts")
+
+    store, found = asyncio.run(scenario())
+
+    assert store.sections["233000"].revision == 1
+    assert [result["text"] for result in found["results"]] == ["Galvanized ducts."]
+    assert store.snapshot()["dead_clause_ids"] == 0
+
+
+def test_load_skips_malformed_records(tmp_path, capsys):
+    asyncio.run(SpecStore(str(tmp_path)).ingest(section("233000", ["Ducts."])))
+    with open(os.path.join(tmp_path, "220800.json"), "w", encoding="utf-8") as f:
+        json.dump({"section": "220800", "name": "", "revision": 1, "updated_at": 0, "sha256": "x",
+                   "document": {"section": "220800", "part1": {"partItems": [{"children": 3}]}}}, f)
+
+    store = SpecStore(str(tmp_path))
+    asyncio.run(store.load())
+
+    assert list(store.sections) == ["233000"]
+    assert "Skipping unreadable spec record 220800.json" in capsys.readouterr().out
+
+
+def test_get_clause_normalizes_paths_and_filters_by_part(tmp_path):
+    document = section("233000", ["Ducts."])
+    document["part2"]["partItems"] = [{"index": "2.3", "text": "DAMPERS", "children": [
+        {"index": "B.", "text": "Fire dampers.", "children": None},
+    ]}]
+    document["part1"]["partItems"].append({"index": "A.", "text": "Submit product data.", "children": None})
+    document["part3"]["partItems"] = [{"index": "A.", "text": "Install dampers.", "children": None}]
+
+    async def scenario():
+        store = SpecStore(str(tmp_path))
+        await store.ingest(document)
+        return [
+            await store.get_clause("23 30 00", "2.3/B"),
+            await store.get_clause("233000", "2.03.B."),
+            await store.get_clause("233000", "A"),
+            await store.get_clause("233000", "A", part="part3"),
+            await store.get_clause("233000", "A", part="part2"),
+        ]
+
+    slashed, dotted, first_a, part3_a, part2_a = asyncio.run(scenario())
+
+    assert slashed == dotted
+    assert slashed["part"] == "part2"
+    assert slashed["path"] == "2.03.B"
+    assert slashed["text"] == "Fire dampers."
+    assert slashed["parents"] == [{"path": "2.03", "index": "2.3", "text": "DAMPERS"}]
+    assert first_a["part"] == "part1"
+    assert first_a["text"] == "Submit product data."
+    assert part3_a["part"] == "part3"
+    assert part3_a["text"] == "Install dampers."
+    assert part2_a is None
+
+
+def test_new_revision_reindexes_only_its_section(tmp_path, monkeypatch):
+    async def scenario():
+        store = SpecStore(str(tmp_path))
+        await store.ingest(section("111111", ["Galvanized ducts.", "Duct sealant."]))
+        await store.ingest(section("222222", ["Aluminum ducts."]))
+        other = store.sections["222222"]
+
+        prepared = []
+        prepare = store._prepare
+        monkeypatch.setattr(store, "_prepare", lambda record: prepared.append(record["section"]) or prepare(record))
+        result = await store.ingest(section("111111", ["Stainless ducts."]))
+        return store, other, prepared, result, await store.search("ducts")
+
+    store, other, prepared, result, found = asyncio.run(scenario())
+
+    assert result == {"status": "updated", "section": "111111", "revision": 2}
+    assert prepared == ["111111"]
+    assert store.sections["222222"] is other
+    assert store.sections["222222"].first_id == 0 + 3  # 1.01 and two clauses of 111111 come first
+    assert store.snapshot()["dead_clause_ids"] == 3
+    assert [(result["section"], result["text"]) for result in found["results"]] == [
+        ("222222", "Aluminum ducts."),
+        ("111111", "Stainless ducts."),
+    ]
+
+
+@pytest.mark.parametrize("bitmap_ratio", [1, 10 ** 9])
+def test_search_ranks_and_pages_the_same_from_bitmaps_and_posting_lists(tmp_path, monkeypatch, bitmap_ratio):
+    # A ratio of 1 always intersects posting lists; a huge one always uses bitmaps
+    monkeypatch.setattr(spec_store, "BITMAP_RATIO", bitmap_ratio)
+
+    async def scenario():
+        store = SpecStore(str(tmp_path))
+        await store.ingest(section("111111", ["Fire damper with sleeve.", "Damper.", "Louver."]))
+        await store.ingest(section("222222", ["Volume damper.", "Damper."]))
+        await store.search("damper")  # Caches bitmaps before the next revision retires ids
+        await store.ingest(section("111111", ["Fire damper with sleeve.", "Damper blades.", "Damper."]))
+        return [await store.search("damper", limit=2, offset=offset) for offset in (0, 2, 4)]
+
+    pages = asyncio.run(scenario())
+
+    assert [page["total"] for page in pages] == [5, 5, 5]
+    assert [(result["section"], result["text"]) for page in pages for result in page["results"]] == [
+        ("222222", "Damper."),
+        ("111111", "Damper."),
+        ("222222", "Volume damper."),
+        ("111111", "Damper blades."),
+        ("111111", "Fire damper with sleeve."),
+    ]
+
+
+def test_search_after_compaction_returns_current_text(tmp_path, monkeypatch):
+    monkeypatch.setattr(spec_store, "COMPACT_MIN_DEAD", 1)
+
+    async def scenario():
+        store = SpecStore(str(tmp_path))
+        await store.ingest(section("111111", [f"Damper {i}." for i in range(10)]))
+        await store.ingest(section("222222", [f"Damper {i}." for i in range(10, 13)]))
+        await store.search("damper")
+        # Replacing most of the clauses compacts the id space
+        await store.ingest(section("111111", ["Louver damper."]))
+        return store, await store.search("damper", limit=50), await store.search("damper", section="111111")
+
+    store, found, in_section = asyncio.run(scenario())
+
+    assert store.snapshot()["dead_clause_ids"] == 0
+    assert found["total"] == 4
+    assert [(result["section"], result["path"], result["text"]) for result in found["results"]] == [
+        ("222222", "1.01.A", "Damper 10."),
+        ("222222", "1.01.B", "Damper 11."),
+        ("222222", "1.01.C", "Damper 12."),
+        ("111111", "1.01.A", "Louver damper."),
+    ]
+    assert [result["text"] for result in in_section["results"]] == ["Louver damper."]
@@ -0,0 +1,94 @@
+import glob
+import json
+import os
+import random
+
+import pytest
+
+from stream_parser import EVENT_ITEM, IncrementalDocumentParser, iter_document_events
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "documents", "results")
+
+TRICKY_TEXTS = [
+    'Label "FIRE DAMPER" in 1" letters',
+    "Escaped backslash \\ before a quote \\\" and a brace }",
+    "Braces { and brackets ] inside text [",
+    'Unicode °F and – dash, key-like "index": "A." text',
+    "",
+]
+
+
+def reference_documents():
+    documents = []
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            document = json.load(f)
+        documents.append(json.loads(document) if isinstance(document, str) else document)
+    return documents
+
+
+def tricky_document():
+    return {
+        "section": 'Section "23 30 00" {draft}',
+        "name": "HVAC \\ Air Distribution",
+        "part1": {"partItems": [
+            {"index": "1.01", "text": text, "children": [{"index": "A.", "text": text, "children": None}]}
+            for text in TRICKY_TEXTS
+        ]},
+        "part2": {"partItems": []},
+        "part3": {"partItems": [{"index": "3.01", "text": "}]}", "children": []}]},
+    }
+
+
+def feed_in_pieces(text, split_points):
+    parser = IncrementalDocumentParser()
+    events = []
+    start = 0
+    for end in sorted(split_points) + [len(text)]:
+        events.extend(parser.feed(text[start:end]))
+        start = end
+    return parser, events
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_split_points_give_the_same_events(seed):
+    rng = random.Random(seed)
+    documents = reference_documents() + [tricky_document()]
+    document = documents[seed % len(documents)]
+    text = "```json\n" + json.dumps(document, indent=rng.choice([None, 2]), ensure_ascii=rng.random() < 0.5) + "\n```"
+    split_points = rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 200)))
+
+    parser, events = feed_in_pieces(text, split_points)
+
+    assert events == list(iter_document_events(document))
+    assert parser.done
+    assert parser.items_emitted == sum(event[0] == EVENT_ITEM for event in events)
+
+
+def test_every_split_point_of_escapes_and_braces():
+    document = tricky_document()
+    text = json.dumps(document)
+    expected = list(iter_document_events(document))
+
+    for split_point in range(1, len(text)):
+        _, events = feed_in_pieces(text, [split_point])
+        assert events == expected, f"split at {split_point}: {text[split_point - 10:split_point + 10]!r}"
+
+
+def test_one_character_at_a_time():
+    document = tricky_document()
+    text = json.dumps(document)
+
+    _, events = feed_in_pieces(text, range(1, len(text)))
+
+    assert events == list(iter_document_events(document))
+
+
+def test_text_after_the_document_is_ignored():
+    parser = IncrementalDocumentParser()
+
+    events = list(parser.feed('{"section": "1", "name": "A", "part1": {"partItems": []}} {"section": "2"}'))
+    events += list(parser.feed('{"section": "3"}'))
+
+    assert events == [("section", "1"), ("name", "A")]
+    assert parser.done
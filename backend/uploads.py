@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import io
+import os
+import re
+import tempfile
+from typing import AsyncIterator, Iterator, Optional
+
+from pypdf import PdfReader
+
+# Read/encode granularity; a multiple of 3 so each piece base64-encodes without padding
+CHUNK_SIZE = 3 * 256 * 1024
+
+# Page objects, counted while spooling to estimate input tokens without parsing the PDF
+_PAGE_RE = re.compile(rb"/Type\s*/Page(?!s)")
+_PAGE_SCAN_CARRY = 32
+# Page size assumed when page objects are in compressed object streams and pypdf cannot read the file either
+FALLBACK_BYTES_PER_PAGE = 20 * 1024
+
+
+def count_pages(source, size: int) -> int:
+    """
+    Page count from the PDF's page tree, for files whose page objects the scan cannot see
+
+    source is a path or a seekable binary file. Blocking, so call via asyncio.to_thread.
+    """
+    try:
+        if isinstance(source, str):
+            # pypdf reads a path into memory, but seeks through a file object
+            with open(source, "rb") as f:
+                return len(PdfReader(f).pages)
+        return len(PdfReader(source).pages)
+    except Exception:
+        return max(1, size // FALLBACK_BYTES_PER_PAGE)
+
+
+def estimate_pages(content: bytes) -> int:
+    """Page objects in a PDF's bytes, or its page count when they are compressed"""
+    return len(_PAGE_RE.findall(content)) or count_pages(io.BytesIO(content), len(content))
+
+
+class PdfFile:
+    """
+    A PDF spooled to disk, with its SHA-256 and an estimated page count
+
+    Request handlers pass this around instead of the file's bytes, so a request holds at
+    most a few CHUNK_SIZE buffers in memory regardless of the PDF's size.
+    """
+
+    def __init__(self, path: str, size: int, sha256: str, page_estimate: int, filename: str = "", owned: bool = True):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.page_estimate = page_estimate
+        self.filename = filename
+        self.owned = owned
+
+    @classmethod
+    async def from_upload(cls, upload, directory: Optional[str] = None, prefix: str = "upload-") -> "PdfFile":
+        """Copy a FastAPI UploadFile (or any object with async read(n)) to a temporary file in CHUNK_SIZE pieces"""
+        fd, path = tempfile.mkstemp(suffix=".pdf", prefix=prefix, dir=directory)
+        scanner = _Scanner()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = await upload.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    await asyncio.to_thread(_write_and_scan, f, scanner, chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        pages = scanner.pages or await asyncio.to_thread(count_pages, path, scanner.size)
+        return cls(path, scanner.size, scanner.sha256.hexdigest(), pages, getattr(upload, "filename", "") or "")
+
+    @classmethod
+    def from_path(cls, path: str, filename: str = "", owned: bool = False) -> "PdfFile":
+        """Hash and scan an existing file; blocking, so call via asyncio.to_thread"""
+        scanner = _Scanner()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                scanner.update(chunk)
+        pages = scanner.pages or count_pages(path, scanner.size)
+        return cls(path, scanner.size, scanner.sha256.hexdigest(), pages, filename or os.path.basename(path), owned)
+
+    def iter_chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def aiter_chunks(self, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self.path, "rb")
+        try:
+            while True:
+                chunk = await asyncio.to_thread(f.read, chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            f.close()
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def cleanup(self):
+        """Delete the file if this object created it"""
+        if self.owned:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def _write_and_scan(f, scanner, chunk: bytes):
+    f.write(chunk)
+    scanner.update(chunk)
+
+
+class _Scanner:
+    """Incremental SHA-256, size and page-object count over a byte stream"""
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.pages = 0
+        self._carry = b""
+
+    def update(self, chunk: bytes):
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        window = self._carry + chunk
+        # Matches inside the carried tail were already counted with the previous chunk
+        self.pages += len(_PAGE_RE.findall(window)) - len(_PAGE_RE.findall(self._carry))
+        self._carry = window[-_PAGE_SCAN_CARRY:]
@@ -43,7 +43,11 @@ export default function Home() {
 
     try {
       const response = await uploadPDF(file, selectedModel);
-      setOutput(response.data);
+      setOutput(
+        typeof response.data === "string"
+          ? response.data
+          : JSON.stringify(response.data, null, 2)
+      );
     } catch (err) {
       console.error("Upload error:", err);
       const errorMessage =
@@ -11,7 +11,8 @@ export interface ModelsResponse {
 }
 
 export interface UploadResponse {
-  data: string;
+  // Parsed document as a JSON object, or the model's raw text if it was not valid JSON
+  data: unknown;
 }
 
 export interface ApiErrorResponse {